@@ -0,0 +1,73 @@
+# backend/benchmarks/bench_analytics.py
+"""Vectorized analytics engine vs the per-play Python loop.
+
+Generates a year of synthetic plays and times summarize_listening (four
+windows, heatmap, timezone bucketing) against the old datetime.fromisoformat
+loop computing only the 7-day UTC histogram.
+
+    python -m benchmarks.bench_analytics [plays] [tz]
+"""
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pytz
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+os.environ.setdefault("GOOGLE_CLOUD_PROJECT", "benchmark")
+os.environ.setdefault("FIRESTORE_EMULATOR_HOST", "localhost:8080")
+
+from benchmarks.stub_spotify import iso_ms
+from functions.analytics.engine import DAY_MS, parse_played_at, summarize_listening
+
+LOOP_SAMPLE = 100_000
+
+
+def legacy_histogram(items, now):
+    """The per-play loop process_listening_history used to run"""
+    counts = [0] * 7
+    total_ms = 0
+    for item in items:
+        played_at = datetime.fromisoformat(item['played_at'].replace('Z', '+00:00'))
+        total_ms += item['track']['duration_ms']
+        days_ago = (now - played_at).days
+        if 0 <= days_ago < 7:
+            counts[days_ago] += 1
+    return counts, total_ms
+
+
+def main(plays=1_000_000, tz="America/New_York"):
+    rng = np.random.default_rng(7)
+    now_ms = int(time.time() * 1000)
+    played = np.sort(now_ms - rng.integers(0, 365 * DAY_MS, plays))
+    durations = rng.integers(90_000, 360_000, plays)
+
+    started = time.perf_counter()
+    summary = summarize_listening(played, durations, tz=tz, now_ms=now_ms)
+    engine_s = time.perf_counter() - started
+    print(f"engine: {plays:,} plays, windows 7/30/90/365 + heatmap in {tz}: {engine_s * 1000:.0f} ms")
+    print(f"        {summary['plays']:,} plays bucketed, "
+          f"{summary['windows'][365]['total_hours']:,} hours in the last year")
+
+    sample = min(plays, LOOP_SAMPLE)
+    items = [
+        {'played_at': iso_ms(int(ms)), 'track': {'duration_ms': int(d)}}
+        for ms, d in zip(played[-sample:], durations[-sample:])
+    ]
+    started = time.perf_counter()
+    parse_played_at([item['played_at'] for item in items])
+    parse_s = time.perf_counter() - started
+    started = time.perf_counter()
+    legacy_histogram(items, datetime.now(pytz.UTC))
+    loop_s = time.perf_counter() - started
+    print(f"parse:  {sample:,} played_at strings in bulk: {parse_s * 1000:.0f} ms")
+    print(f"loop:   {sample:,} plays, 7-day UTC only: {loop_s * 1000:.0f} ms "
+          f"(~{loop_s * plays / sample * 1000:.0f} ms projected for {plays:,})")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 1_000_000, args[1] if len(args) > 1 else "America/New_York")
@@ -0,0 +1,97 @@
+# backend/benchmarks/bench_async_recommender.py
+"""Throughput of the threaded vs asyncio recommendation paths.
+
+Simulates many users hitting get_recommendations at once against a local
+Spotify stub with fixed per-call latency, and reports completed recommendation
+flows per second plus the peak number of threads each path added while it ran,
+its request threads included. Threads alive before a path starts (the stub
+server, or pools the other path left idle) are not counted.
+
+    python -m benchmarks.bench_async_recommender [concurrent_users] [flows]
+"""
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+# Clients are created lazily; any the benchmark builds point at the emulator
+os.environ.setdefault("GOOGLE_CLOUD_PROJECT", "benchmark")
+os.environ.setdefault("FIRESTORE_EMULATOR_HOST", "localhost:8080")
+
+from benchmarks.stub_spotify import StubSpotifyServer
+from functions.spotify.client import SpotifyClient
+from functions.spotify.async_client import AsyncSpotifyClient, run_async
+from main import collect_strategy_tracks, collect_strategy_tracks_async
+from tests.recommenders import make_async_recommender, make_recommender
+
+HEADERS = {"Authorization": "Bearer stub"}
+
+
+def client_thread_count():
+    """Live threads excluding the stub server's per-connection handlers"""
+    return sum(
+        1 for thread in threading.enumerate()
+        if "process_request_thread" not in thread.name
+    )
+
+
+def drive(handle_request, concurrent_users, flows):
+    """Run `flows` requests from `concurrent_users` request threads.
+
+    Returns (flows per second, peak threads above those alive beforehand).
+    """
+    baseline = client_thread_count()
+    peak_threads = baseline
+    done = threading.Event()
+
+    def sample_threads():
+        nonlocal peak_threads
+        while not done.is_set():
+            peak_threads = max(peak_threads, client_thread_count())
+            time.sleep(0.005)
+
+    sampler = threading.Thread(target=sample_threads, daemon=True)
+    sampler.start()
+    baseline += 1
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrent_users) as requests_pool:
+        list(requests_pool.map(lambda _: handle_request(), range(flows)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    sampler.join()
+    return flows / elapsed, peak_threads - baseline
+
+
+def main(concurrent_users=32, flows=128, latency=0.02):
+    with StubSpotifyServer(latency=latency) as server:
+        base_url = f"{server.base_url}/v1"
+
+        sync_client = SpotifyClient(api_base_url=base_url, pool_size=64)
+        sync_rate, sync_threads = drive(
+            lambda: collect_strategy_tracks(
+                make_recommender(HEADERS, sync_client)
+            ),
+            concurrent_users, flows,
+        )
+        sync_client.close()
+
+        async_client = AsyncSpotifyClient(api_base_url=base_url, pool_size=64)
+        async_rate, async_threads = drive(
+            lambda: run_async(collect_strategy_tracks_async(
+                make_async_recommender(HEADERS, async_client)
+            )),
+            concurrent_users, flows,
+        )
+        run_async(async_client.close())
+
+    print(f"{concurrent_users} concurrent users, {flows} flows, {latency * 1000:.0f}ms upstream latency")
+    print(f"{'path':<10}{'flows/s':>10}{'threads added':>15}")
+    print(f"{'threaded':<10}{sync_rate:>10.1f}{sync_threads:>15}")
+    print(f"{'asyncio':<10}{async_rate:>10.1f}{async_threads:>15}")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,54 @@
+# backend/benchmarks/bench_co_listening.py
+"""Co-listening graph build over synthetic listening histories.
+
+Feeds a CoListeningBuilder one play sequence per user (what
+build_co_listening_graph does after reading each user's day shards) and
+times pair counting and neighbour extraction separately.
+
+    python -m benchmarks.bench_co_listening [users] [plays_per_user] [tracks]
+"""
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+os.environ.setdefault("GOOGLE_CLOUD_PROJECT", "benchmark")
+os.environ.setdefault("FIRESTORE_EMULATOR_HOST", "localhost:8080")
+
+from functions.recommendations.co_listening import CoListeningBuilder
+
+
+def main(users=5_000, plays_per_user=400, tracks=200_000):
+    rng = np.random.default_rng(0)
+    track_ids = [f"{i:022d}" for i in range(tracks)]
+    # Skewed popularity, plays roughly four minutes apart with occasional breaks
+    popularity = 1 / np.arange(1, tracks + 1) ** 0.8
+    popularity /= popularity.sum()
+    histories = []
+    for _ in range(users):
+        codes = rng.choice(tracks, plays_per_user, p=popularity)
+        gaps = np.where(rng.random(plays_per_user) < 0.05, 4 * 60 * 60 * 1000, 240_000)
+        histories.append(([track_ids[code] for code in codes], np.cumsum(gaps).tolist()))
+
+    builder = CoListeningBuilder()
+    started = time.perf_counter()
+    for item_ids, played_ms in histories:
+        builder.add_sequence(item_ids, played_ms)
+    pairs = builder.pairs
+    counted = time.perf_counter() - started
+
+    started = time.perf_counter()
+    items = sum(1 for _ in builder.neighbours())
+    extracted = time.perf_counter() - started
+
+    print(f"{users:,} users x {plays_per_user} plays = {builder.plays:,} plays over {tracks:,} tracks")
+    print(f"  count:      {pairs:,} distinct pairs in {counted:.2f} s")
+    print(f"  neighbours: {items:,} items in {extracted:.2f} s")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*args)
@@ -0,0 +1,120 @@
+# backend/benchmarks/bench_cold_start.py
+"""Cold-start cost of each deployed entry point.
+
+Every entry point runs in a fresh interpreter, as on a new Cloud Function
+instance: the benchmark times ``import main``, then the first and second
+request to that entry point, and lists which heavy dependencies were loaded
+by the import and by the first request. Spotify is a local stub and
+Firestore an in-memory fake installed in the client registry, so first
+requests leave out real credential lookup and gRPC channel setup.
+
+    python -m benchmarks.bench_cold_start [runs]
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from benchmarks.stub_spotify import StubSpotifyServer
+
+HEAVY_MODULES = ("google.cloud.firestore", "numpy", "aiohttp")
+# (entry point, method, query string, JSON body)
+ENTRY_POINTS = (
+    ("refresh_token", "POST", "", {'user_id': "u1"}),
+    ("get_listening_history", "GET", "user_id=u1", None),
+    ("get_listening_analytics", "GET", "user_id=u1", None),
+    ("get_listening_stats", "GET", "user_id=u1", None),
+    ("get_recommendations", "GET", "user_id=u1&refresh=true", None),
+    ("refresh_expiring_tokens_background", "GET", "", None),
+)
+
+
+def loaded():
+    return [name for name in HEAVY_MODULES if name in sys.modules]
+
+
+def run_entry_point(name, method, query, body):
+    """Child process: import main and call one entry point twice"""
+    started = time.perf_counter()
+    import main
+    imported = time.perf_counter() - started
+    import_modules = loaded()
+
+    from flask import Flask, request
+    from functions.clients import set_firestore
+    from tests.firestore_fake import FakeFirestore
+
+    db = FakeFirestore()
+    db.docs["users/u1"] = {
+        'access_token': "stub-token",
+        'refresh_token': "stub-refresh",
+        'token_expiry': datetime.now(timezone.utc) + timedelta(minutes=12),
+    }
+    set_firestore(db)
+    app = Flask(__name__)
+
+    timings = []
+    for _ in range(2):
+        with app.test_request_context(f"/?{query}", method=method, json=body):
+            started = time.perf_counter()
+            response = getattr(main, name)(request)
+            timings.append(time.perf_counter() - started)
+    status = response[1] if isinstance(response, tuple) else response.status_code
+    return {
+        'import_ms': imported * 1000,
+        'first_ms': timings[0] * 1000,
+        'second_ms': timings[1] * 1000,
+        'status': status,
+        'import_modules': import_modules,
+        'request_modules': [name for name in loaded() if name not in import_modules],
+    }
+
+
+def measure(server, name, method, query, body):
+    env = {
+        **os.environ,
+        "GOOGLE_CLOUD_PROJECT": "benchmark",
+        "FIRESTORE_EMULATOR_HOST": "localhost:8080",
+        "SPOTIFY_API_BASE_URL": f"{server.base_url}/v1",
+        "SPOTIFY_ACCOUNTS_BASE_URL": server.base_url,
+        "SPOTIFY_CLIENT_ID": "benchmark",
+        "SPOTIFY_CLIENT_SECRET": "benchmark",
+    }
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_cold_start", "--child", name],
+        cwd=Path(__file__).parent.parent, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(runs=3):
+    print(f"{'entry point':<36} {'import':>8} {'first':>8} {'second':>8}  loaded at import / first request")
+    with StubSpotifyServer() as server:
+        for name, method, query, body in ENTRY_POINTS:
+            results = [measure(server, name, method, query, body) for _ in range(runs)]
+            median = {
+                key: sorted(result[key] for result in results)[runs // 2]
+                for key in ('import_ms', 'first_ms', 'second_ms')
+            }
+            last = results[-1]
+            print(
+                f"{name:<36} {median['import_ms']:>6.0f}ms {median['first_ms']:>6.0f}ms "
+                f"{median['second_ms']:>6.0f}ms  {', '.join(last['import_modules']) or '-'} / "
+                f"{', '.join(last['request_modules']) or '-'}"
+                + (f"  (HTTP {last['status']})" if last['status'] != 200 else "")
+            )
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--child"]:
+        entry = next(entry for entry in ENTRY_POINTS if entry[0] == sys.argv[2])
+        # The entry points print progress; keep the result on the last line
+        print(json.dumps(run_entry_point(*entry)))
+    else:
+        args = [int(arg) for arg in sys.argv[1:]]
+        main(*args)
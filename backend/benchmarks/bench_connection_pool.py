@@ -0,0 +1,67 @@
+# backend/benchmarks/bench_connection_pool.py
+"""Count TCP connections opened per get_recommendations-style request.
+
+Compares one-shot ``requests.get`` calls (the old behaviour) against the shared
+pooled SpotifyClient, both pointed at a local stub of the Spotify API.
+
+    python -m benchmarks.bench_connection_pool
+"""
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+# Clients are created lazily; any the benchmark builds point at the emulator
+os.environ.setdefault("GOOGLE_CLOUD_PROJECT", "benchmark")
+os.environ.setdefault("FIRESTORE_EMULATOR_HOST", "localhost:8080")
+
+import requests
+
+from benchmarks.stub_spotify import StubSpotifyServer
+from functions.spotify.client import SpotifyClient
+from main import collect_strategy_tracks
+from tests.recommenders import make_recommender
+
+
+class UnpooledSpotifyClient(SpotifyClient):
+    """Reproduces the previous bare requests.get/post behaviour"""
+
+    def _request(self, method, url, priority=None, **kwargs):
+        # One-shot call outside the session; priority only matters to a scheduler
+        kwargs.setdefault("timeout", self.timeout)
+        return requests.request(method, url, **kwargs)
+
+
+def run_recommendation_flow(client):
+    recommender = make_recommender({"Authorization": "Bearer stub"}, client)
+    collect_strategy_tracks(recommender)
+
+
+def measure(server, client, iterations):
+    server.reset_counters()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        run_recommendation_flow(client)
+    elapsed = time.perf_counter() - start
+    return {
+        'requests': server.requests / iterations,
+        'connections': server.connections / iterations,
+        'ms_per_flow': elapsed * 1000 / iterations,
+    }
+
+
+def main(iterations=20):
+    with StubSpotifyServer() as server:
+        before = measure(server, UnpooledSpotifyClient(api_base_url=f"{server.base_url}/v1"), iterations)
+        pooled = SpotifyClient(api_base_url=f"{server.base_url}/v1")
+        after = measure(server, pooled, iterations)
+        pooled.close()
+
+    print(f"{'client':<10}{'calls/flow':>12}{'conns/flow':>12}{'ms/flow':>10}")
+    for name, result in (("unpooled", before), ("pooled", after)):
+        print(f"{name:<10}{result['requests']:>12.1f}{result['connections']:>12.2f}{result['ms_per_flow']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# backend/benchmarks/bench_event_store.py
+"""Storage footprint of raw listening batches vs compact day shards.
+
+Builds a synthetic listening history from realistic recently-played items and
+compares the old layout (full Spotify JSON appended to ``raw_tracks``) with the
+day-sharded compact events plus the once-per-track metadata dictionary.
+Reports JSON bytes and estimated Firestore storage bytes for each.
+
+    python -m benchmarks.bench_event_store [plays_per_day] [days] [distinct_tracks]
+"""
+import json
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+os.environ.setdefault("GOOGLE_CLOUD_PROJECT", "benchmark")
+os.environ.setdefault("FIRESTORE_EMULATOR_HOST", "localhost:8080")
+
+from benchmarks.stub_spotify import fake_track, iso_ms
+from functions.analytics.event_store import encode_track_meta, group_by_day
+
+MARKETS = [f"{chr(65 + i // 26)}{chr(65 + i % 26)}" for i in range(180)]
+DAY_MS = 24 * 60 * 60 * 1000
+START_MS = 1767225600000  # 2026-01-01T00:00:00Z
+
+
+def realistic_track(track_id):
+    """A track shaped like a real Web API payload, markets and all"""
+    track = fake_track(track_id)
+    track['album'].update({
+        'id': f"album{track_id}",
+        'album_type': 'album',
+        'available_markets': MARKETS,
+        'images': [
+            {'url': f"https://i.scdn.co/image/{track_id}{size}", 'height': size, 'width': size}
+            for size in (640, 300, 64)
+        ],
+        'release_date_precision': 'day',
+        'total_tracks': 12,
+        'type': 'album',
+        'uri': f"spotify:album:album{track_id}",
+        'artists': track['artists'],
+    })
+    track.update({
+        'available_markets': MARKETS,
+        'disc_number': 1,
+        'track_number': 3,
+        'explicit': False,
+        'external_ids': {'isrc': f"USRC1{track_id[-7:]:0>7}"},
+        'href': f"https://api.spotify.com/v1/tracks/{track_id}",
+        'is_local': False,
+        'type': 'track',
+        'uri': f"spotify:track:{track_id}",
+    })
+    return track
+
+
+def firestore_size(value):
+    """Firestore's documented storage size for a field value"""
+    if value is None or isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float)):
+        return 8
+    if isinstance(value, str):
+        return len(value.encode('utf-8')) + 1
+    if isinstance(value, list):
+        return sum(firestore_size(v) for v in value)
+    return sum(firestore_size(k) + firestore_size(v) for k, v in value.items())
+
+
+def document_size(path, data):
+    """Stored size of a document: name, fields and fixed overhead"""
+    return sum(len(part) + 1 for part in path.split('/')) + 16 + firestore_size(data) + 32
+
+
+def build_history(plays_per_day, days, distinct_tracks):
+    tracks = [realistic_track(f"track{i:07d}") for i in range(distinct_tracks)]
+    spacing = DAY_MS // plays_per_day
+    return [
+        {
+            'played_at': iso_ms(START_MS + day * DAY_MS + n * spacing),
+            'track': tracks[(day * plays_per_day + n * 7) % distinct_tracks],
+            'context': None,
+        }
+        for day in range(days) for n in range(plays_per_day)
+    ]
+
+
+def raw_layout(items, batch_size=50):
+    """Old collector layout: one raw_tracks doc per 50-play batch"""
+    docs = {}
+    for start in range(0, len(items), batch_size):
+        batch = items[start:start + batch_size]
+        docs[f"users/u/raw_tracks/{start}"] = {
+            'tracks': batch, 'count': len(batch), 'timestamp': START_MS,
+        }
+    return docs
+
+
+def compact_layout(items):
+    docs = {
+        f"users/u/plays/{day}": {'plays': plays}
+        for day, plays in group_by_day(items).items()
+    }
+    for item in items:
+        docs[f"tracks/{item['track']['id']}"] = encode_track_meta(item['track'])
+    return docs
+
+
+def measure(docs):
+    json_bytes = sum(len(json.dumps(doc, separators=(',', ':'))) for doc in docs.values())
+    stored = sum(document_size(path, doc) for path, doc in docs.items())
+    largest = max(document_size(path, doc) for path, doc in docs.items())
+    return json_bytes, stored, largest
+
+
+def main(plays_per_day=60, days=30, distinct_tracks=400):
+    items = build_history(plays_per_day, days, distinct_tracks)
+    print(f"{len(items)} plays over {days} days, {distinct_tracks} distinct tracks")
+    print(f"{'layout':>8} {'docs':>6} {'json KB':>9} {'stored KB':>10} {'largest KB':>11} {'B/play':>7}")
+    results = {}
+    for name, layout in (("raw", raw_layout), ("compact", compact_layout)):
+        docs = layout(items)
+        json_bytes, stored, largest = measure(docs)
+        results[name] = stored
+        print(f"{name:>8} {len(docs):>6} {json_bytes / 1024:>9.1f} {stored / 1024:>10.1f} "
+              f"{largest / 1024:>11.1f} {stored / len(items):>7.0f}")
+    print(f"compact layout is {results['raw'] / results['compact']:.1f}x smaller")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:4]))
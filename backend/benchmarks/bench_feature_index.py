@@ -0,0 +1,60 @@
+# backend/benchmarks/bench_feature_index.py
+"""Audio-feature nearest-neighbour queries on a synthetic catalog.
+
+Builds an AudioFeatureIndex over random feature vectors, then times k-NN
+queries for two seed tracks (what one recommendation request asks for),
+plus the cost of loading the index from its stored uint8 parts.
+
+    python -m benchmarks.bench_feature_index [tracks] [k]
+"""
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+os.environ.setdefault("GOOGLE_CLOUD_PROJECT", "benchmark")
+os.environ.setdefault("FIRESTORE_EMULATOR_HOST", "localhost:8080")
+
+from functions.recommendations.feature_index import (
+    FEATURE_DIMENSIONS,
+    AudioFeatureIndex,
+    pack_parts,
+    unpack_parts,
+)
+
+
+def main(tracks=1_000_000, k=18, queries=50):
+    rng = np.random.default_rng(0)
+    matrix = rng.random((tracks, FEATURE_DIMENSIONS), dtype=np.float32)
+    track_ids = [f"{i:022d}" for i in range(tracks)]
+
+    started = time.perf_counter()
+    parts = pack_parts(track_ids, matrix)
+    packed = time.perf_counter() - started
+    stored = sum(len(part['ids']) + len(part['vectors']) for part in parts)
+
+    started = time.perf_counter()
+    index = AudioFeatureIndex(*unpack_parts(parts))
+    loaded = time.perf_counter() - started
+
+    seeds = [[track_ids[i] for i in rng.integers(0, tracks, 2)] for _ in range(queries)]
+    timings = []
+    for seed in seeds:
+        started = time.perf_counter()
+        index.nearest(seed, k)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+
+    print(f"{tracks:,} tracks x {FEATURE_DIMENSIONS} features, k={k}, 2 seeds per query")
+    print(f"  stored:  {len(parts)} parts, {stored / 1e6:.1f} MB (packed in {packed * 1000:.0f} ms)")
+    print(f"  load:    {loaded * 1000:.0f} ms, {index.columns.nbytes / 1e6:.1f} MB in memory")
+    print(f"  query:   p50 {timings[len(timings) // 2] * 1000:.1f} ms, "
+          f"p95 {timings[int(len(timings) * 0.95)] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*args)
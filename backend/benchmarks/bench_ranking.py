@@ -0,0 +1,65 @@
+# backend/benchmarks/bench_ranking.py
+"""Heap-based ranking vs the sort-and-rescan balance_recommendations.
+
+Times picking 20 popularity-balanced tracks from candidate sets of growing
+size with rank_recommendations and with the previous implementation (full
+sort, three stratum scans and an O(n*k) membership top-up).
+
+    python -m benchmarks.bench_ranking [sizes...]
+"""
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+os.environ.setdefault("GOOGLE_CLOUD_PROJECT", "benchmark")
+os.environ.setdefault("FIRESTORE_EMULATOR_HOST", "localhost:8080")
+
+from functions.recommendations.ranking import rank_recommendations
+from functions.recommendations.track_record import TrackRecord
+
+
+def legacy_balance(tracks, target_size=20):
+    """The live balance_recommendations before the ranking engine"""
+    tracks.sort(key=lambda x: (x.popularity, x.release_date), reverse=True)
+    high_pop = [t for t in tracks if t.popularity >= 70][:4]
+    med_pop = [t for t in tracks if 40 <= t.popularity < 70][:4]
+    low_pop = [t for t in tracks if t.popularity < 40][:2]
+    balanced = high_pop + med_pop + low_pop
+    while len(balanced) < target_size and tracks:
+        remaining = [t for t in tracks if t not in balanced]
+        if not remaining:
+            break
+        balanced.append(remaining[0])
+    random.shuffle(balanced)
+    return balanced[:target_size]
+
+
+def best_of(fn, repeats=5):
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main(sizes=(1_000, 10_000, 100_000)):
+    rng = random.Random(1)
+    print(f"{'candidates':>10} {'legacy ms':>10} {'heap ms':>8} {'speedup':>8}")
+    for size in sizes:
+        tracks = [
+            TrackRecord(f"t{i}", f"Track {i}", popularity=rng.randint(0, 100),
+                        release_date=f"{rng.randint(1990, 2026)}-{rng.randint(1, 12):02d}-01")
+            for i in range(size)
+        ]
+        # The legacy version sorts in place, so it gets a fresh copy each run
+        legacy_s = best_of(lambda: legacy_balance(list(tracks)))
+        heap_s = best_of(lambda: rank_recommendations(tracks, seed=7))
+        print(f"{size:>10,} {legacy_s * 1000:>10.1f} {heap_s * 1000:>8.1f} {legacy_s / heap_s:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main(tuple(int(arg) for arg in sys.argv[1:]) or (1_000, 10_000, 100_000))
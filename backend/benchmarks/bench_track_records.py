@@ -0,0 +1,111 @@
+# backend/benchmarks/bench_track_records.py
+"""Memory and CPU of per-track dicts vs slotted TrackRecords.
+
+Parses 100k Spotify track objects into candidates both ways, then runs the
+pipeline's walks over them (dedupe, popularity sort and buckets, metrics
+aggregates) and serializes the survivors to JSON. Reports retained memory of
+the candidate list (tracemalloc) and wall time per stage.
+
+    python -m benchmarks.bench_track_records [candidates]
+"""
+import json
+import os
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+os.environ.setdefault("GOOGLE_CLOUD_PROJECT", "benchmark")
+os.environ.setdefault("FIRESTORE_EMULATOR_HOST", "localhost:8080")
+
+from benchmarks.stub_spotify import fake_track
+from main import filter_unique_tracks, process_track_results
+
+
+def legacy_parse(tracks):
+    """The 8-key dict process_track_results used to build"""
+    return [{
+        'id': track['id'],
+        'name': track['name'],
+        'artists': [artist['name'] for artist in track['artists']],
+        'image_url': track['album']['images'][0]['url'] if track['album']['images'] else None,
+        'preview_url': track['preview_url'],
+        'external_url': track['external_urls']['spotify'],
+        'popularity': track['popularity'],
+        'release_date': track['album']['release_date']
+    } for track in tracks]
+
+
+def legacy_walks(candidates):
+    seen, unique = set(), []
+    for track in candidates:
+        if track['id'] not in seen:
+            unique.append(track)
+            seen.add(track['id'])
+    unique.sort(key=lambda x: (x['popularity'], x['release_date']), reverse=True)
+    buckets = (
+        [t for t in unique if t['popularity'] >= 70],
+        [t for t in unique if 40 <= t['popularity'] < 70],
+        [t for t in unique if t['popularity'] < 40],
+    )
+    metrics = (
+        len([t for t in unique if t['preview_url']]),
+        len(set(artist for t in unique for artist in t['artists'])),
+        sum(t['popularity'] for t in unique) / len(unique),
+        max(t['release_date'] for t in unique),
+        min(t['release_date'] for t in unique),
+    )
+    return unique, buckets, metrics
+
+
+def record_walks(candidates):
+    unique = filter_unique_tracks(candidates, set())
+    unique.sort(key=lambda x: (x.popularity, x.release_date), reverse=True)
+    buckets = ([], [], [])
+    with_preview = total = 0
+    artists = set()
+    for t in unique:
+        buckets[0 if t.popularity >= 70 else 1 if t.popularity >= 40 else 2].append(t)
+        with_preview += 1 if t.preview_url else 0
+        total += t.popularity
+        artists.update(t.artists)
+    dates = [t.release_date for t in unique]
+    return unique, buckets, (with_preview, len(artists), total / len(unique), max(dates), min(dates))
+
+
+def run(label, parse, walks, serialize, tracks):
+    # Memory and time are measured on separate parses: tracemalloc slows allocation
+    tracemalloc.start()
+    candidates = parse(tracks)
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del candidates
+
+    started = time.perf_counter()
+    candidates = parse(tracks)
+    parse_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    unique, _, _ = walks(candidates)
+    walks_s = time.perf_counter() - started
+    started = time.perf_counter()
+    payload = json.dumps({"tracks": serialize(unique)})
+    json_s = time.perf_counter() - started
+
+    print(f"{label:>8} {retained / 2**20:>9.1f} {retained / len(candidates):>7.0f} "
+          f"{parse_s * 1000:>8.0f} {walks_s * 1000:>8.0f} {json_s * 1000:>8.0f} {len(payload) / 2**20:>8.1f}")
+
+
+def main(count=100_000):
+    # Strategies overlap, so a tenth of the candidates are duplicates
+    tracks = [fake_track(f"track{i % (count - count // 10):07d}") for i in range(count)]
+    print(f"{count:,} candidates")
+    print(f"{'':>8} {'MiB':>9} {'B/track':>7} {'parse ms':>8} {'walks ms':>8} {'json ms':>8} {'JSON MiB':>8}")
+    run("dicts", legacy_parse, legacy_walks, lambda unique: unique, tracks)
+    run("records", process_track_results, record_walks,
+        lambda unique: [track.to_dict() for track in unique], tracks)
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:2]))
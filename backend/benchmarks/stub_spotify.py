@@ -0,0 +1,201 @@
+# backend/benchmarks/stub_spotify.py
+"""Local stand-in for the Spotify Web API used by the benchmarks.
+
+Serves deterministic synthetic payloads for the endpoints the backend calls,
+with optional per-request latency, and counts how many TCP connections clients
+open against it.
+"""
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+def fake_artist(artist_id, popularity=None):
+    n = sum(ord(c) for c in artist_id)
+    return {
+        'id': artist_id,
+        'name': f"Artist {artist_id}",
+        'genres': [f"genre-{n % 7}", f"genre-{(n // 7) % 7}"],
+        'popularity': popularity if popularity is not None else 20 + n % 60,
+    }
+
+
+def fake_track(track_id, artist_id=None):
+    n = sum(ord(c) for c in track_id)
+    artist_id = artist_id or f"a{n % 97}"
+    return {
+        'id': track_id,
+        'name': f"Track {track_id}",
+        'artists': [{'id': artist_id, 'name': f"Artist {artist_id}"}],
+        'album': {
+            'name': f"Album {n % 13}",
+            'images': [{'url': f"https://i.scdn.co/image/{track_id}"}],
+            'release_date': f"{2015 + n % 11}-01-01",
+        },
+        'preview_url': f"https://p.scdn.co/mp3-preview/{track_id}" if n % 3 else None,
+        'external_urls': {'spotify': f"https://open.spotify.com/track/{track_id}"},
+        'popularity': n % 100,
+        'duration_ms': 150000 + (n % 120) * 1000,
+    }
+
+
+def fake_audio_features(track_id):
+    n = sum(ord(c) * (i + 1) for i, c in enumerate(track_id))
+    return {
+        'id': track_id,
+        'danceability': (n % 101) / 100,
+        'energy': (n // 7 % 101) / 100,
+        'valence': (n // 49 % 101) / 100,
+        'acousticness': (n // 3 % 101) / 100,
+        'instrumentalness': (n // 11 % 101) / 100,
+        'speechiness': (n // 13 % 101) / 100,
+        'liveness': (n // 17 % 101) / 100,
+        'tempo': 60.0 + n % 140,
+        'loudness': -30.0 + n % 30,
+    }
+
+
+def iso_ms(ms):
+    """Spotify-style played_at string for epoch milliseconds"""
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(ms / 1000)) + f".{ms % 1000:03d}Z"
+
+
+class StubSpotifyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so connection reuse is observable
+
+    def setup(self):
+        super().setup()
+        # Headers and body go out as separate writes; don't let Nagle hold the body back
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        with self.server.lock:
+            self.server.requests += 1
+        self._send(200, {'access_token': 'stub-token', 'expires_in': 3600, 'refresh_token': 'stub-refresh'})
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests += 1
+            rate_limited = self.server.rate_limit_next > 0
+            if rate_limited:
+                self.server.rate_limit_next -= 1
+        if rate_limited:
+            body = b'{"error": {"status": 429}}'
+            self.send_response(429)
+            self.send_header("Retry-After", str(self.server.retry_after))
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        parsed = urlparse(self.path)
+        path = parsed.path
+        if path.startswith("/v1"):
+            path = path[3:]
+        query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        limit = int(query.get('limit', 20))
+
+        if path == "/me":
+            return self._send(200, {'id': 'stub-user', 'display_name': 'Stub User'})
+        if path == "/me/top/artists":
+            return self._send(200, {'items': [fake_artist(f"top{i}") for i in range(limit)]})
+        if path == "/me/top/tracks":
+            return self._send(200, {'items': [fake_track(f"toptrack{i}") for i in range(limit)]})
+        if path == "/me/player/recently-played":
+            after = int(query['after']) if 'after' in query else None
+            with self.server.lock:
+                plays = [p for p in self.server.plays if after is None or p[0] > after]
+            # With a cursor, page forward from it; without one, return the latest
+            page = sorted(plays)[:limit][::-1] if after is not None else sorted(plays, reverse=True)[:limit]
+            items = [{'track': fake_track(track_id), 'played_at': iso_ms(ms)} for ms, track_id in page]
+            cursors = {'after': str(page[0][0]), 'before': str(page[-1][0])} if page else None
+            return self._send(200, {'items': items, 'cursors': cursors})
+        if path == "/search":
+            q = query.get('q', '')
+            if query.get('type') == 'artist':
+                items = [fake_artist(f"{q}-artist{i}") for i in range(limit)]
+                return self._send(200, {'artists': {'items': items}})
+            return self._send(200, {'tracks': {'items': [fake_track(f"{q}-track{i}") for i in range(limit)]}})
+        if path.startswith("/artists/") and path.endswith("/related-artists"):
+            artist_id = path.split("/")[2]
+            return self._send(200, {'artists': [fake_artist(f"{artist_id}-rel{i}") for i in range(20)]})
+        if path.startswith("/artists/") and path.endswith("/top-tracks"):
+            artist_id = path.split("/")[2]
+            return self._send(200, {'tracks': [fake_track(f"{artist_id}-top{i}", artist_id) for i in range(10)]})
+        if path == "/artists":
+            ids = query.get('ids', '').split(',')
+            return self._send(200, {'artists': [fake_artist(i) for i in ids if i]})
+        if path == "/audio-features":
+            ids = query.get('ids', '').split(',')
+            return self._send(200, {'audio_features': [fake_audio_features(i) for i in ids if i]})
+        if path == "/tracks":
+            ids = query.get('ids', '').split(',')
+            return self._send(200, {'tracks': [fake_track(i) for i in ids if i]})
+        self._send(404, {'error': {'status': 404, 'message': 'Not found'}})
+
+
+class StubSpotifyServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency=0.0):
+        super().__init__(("127.0.0.1", 0), StubSpotifyHandler)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        # Answer the next N GETs with 429 and this Retry-After (seconds)
+        self.rate_limit_next = 0
+        self.retry_after = 0
+        # Listening log served by recently-played as (played_at ms, track id)
+        self.plays = []
+        self.add_plays(50)
+        self._thread = None
+
+    def add_plays(self, count, spacing_ms=240000):
+        """Append `count` plays, spaced apart, ending now"""
+        with self.lock:
+            first_ms = int(time.time() * 1000) - (count - 1) * spacing_ms
+            if self.plays:
+                first_ms = max(first_ms, self.plays[-1][0] + spacing_ms)
+            start = len(self.plays)
+            self.plays.extend(
+                (first_ms + i * spacing_ms, f"play{start + i}") for i in range(count)
+            )
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def reset_counters(self):
+        with self.lock:
+            self.connections = 0
+            self.requests = 0
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
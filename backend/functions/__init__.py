@@ -1,3 +1,7 @@
-from .auth.token_manager import *
-from .playlists.playlist_operations import *
-from .analytics.history_operations import *
\ No newline at end of file
+from .lazy import lazy_exports
+
+__getattr__ = lazy_exports(__name__, (
+    'auth.token_manager',
+    'playlists.playlist_operations',
+    'analytics.history_operations',
+))
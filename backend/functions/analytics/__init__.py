@@ -1 +1,8 @@
-from .history_operations import *
\ No newline at end of file
+from ..lazy import lazy_exports
+
+__getattr__ = lazy_exports(__name__, (
+    'history_operations',
+    'collection_operations',
+    'event_store',
+    'engine',
+))
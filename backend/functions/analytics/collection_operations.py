@@ -0,0 +1,245 @@
+# backend/functions/analytics/collection_operations.py
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import logging
+import time
+import pytz
+from google.api_core.exceptions import Conflict, FailedPrecondition
+from ..clients import get_firestore
+from ..spotify.client import get_spotify_client
+from ..spotify.scheduler import BACKGROUND, INTERACTIVE
+from .event_store import remember_tracks, store_plays
+
+
+def _latency_summary(latencies_ms):
+    if not latencies_ms:
+        return {'avg': 0, 'p50': 0, 'p95': 0, 'max': 0}
+    ordered = sorted(latencies_ms)
+    return {
+        'avg': round(sum(ordered) / len(ordered), 1),
+        'p50': round(ordered[len(ordered) // 2], 1),
+        'p95': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1),
+        'max': round(ordered[-1], 1),
+    }
+
+
+# recently-played only exposes a user's last 50 plays; a few pages is plenty
+MAX_CURSOR_PAGES = 4
+# Commit attempts when other ingests keep advancing the user's cursor first
+MAX_COMMIT_ATTEMPTS = 3
+
+
+def played_at_ms(played_at):
+    """Epoch milliseconds for a Spotify played_at timestamp"""
+    return int(datetime.fromisoformat(played_at.replace('Z', '+00:00')).timestamp() * 1000)
+
+
+def play_key(item):
+    """Dedupe key for a recently-played item: (played_at, track id)"""
+    return f"{played_at_ms(item['played_at'])}:{item['track']['id']}"
+
+
+def select_new_plays(items, cursor=None, cursor_keys=()):
+    """Drop plays at or before the cursor that were already ingested.
+
+    Returns (new plays oldest first, new cursor, keys of plays at the new cursor).
+    """
+    seen = set(cursor_keys)
+    new_plays = []
+    for item in items:
+        key = play_key(item)
+        ms = played_at_ms(item['played_at'])
+        if key in seen or (cursor is not None and ms < cursor):
+            continue
+        seen.add(key)
+        new_plays.append(item)
+        
+    new_plays.sort(key=lambda item: item['played_at'])
+    if not new_plays:
+        return [], cursor, list(cursor_keys)
+    newest = played_at_ms(new_plays[-1]['played_at'])
+    if cursor is not None and newest == cursor:
+        newest_keys = list(cursor_keys)
+    else:
+        newest_keys = []
+    newest_keys += [play_key(item) for item in new_plays if played_at_ms(item['played_at']) == newest]
+    return new_plays, newest, newest_keys
+
+
+def fetch_new_plays(user_id, access_token, cursor=None, cursor_keys=(), client=None, priority=BACKGROUND):
+    """Fetch plays newer than the user's cursor.
+
+    Returns (new plays oldest first, new cursor, new cursor keys, latency_ms),
+    with new plays None when the upstream call failed.
+    """
+    client = client or get_spotify_client()
+    started = time.perf_counter()
+    items = []
+    after = cursor
+    for _ in range(MAX_CURSOR_PAGES):
+        params = {"limit": 50}
+        if after is not None:
+            params["after"] = after
+        response = client.get(
+            "/me/player/recently-played",
+            headers={"Authorization": f"Bearer {access_token}"},
+            params=params,
+            priority=priority,
+        )
+        if response.status_code != 200:
+            logging.warning(f"Recently played failed for {user_id}: status {response.status_code}")
+            return None, cursor, list(cursor_keys), (time.perf_counter() - started) * 1000
+            
+        data = response.json()
+        page = data.get("items", [])
+        items.extend(page)
+        next_after = (data.get("cursors") or {}).get("after")
+        # Without a cursor Spotify only has the latest 50 to give
+        if after is None or len(page) < 50 or not next_after or int(next_after) <= after:
+            break
+        after = int(next_after)
+        
+    latency_ms = (time.perf_counter() - started) * 1000
+    new_plays, new_cursor, new_keys = select_new_plays(items, cursor, cursor_keys)
+    return new_plays, new_cursor, new_keys, latency_ms
+
+
+def commit_new_plays(client_db, user_doc, new_plays, collected_at=None):
+    """Store new plays and advance the user's cursor in one conditional batch.
+
+    ``new_plays`` were selected against the cursor in ``user_doc``. The day
+    shards, rollup increments and cursor commit together, and only if the user
+    document is unchanged since it was read: two ingests racing from the same
+    cursor would otherwise both apply the rollup increments. When another
+    write wins, the user document is re-read, the plays re-filtered against
+    its cursor and the commit retried.
+
+    Returns (plays stored, day shards written).
+    """
+    user_ref = user_doc.reference
+    collected_at = collected_at or datetime.now(pytz.UTC)
+    for attempt in range(MAX_COMMIT_ATTEMPTS):
+        if attempt:
+            user_doc = user_ref.get()
+        user_data = (user_doc.to_dict() or {}) if user_doc.exists else {}
+        plays, cursor, cursor_keys = select_new_plays(
+            new_plays, user_data.get('listening_cursor'), user_data.get('listening_cursor_keys', [])
+        )
+        if not plays:
+            return 0, 0
+
+        batch = client_db.batch()
+        day_shards = store_plays(batch, client_db, user_ref.id, plays)
+        fields = {
+            'listening_cursor': cursor,
+            'listening_cursor_keys': cursor_keys,
+            'last_collected': collected_at,
+        }
+        if user_doc.exists:
+            option = client_db.write_option(last_update_time=user_doc.update_time)
+            batch.update(user_ref, fields, option=option)
+        else:
+            batch.create(user_ref, fields)
+        try:
+            batch.commit()
+        except (FailedPrecondition, Conflict):
+            logging.info(f"Cursor for {user_ref.id} moved during ingest, retrying")
+            continue
+        remember_tracks(plays)
+        return len(plays), day_shards
+
+    logging.warning(f"Gave up storing {len(new_plays)} plays for {user_ref.id}; the next run retries")
+    return 0, 0
+
+
+def collect_listening_data(max_workers=16, db_client=None, client=None):
+    """Append every user's new plays since their last sweep to Firestore.
+
+    Each user document carries a ``listening_cursor`` (epoch ms of the newest
+    ingested play) and the dedupe keys of plays at that instant, so a run asks
+    Spotify only for newer plays and stores each play exactly once in the
+    day-sharded event store (see event_store). Users are fetched and committed
+    concurrently on a bounded pool, one conditional batch per user (see
+    commit_new_plays). Returns per-run throughput stats.
+    """
+    client_db = db_client or get_firestore()
+    started = time.perf_counter()
+    stats = {
+        'users': 0, 'collected': 0, 'tracks': 0, 'day_shards': 0,
+        'skipped_no_token': 0, 'failures': 0,
+    }
+    latencies_ms = []
+    
+    users = []
+    for user_doc in client_db.collection('users').stream():
+        stats['users'] += 1
+        user_data = user_doc.to_dict() or {}
+        if user_data.get('access_token'):
+            users.append(user_doc)
+        else:
+            stats['skipped_no_token'] += 1
+            
+    collected_at = datetime.now(pytz.UTC)
+
+    def collect(user_doc):
+        user_data = user_doc.to_dict()
+        latency_ms = None
+        try:
+            tracks, _, _, latency_ms = fetch_new_plays(
+                user_doc.id,
+                user_data['access_token'],
+                user_data.get('listening_cursor'),
+                user_data.get('listening_cursor_keys', []),
+                client,
+            )
+            if tracks is None:
+                return None, latency_ms
+            # Append only the new plays to the day-sharded event store
+            return commit_new_plays(client_db, user_doc, tracks, collected_at), latency_ms
+        except Exception as e:
+            logging.error(f"Error collecting data for {user_doc.id}: {str(e)}")
+            return None, latency_ms
+            
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="collector") as pool:
+        for stored, latency_ms in pool.map(collect, users):
+            if latency_ms is not None:
+                latencies_ms.append(latency_ms)
+            if stored is None:
+                stats['failures'] += 1
+                continue
+            stats['collected'] += 1
+            stats['tracks'] += stored[0]
+            stats['day_shards'] += stored[1]
+    
+    elapsed = time.perf_counter() - started
+    stats['elapsed_seconds'] = round(elapsed, 3)
+    stats['users_per_second'] = round(len(users) / elapsed, 1) if elapsed else 0
+    stats['upstream_latency_ms'] = _latency_summary(latencies_ms)
+    return stats
+
+
+def ingest_recent_plays(user_id, access_token, db_client=None, client=None):
+    """Append plays newer than the user's cursor with one interactive fetch.
+
+    Keeps the event store and its rollup counters current before a dashboard
+    read. A failed fetch leaves the stored history as is. Returns metadata
+    about the delta.
+    """
+    client_db = db_client or get_firestore()
+    user_doc = client_db.collection('users').document(user_id).get()
+    user_data = (user_doc.to_dict() or {}) if user_doc.exists else {}
+    cursor = user_data.get('listening_cursor')
+    cursor_keys = user_data.get('listening_cursor_keys', [])
+
+    new_plays, _, _, latency_ms = fetch_new_plays(
+        user_id, access_token, cursor, cursor_keys, client, priority=INTERACTIVE
+    )
+    stored = 0
+    if new_plays:
+        stored, _ = commit_new_plays(client_db, user_doc, new_plays)
+
+    return {
+        'new_plays': stored,
+        'delta_ok': new_plays is not None,
+        'upstream_latency_ms': round(latency_ms, 1),
+    }
@@ -0,0 +1,142 @@
+# backend/functions/analytics/engine.py
+"""Vectorized listening analytics over epoch-millisecond arrays.
+
+Plays are bucketed by local calendar day in the user's timezone. One pass
+over the arrays yields daily histograms for every requested window (shorter
+windows are suffixes of the longest) and an hour-of-day x day-of-week heatmap.
+"""
+from datetime import datetime
+import time
+import numpy as np
+import pytz
+from .event_store import DURATION_MS, PLAYED_AT_MS
+
+DAY_MS = 24 * 60 * 60 * 1000
+HOUR_MS = 60 * 60 * 1000
+DEFAULT_WINDOWS = (7, 30, 90, 365)
+WEEKDAYS = np.array(['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'])
+
+
+def parse_played_at(values):
+    """Epoch ms for Spotify played_at strings, parsed in bulk"""
+    stamps = np.array([value.rstrip('Z') for value in values], dtype='datetime64[ms]')
+    return stamps.astype(np.int64)
+
+
+def item_arrays(items):
+    """(played_at_ms, duration_ms) arrays from recently-played items"""
+    played = parse_played_at([item['played_at'] for item in items])
+    durations = np.fromiter(
+        (item['track'].get('duration_ms') or 0 for item in items), np.int64, len(items)
+    )
+    return played, durations
+
+
+def event_arrays(events):
+    """(played_at_ms, duration_ms) arrays from compact stored events"""
+    played = np.fromiter((event[PLAYED_AT_MS] for event in events), np.int64, len(events))
+    durations = np.fromiter((event[DURATION_MS] or 0 for event in events), np.int64, len(events))
+    return played, durations
+
+
+def _offset_ms(zone, ms):
+    return int(datetime.fromtimestamp(ms / 1000, zone).utcoffset().total_seconds() * 1000)
+
+
+def utc_offsets(zone, start_ms, end_ms):
+    """Piecewise-constant UTC offsets as (boundaries_ms, offsets_ms) over a range.
+
+    Samples one offset per day and bisects to the second only around days
+    where it changes, so a year costs a few hundred tz lookups regardless of
+    how many plays fall in it.
+    """
+    days = np.arange(start_ms - start_ms % DAY_MS, end_ms + DAY_MS, DAY_MS)
+    sampled = [_offset_ms(zone, int(ms)) for ms in days]
+    boundaries, offsets = [int(days[0])], [sampled[0]]
+    for i in range(1, len(days)):
+        if sampled[i] == sampled[i - 1]:
+            continue
+        low, high = int(days[i - 1]), int(days[i])
+        while high - low > 1000:
+            mid = (low + high) // 2
+            if _offset_ms(zone, mid) == sampled[i - 1]:
+                low = mid
+            else:
+                high = mid
+        boundaries.append(high)
+        offsets.append(sampled[i])
+    return np.array(boundaries, dtype=np.int64), np.array(offsets, dtype=np.int64)
+
+
+def to_local(played_at_ms, zone, boundaries, offsets):
+    """Shift UTC epoch ms to local wall-clock epoch ms"""
+    index = np.searchsorted(boundaries, played_at_ms, side='right') - 1
+    return played_at_ms + offsets[np.clip(index, 0, len(offsets) - 1)]
+
+
+def summarize_listening(played_at_ms, duration_ms, windows=DEFAULT_WINDOWS, tz='UTC', now_ms=None):
+    """Daily histograms per window plus a weekday x hour heatmap.
+
+    Returns ``{'windows': {days: {'history': [...], 'total_hours': h}},
+    'heatmap': 7 rows (Mon first) of 24 hourly counts, 'plays': n}``, where
+    each history entry has the ``date``/``count``/``duration_ms``/``timestamp``
+    shape the dashboard already reads. The heatmap covers the longest window.
+    """
+    zone = pytz.timezone(tz)
+    now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+    span = max(windows)
+    played = np.asarray(played_at_ms, dtype=np.int64)
+    durations = np.asarray(duration_ms, dtype=np.int64)
+
+    start_ms = now_ms - (span + 1) * DAY_MS
+    if len(played):
+        start_ms = min(start_ms, int(played.min()))
+    boundaries, offsets = utc_offsets(zone, start_ms, now_ms)
+    today = int(to_local(np.int64(now_ms), zone, boundaries, offsets)) // DAY_MS
+
+    local = to_local(played, zone, boundaries, offsets)
+    local_day = local // DAY_MS
+    days_ago = today - local_day
+    in_span = (days_ago >= 0) & (days_ago < span)
+    days_ago = days_ago[in_span]
+    counts = np.bincount(days_ago, minlength=span)[::-1]
+    durations_by_day = np.bincount(days_ago, weights=durations[in_span], minlength=span)[::-1]
+
+    # 1970-01-01 was a Thursday, weekday 3 counting from Monday
+    weekday = (local_day[in_span] + 3) % 7
+    hour = (local[in_span] % DAY_MS) // HOUR_MS
+    heatmap = np.bincount(weekday * 24 + hour, minlength=7 * 24).reshape(7, 24)
+
+    # Day labels and UTC timestamps of each local midnight, oldest first;
+    # each midnight takes the offset in force around it (located via today's)
+    day_numbers = np.arange(today - span + 1, today + 1, dtype=np.int64)
+    midnights = day_numbers * DAY_MS
+    utc_midnights = midnights - offsets[np.clip(
+        np.searchsorted(boundaries, midnights - offsets[-1], side='right') - 1, 0, len(offsets) - 1
+    )]
+    iso_dates = day_numbers.astype('datetime64[D]').astype(str)
+    weekday_names = WEEKDAYS[(day_numbers + 3) % 7]
+
+    result = {}
+    for days in windows:
+        first = span - days
+        labels = weekday_names if days <= 7 else iso_dates
+        result[days] = {
+            'history': [{
+                'date': str(labels[i]),
+                'count': int(counts[i]),
+                'duration_ms': int(durations_by_day[i]),
+                'timestamp': float(utc_midnights[i] / 1000)
+            } for i in range(first, span)],
+            'total_hours': round(float(durations_by_day[first:].sum()) / HOUR_MS, 1)
+        }
+    return {
+        'windows': result,
+        'heatmap': heatmap.tolist(),
+        'plays': int(in_span.sum()),
+    }
+
+
+def listening_history(played_at_ms, duration_ms, days=7, tz='UTC', now_ms=None):
+    """The ``{'history', 'total_hours'}`` summary for a single window"""
+    return summarize_listening(played_at_ms, duration_ms, (days,), tz, now_ms)['windows'][days]
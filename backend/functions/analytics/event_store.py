@@ -0,0 +1,160 @@
+# backend/functions/analytics/event_store.py
+"""Compact, day-sharded store for listening events.
+
+Plays live in ``users/{user_id}/plays/{yyyy-mm-dd}`` (UTC days) as a map from
+play key to ``[track_id, played_at_ms, duration_ms, primary_artist_id]``.
+Writing with merge makes appends idempotent: re-ingesting a play rewrites the
+same map entry. Track metadata is stored once per track in ``tracks/{id}``.
+
+Ingestion also maintains ``users/{user_id}/analytics/listening_rollup``: per-day
+play counts and durations plus lifetime totals, bumped with atomic increments
+in the same write so reads never have to scan plays.
+"""
+from datetime import datetime, timedelta, timezone
+import threading
+from google.cloud import firestore
+
+TRACK_ID, PLAYED_AT_MS, DURATION_MS, ARTIST_ID = range(4)
+
+
+def day_id(ms):
+    """UTC day shard id for epoch milliseconds"""
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).strftime('%Y-%m-%d')
+
+
+def iso_from_ms(ms):
+    """Spotify-style played_at string for epoch milliseconds"""
+    when = datetime.fromtimestamp(ms / 1000, tz=timezone.utc)
+    return when.strftime('%Y-%m-%dT%H:%M:%S.') + f"{ms % 1000:03d}Z"
+
+
+def encode_play(item):
+    """Encode a recently-played item as (play key, compact event)"""
+    track = item['track']
+    played_at = datetime.fromisoformat(item['played_at'].replace('Z', '+00:00'))
+    ms = int(played_at.timestamp() * 1000)
+    artists = track.get('artists') or [{}]
+    event = [track['id'], ms, track.get('duration_ms', 0), artists[0].get('id')]
+    return f"{ms}:{track['id']}", event
+
+
+def decode_play(event, track_meta=None):
+    """Rebuild a recently-played shaped item from a compact event"""
+    track = {
+        'id': event[TRACK_ID],
+        'duration_ms': event[DURATION_MS],
+        'artists': [{'id': event[ARTIST_ID]}],
+    }
+    if track_meta:
+        track.update(track_meta)
+    return {'played_at': iso_from_ms(event[PLAYED_AT_MS]), 'track': track}
+
+
+def encode_track_meta(track):
+    """The metadata kept once per track in the tracks dictionary"""
+    album = track.get('album') or {}
+    images = album.get('images') or []
+    return {
+        'name': track.get('name'),
+        'artists': [artist.get('name') for artist in track.get('artists', [])],
+        'artist_ids': [artist.get('id') for artist in track.get('artists', [])],
+        'album': album.get('name'),
+        'image_url': images[0]['url'] if images else None,
+        'duration_ms': track.get('duration_ms', 0),
+    }
+
+
+def group_by_day(items):
+    """Encode items into {day_id: {play_key: event}}"""
+    days = {}
+    for item in items:
+        key, event = encode_play(item)
+        days.setdefault(day_id(event[PLAYED_AT_MS]), {})[key] = event
+    return days
+
+
+ROLLUP_DOC = 'listening_rollup'
+
+
+def rollup_increments(days):
+    """Increment transforms for the rollup doc from {day_id: {play_key: event}}"""
+    rollup = {'days': {}}
+    total_plays = total_ms = 0
+    for day, plays in days.items():
+        duration_ms = sum(event[DURATION_MS] or 0 for event in plays.values())
+        rollup['days'][day] = {
+            'count': firestore.Increment(len(plays)),
+            'duration_ms': firestore.Increment(duration_ms),
+        }
+        total_plays += len(plays)
+        total_ms += duration_ms
+    rollup['total_plays'] = firestore.Increment(total_plays)
+    rollup['total_duration_ms'] = firestore.Increment(total_ms)
+    return rollup
+
+
+# Track ids this instance has already written to the tracks dictionary
+_known_tracks = set()
+_known_tracks_lock = threading.Lock()
+
+
+def store_plays(writer, db_client, user_id, items):
+    """Queue writes for new plays, their rollup counters and unseen track metadata.
+
+    ``items`` must be plays not stored before (see select_new_plays): the
+    rollup counters are increments, so re-ingesting a play would count it
+    twice. ``writer`` is a WriteBatch; call remember_tracks once it commits.
+    Returns the number of day shards touched.
+    """
+    user_ref = db_client.collection('users').document(user_id)
+    days = group_by_day(items)
+    for day, plays in days.items():
+        writer.set(user_ref.collection('plays').document(day), {'plays': plays}, merge=True)
+    if days:
+        writer.set(
+            user_ref.collection('analytics').document(ROLLUP_DOC),
+            rollup_increments(days),
+            merge=True,
+        )
+
+    tracks = {item['track']['id']: item['track'] for item in items}
+    with _known_tracks_lock:
+        unseen = [track_id for track_id in tracks if track_id not in _known_tracks]
+    for track_id in unseen:
+        writer.set(
+            db_client.collection('tracks').document(track_id),
+            encode_track_meta(tracks[track_id]),
+            merge=True,
+        )
+    return len(days)
+
+
+def remember_tracks(items):
+    """Skip metadata writes for these plays' tracks once their batch has committed"""
+    with _known_tracks_lock:
+        _known_tracks.update(item['track']['id'] for item in items)
+
+
+def day_range(start_ms, end_ms):
+    """Day shard ids covering [start_ms, end_ms]"""
+    day = datetime.fromtimestamp(start_ms / 1000, tz=timezone.utc).date()
+    last = datetime.fromtimestamp(end_ms / 1000, tz=timezone.utc).date()
+    days = []
+    while day <= last:
+        days.append(day.strftime('%Y-%m-%d'))
+        day += timedelta(days=1)
+    return days
+
+
+def read_events(db_client, user_id, start_ms, end_ms):
+    """Compact events for a user within [start_ms, end_ms], oldest first"""
+    plays_ref = db_client.collection('users').document(user_id).collection('plays')
+    refs = [plays_ref.document(day) for day in day_range(start_ms, end_ms)]
+    events = []
+    # One batched read for every day shard in the range
+    for doc in db_client.get_all(refs):
+        if doc.exists:
+            events.extend((doc.to_dict() or {}).get('plays', {}).values())
+    events = [e for e in events if start_ms <= e[PLAYED_AT_MS] <= end_ms]
+    events.sort(key=lambda e: e[PLAYED_AT_MS])
+    return events
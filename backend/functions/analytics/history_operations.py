@@ -1,80 +1,57 @@
 from datetime import datetime, timedelta
-from google.cloud import firestore
-from google.api_core import retry
 import pytz
+from ..clients import get_firestore
+from .event_store import ROLLUP_DOC
 
-# Initialize Firestore with retry configuration
-db = firestore.Client()
+# The dashboard histogram covers the last week
+HISTORY_DAYS = 7
 
-def process_listening_history(user_id, tracks_data):
-    """Process and store listening history for a user"""
-    # Make sure we use UTC timezone consistently
-    now = datetime.now(pytz.UTC)
+def history_from_rollup(rollup, days=HISTORY_DAYS, now=None):
+    """Build the daily histogram for the last ``days`` UTC days from rollup counters"""
+    now = now or datetime.now(pytz.UTC)
+    counters = (rollup or {}).get('days', {})
     history = []
     total_ms = 0
-    
-    # Initialize 7-day history
-    for i in range(7):
-        date = now - timedelta(days=i)
+    for i in range(days - 1, -1, -1):
+        date = (now - timedelta(days=i)).replace(hour=0, minute=0, second=0, microsecond=0)
+        day = counters.get(date.strftime('%Y-%m-%d'), {})
+        duration_ms = day.get('duration_ms', 0)
+        total_ms += duration_ms
         history.append({
             'date': date.strftime('%a'),
-            'count': 0,
-            'duration_ms': 0,
-            'timestamp': date.timestamp()  # UTC timestamp
+            'count': day.get('count', 0),
+            'duration_ms': duration_ms,
+            'timestamp': date.timestamp()
         })
-    
-    # Process tracks
-    for track in tracks_data:
-        # Convert the played_at string to a timezone-aware datetime
-        played_at = datetime.fromisoformat(track['played_at'].replace('Z', '+00:00'))
-        if played_at.tzinfo is None:
-            played_at = pytz.UTC.localize(played_at)
-            
-        duration_ms = track['track']['duration_ms']
-        total_ms += duration_ms
-        
-        days_ago = (now - played_at).days
-        if 0 <= days_ago < 7:
-            history[days_ago]['count'] += 1
-            history[days_ago]['duration_ms'] += duration_ms
-    
-    total_hours = round(total_ms / (1000 * 60 * 60), 1)
-    
-    # Store in Firestore
-    analytics_ref = db.collection('users').document(user_id).collection('analytics')
-    
-    # Store daily history - convert to dict for Firestore
-    analytics_ref.document('listening_history').set({
-        'daily_counts': [{
-            'date': day['date'],
-            'count': day['count'],
-            'duration_ms': day['duration_ms'],
-            'timestamp': day['timestamp']
-        } for day in history[::-1]],
-        'last_updated': now
-    })
-    
-    # Store listening time
-    analytics_ref.document('listening_stats').set({
-        'total_listening_time_ms': total_ms,
-        'total_listening_hours': total_hours,
-        'last_updated': now
-    })
-    
     return {
-        'history': [{
-            'date': day['date'],
-            'count': day['count'],
-            'duration_ms': day['duration_ms'],
-            'timestamp': day['timestamp']
-        } for day in history[::-1]],
-        'total_hours': total_hours
+        'history': history,
+        'total_hours': round(total_ms / (1000 * 60 * 60), 1)
     }
-    
-def get_listening_stats(user_id):
+
+
+def _rollup(user_id, db_client=None):
+    rollup_doc = (db_client or get_firestore()).collection('users').document(user_id)\
+                 .collection('analytics').document(ROLLUP_DOC).get()
+    return rollup_doc.to_dict() if rollup_doc.exists else None
+
+
+def get_listening_summary(user_id, days=HISTORY_DAYS, db_client=None):
+    """Daily histogram and hours for the last week from a single rollup read"""
+    return history_from_rollup(_rollup(user_id, db_client), days)
+
+
+def get_listening_stats(user_id, db_client=None):
     """Get user's listening statistics"""
     try:
-        stats_ref = db.collection('users').document(user_id)\
+        rollup = _rollup(user_id, db_client)
+        if rollup is not None:
+            return {
+                'total_hours': round(rollup.get('total_duration_ms', 0) / (1000 * 60 * 60), 1),
+                'total_plays': rollup.get('total_plays', 0)
+            }
+
+        # Users whose plays predate the rollup counters
+        stats_ref = (db_client or get_firestore()).collection('users').document(user_id)\
                      .collection('analytics').document('listening_stats')
         stats = stats_ref.get()
         
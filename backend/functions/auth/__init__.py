@@ -1 +1,3 @@
-from .token_manager import *
\ No newline at end of file
+from ..lazy import lazy_exports
+
+__getattr__ = lazy_exports(__name__, ('token_manager',))
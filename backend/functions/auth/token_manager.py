@@ -1,8 +1,12 @@
-from google.cloud import firestore
-import requests
 import os
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import Future, ThreadPoolExecutor
 import logging
+import threading
+import time
+from ..clients import get_firestore
+from ..spotify.client import get_spotify_client
+from ..spotify.scheduler import INTERACTIVE, BACKGROUND
 
 # Configure logging
 logging.basicConfig(
@@ -10,13 +14,273 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
-db = firestore.Client()
+# Cached tokens are treated as expired this long before Spotify's expiry
+TOKEN_SAFETY_MARGIN = timedelta(minutes=5)
+# Users who logged in or listened within this many days count as active
+ACTIVE_USER_DAYS = 30
+
+
+class RefreshTokenRevoked(Exception):
+    """Spotify rejected a refresh token for good (invalid_grant); retrying cannot help"""
+
+
+def _utc(value):
+    """Firestore returns aware datetimes; older documents hold naive UTC ones"""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def is_active(user_data, since):
+    """True when the user logged in, or played something, at or after ``since``"""
+    last_login = user_data.get('last_login')
+    cursor = user_data.get('listening_cursor')
+    return bool(
+        (isinstance(last_login, datetime) and _utc(last_login) >= since)
+        or (cursor is not None and cursor >= since.timestamp() * 1000)
+    )
+
+
+def request_token_refresh(refresh_token, priority=INTERACTIVE):
+    """Exchange a refresh token with Spotify; returns the token payload or None.
+
+    Raises RefreshTokenRevoked when Spotify answers invalid_grant.
+    """
+    client_id = os.getenv('SPOTIFY_CLIENT_ID')
+    client_secret = os.getenv('SPOTIFY_CLIENT_SECRET')
+    
+    if not client_id or not client_secret:
+        logging.error("Missing Spotify API credentials")
+        return None
+    
+    response = get_spotify_client().request_token(
+        data={
+            'grant_type': 'refresh_token',
+            'refresh_token': refresh_token
+        },
+        auth=(client_id, client_secret),
+        priority=priority
+    )
+    
+    if response.status_code != 200:
+        logging.error(f"Token refresh failed with status {response.status_code}")
+        logging.error(f"Response: {response.text}")
+        if response.status_code == 400 and _token_error(response) == 'invalid_grant':
+            raise RefreshTokenRevoked(response.text)
+        return None
+        
+    return response.json()
+
+
+def _token_error(response):
+    """OAuth ``error`` code of a failed token response, or None"""
+    try:
+        return response.json().get('error')
+    except ValueError:
+        return None
+
+
+def _request_app_token_data(priority=BACKGROUND):
+    """Client-credentials token payload, or None"""
+    client_id = os.getenv('SPOTIFY_CLIENT_ID')
+    client_secret = os.getenv('SPOTIFY_CLIENT_SECRET')
+
+    if not client_id or not client_secret:
+        logging.error("Missing Spotify API credentials")
+        return None
+
+    response = get_spotify_client().request_token(
+        data={'grant_type': 'client_credentials'},
+        auth=(client_id, client_secret),
+        priority=priority
+    )
+
+    if response.status_code != 200:
+        logging.error(f"Client credentials request failed with status {response.status_code}")
+        return None
+
+    return response.json()
+
+
+def request_app_token(priority=BACKGROUND):
+    """Client-credentials access token for catalog calls made outside any user's session"""
+    return (_request_app_token_data(priority) or {}).get('access_token')
+
+
+# After a failed client-credentials request, callers get None this long
+# before it is tried again
+APP_TOKEN_RETRY_DELAY = timedelta(minutes=1)
+_app_token = None  # (access_token or None, valid until)
+_app_token_lock = threading.Lock()
+
+
+def get_app_token():
+    """Cached client-credentials access token, or None.
+
+    Catalog lookups shared between users (artist genres, a precompute run's
+    catalog loader) go out under it, so no user's token is used on another
+    user's behalf.
+    """
+    global _app_token
+    with _app_token_lock:
+        now = datetime.now(timezone.utc)
+        if _app_token is not None and now < _app_token[1]:
+            return _app_token[0]
+        token_data = _request_app_token_data(priority=INTERACTIVE)
+        if token_data and token_data.get('access_token'):
+            expiry = now + timedelta(seconds=token_data.get('expires_in', 3600))
+            _app_token = (token_data['access_token'], expiry - TOKEN_SAFETY_MARGIN)
+        else:
+            _app_token = (None, now + APP_TOKEN_RETRY_DELAY)
+        return _app_token[0]
+
+
+def app_headers():
+    """Authorization headers for the app token, or None when there is none"""
+    token = get_app_token()
+    return {"Authorization": f"Bearer {token}"} if token else None
+
+
+def _token_update(token_data):
+    """Firestore fields for a refreshed token payload"""
+    now = datetime.now(timezone.utc)
+    update_data = {
+        'access_token': token_data['access_token'],
+        'token_expiry': now + timedelta(seconds=token_data['expires_in']),
+        'last_token_refresh': now
+    }
+    # Spotify may rotate the refresh token
+    if token_data.get('refresh_token'):
+        update_data['refresh_token'] = token_data['refresh_token']
+    return update_data
+
+
+def _refresh_and_store(user_id, user_ref, refresh_token):
+    """Refresh a token and write it back; returns (access_token, expiry) or None"""
+    try:
+        token_data = request_token_refresh(refresh_token)
+    except RefreshTokenRevoked:
+        logging.error(f"Refresh token for user {user_id} was revoked")
+        return None
+    if not token_data:
+        return None
+        
+    update_data = _token_update(token_data)
+    expiry = update_data['token_expiry']
+    user_ref.update(update_data)
+    logging.info(f"Successfully refreshed token for user {user_id}")
+    return token_data['access_token'], expiry
+
+
+class TokenCache:
+    """Per-instance access token cache with single-flight refresh.
+
+    A token is served from memory until its expiry minus ``margin``. On a miss
+    exactly one caller per user loads the Firestore document (refreshing the
+    token if it is close to expiry); concurrent callers for the same user wait
+    on that caller's result instead of issuing their own refresh.
+    """
+
+    def __init__(self, margin=TOKEN_SAFETY_MARGIN, clock=None, db=None):
+        self.margin = margin
+        self.db = db
+        self.clock = clock or (lambda: datetime.now(timezone.utc))
+        self._tokens = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+        self.refreshes = 0
+
+    def _valid(self, expiry):
+        return expiry is not None and self.clock() + self.margin < expiry
+
+    def get(self, user_id):
+        """Return a valid access token for user_id, or None"""
+        with self._lock:
+            cached = self._tokens.get(user_id)
+            if cached and self._valid(cached[1]):
+                self.hits += 1
+                return cached[0]
+            future = self._inflight.get(user_id)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[user_id] = future
+                
+        if not owner:
+            return future.result()
+            
+        try:
+            token = self._load(user_id)
+            future.set_result(token)
+            return token
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(user_id, None)
+
+    def _load(self, user_id):
+        self.loads += 1
+        user_ref = (self.db or get_firestore()).collection('users').document(user_id)
+        user_doc = user_ref.get()
+        if not user_doc.exists:
+            return None
+            
+        user_data = user_doc.to_dict()
+        access_token = user_data.get('access_token')
+        token_expiry = user_data.get('token_expiry')
+        if isinstance(token_expiry, datetime):
+            token_expiry = _utc(token_expiry)
+            if access_token and self._valid(token_expiry):
+                self.store(user_id, access_token, token_expiry)
+                return access_token
+                
+        refresh_token = user_data.get('refresh_token')
+        if not refresh_token:
+            logging.error(f"No refresh token found for user {user_id}")
+            return None
+            
+        self.refreshes += 1
+        refreshed = _refresh_and_store(user_id, user_ref, refresh_token)
+        if not refreshed:
+            return None
+        self.store(user_id, *refreshed)
+        return refreshed[0]
+
+    def store(self, user_id, access_token, expiry):
+        """Record a token obtained elsewhere (OAuth callback, refresh endpoint)"""
+        with self._lock:
+            self._tokens[user_id] = (access_token, _utc(expiry))
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._tokens.pop(user_id, None)
+
+
+_token_cache = TokenCache()
+
+
+def get_token_cache():
+    return _token_cache
+
+
+def get_access_token(user_id):
+    """Valid access token for a user from the instance token cache, or None"""
+    try:
+        return _token_cache.get(user_id)
+    except Exception as e:
+        logging.error(f"Error getting access token for {user_id}: {str(e)}")
+        return None
+
 
 def refresh_spotify_token(user_id):
     """Refresh a user's Spotify access token"""
     try:
         logging.info(f"Attempting to refresh token for user: {user_id}")
-        user_ref = db.collection('users').document(user_id)
+        user_ref = get_firestore().collection('users').document(user_id)
         user_doc = user_ref.get()
         
         if not user_doc.exists:
@@ -30,68 +294,154 @@ def refresh_spotify_token(user_id):
             logging.error(f"No refresh token found for user {user_id}")
             return None
             
-        # Spotify token refresh request
-        token_url = 'https://accounts.spotify.com/api/token'
-        client_id = os.getenv('SPOTIFY_CLIENT_ID')
-        client_secret = os.getenv('SPOTIFY_CLIENT_SECRET')
-        
-        if not client_id or not client_secret:
-            logging.error("Missing Spotify API credentials")
+        refreshed = _refresh_and_store(user_id, user_ref, refresh_token)
+        if not refreshed:
             return None
+        _token_cache.store(user_id, *refreshed)
         
-        response = requests.post(
-            token_url,
-            data={
-                'grant_type': 'refresh_token',
-                'refresh_token': refresh_token
-            },
-            auth=(client_id, client_secret)
-        )
-        
-        if response.status_code != 200:
-            logging.error(f"Token refresh failed with status {response.status_code}")
-            logging.error(f"Response: {response.text}")
-            return None
-            
-        token_data = response.json()
-        
-        # Update token in Firestore
-        update_data = {
-            'access_token': token_data['access_token'],
-            'token_expiry': datetime.now() + timedelta(seconds=token_data['expires_in']),
-            'last_token_refresh': datetime.now()
-        }
-        
-        user_ref.update(update_data)
-        logging.info(f"Successfully refreshed token for user {user_id}")
-        
-        return token_data['access_token']
+        return refreshed[0]
     except Exception as e:
         logging.error(f"Error refreshing token: {str(e)}")
         return None
 
 def validate_token(user_id):
     """Validate and refresh token if needed"""
-    try:
-        user_ref = db.collection('users').document(user_id)
-        user_doc = user_ref.get()
-        
-        if not user_doc.exists:
+    return get_access_token(user_id)
+
+
+# Firestore caps a write batch at 500 operations
+MAX_BATCH_WRITES = 500
+# Attempts per token write before giving up, and the backoff between them
+WRITE_ATTEMPTS = 3
+WRITE_RETRY_DELAY = 0.5
+
+
+def _write_with_retries(write, description):
+    """Run a Firestore write, retrying with backoff; returns whether it landed"""
+    for attempt in range(1, WRITE_ATTEMPTS + 1):
+        try:
+            write()
+            return True
+        except Exception as e:
+            logging.warning(f"Writing {description} failed (attempt {attempt}/{WRITE_ATTEMPTS}): {str(e)}")
+            if attempt < WRITE_ATTEMPTS:
+                time.sleep(WRITE_RETRY_DELAY * 2 ** (attempt - 1))
+    return False
+
+
+def refresh_expiring_tokens(window_minutes=15, max_workers=8, db_client=None,
+                            active_days=ACTIVE_USER_DAYS):
+    """Proactively refresh every active user's token that expires within the next window.
+
+    Tokens that have already expired are refreshed too, back to
+    ``active_days`` ago; only users who logged in or listened within
+    ``active_days`` are refreshed. A refresh token Spotify rejects as
+    revoked is marked with ``refresh_failed_at`` and ``refresh_error`` and
+    skipped by later runs until the user signs in again, which rewrites the
+    document.
+
+    Refreshes run in parallel on a bounded pool at background priority. When
+    Spotify rotates a refresh token the old one stops working, so that user's
+    update is written as soon as the refresh returns; the remaining updates
+    are written back with batched Firestore writes. Every write is retried
+    before it counts as failed. Returns per-run counters.
+    """
+    from google.cloud.firestore_v1.base_query import FieldFilter
+    client = db_client or get_firestore()
+    started = time.monotonic()
+    now = datetime.now(timezone.utc)
+    cutoff = now + timedelta(minutes=window_minutes)
+    since = now - timedelta(days=active_days)
+    
+    query = client.collection('users')\
+                  .where(filter=FieldFilter('token_expiry', '>=', since))\
+                  .where(filter=FieldFilter('token_expiry', '<=', cutoff))
+    candidates = []
+    skipped = skipped_revoked = skipped_inactive = 0
+    for user_doc in query.stream():
+        user_data = user_doc.to_dict() or {}
+        refresh_token = user_data.get('refresh_token')
+        if not refresh_token:
+            skipped += 1
+        elif user_data.get('refresh_failed_at') is not None:
+            skipped_revoked += 1
+        elif not is_active(user_data, since):
+            skipped_inactive += 1
+        else:
+            candidates.append((user_doc.id, user_doc.reference, refresh_token))
+            
+    def refresh(candidate):
+        """Returns (update data, whether it is already stored), or None"""
+        user_id, user_ref, refresh_token = candidate
+        try:
+            token_data = request_token_refresh(refresh_token, priority=BACKGROUND)
+        except RefreshTokenRevoked:
+            logging.error(f"Refresh token for {user_id} was revoked; skipping it from now on")
+            return {'refresh_failed_at': datetime.now(timezone.utc), 'refresh_error': 'invalid_grant'}, False
+        except Exception as e:
+            logging.error(f"Error refreshing token for {user_id}: {str(e)}")
+            return None
+        if not token_data:
             return None
+        update_data = _token_update(token_data)
+        if 'refresh_token' not in update_data:
+            return update_data, False
+        stored = _write_with_retries(lambda: user_ref.update(update_data), f"rotated token for {user_id}")
+        if not stored:
+            logging.error(f"Rotated refresh token for {user_id} could not be stored")
+        return update_data, stored
             
-        user_data = user_doc.to_dict()
-        token_expiry = user_data.get('token_expiry')
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="token-refresh") as pool:
+        results = list(pool.map(refresh, candidates))
         
-        if not token_expiry:
-            return refresh_spotify_token(user_id)
-            
-        # If token expires in less than 5 minutes, refresh it
-        if isinstance(token_expiry, datetime):
-            if datetime.now() + timedelta(minutes=5) >= token_expiry:
-                return refresh_spotify_token(user_id)
-            return user_data.get('access_token')
+    refreshed = failed = revoked = rotated = batches = write_failures = 0
+    pending = []
+    
+    def commit(writes):
+        nonlocal batches, write_failures
+        batch = client.batch()
+        for user_ref, update_data in writes:
+            batch.update(user_ref, update_data)
+        if _write_with_retries(batch.commit, f"batch of {len(writes)} tokens"):
+            batches += 1
+        else:
+            write_failures += len(writes)
             
-        return refresh_spotify_token(user_id)
-    except Exception as e:
-        logging.error(f"Error validating token: {str(e)}")
-        return None
\ No newline at end of file
+    for (user_id, user_ref, _), result in zip(candidates, results):
+        if not result:
+            failed += 1
+            continue
+        update_data, stored = result
+        if 'refresh_token' in update_data:
+            rotated += 1
+            if not stored:
+                write_failures += 1
+        else:
+            pending.append((user_ref, update_data))
+            if len(pending) == MAX_BATCH_WRITES:
+                commit(pending)
+                pending = []
+        if 'refresh_failed_at' in update_data:
+            revoked += 1
+            continue
+        # The access token is valid whether or not it reached Firestore
+        _token_cache.store(user_id, update_data['access_token'], update_data['token_expiry'])
+        refreshed += 1
+    if pending:
+        commit(pending)
+        
+    stats = {
+        'candidates': len(candidates),
+        'refreshed': refreshed,
+        'failed': failed,
+        'revoked': revoked,
+        'skipped_no_refresh_token': skipped,
+        'skipped_revoked': skipped_revoked,
+        'skipped_inactive': skipped_inactive,
+        'rotated': rotated,
+        'batches': batches,
+        'write_failures': write_failures,
+        'elapsed_seconds': round(time.monotonic() - started, 3),
+    }
+    logging.info(f"Proactive token refresh: {stats}")
+    return stats
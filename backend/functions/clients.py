@@ -0,0 +1,42 @@
+# backend/functions/clients.py
+"""Process-wide Firestore and Spotify clients, created on first use.
+
+Every module goes through these getters instead of building its own client
+at import time, so an instance creates one Firestore client (credentials and
+gRPC channel included) and only once a request needs it. The async Spotify
+client, and with it aiohttp, is imported only by the functions that use it.
+"""
+import threading
+
+_firestore = None
+_lock = threading.Lock()
+
+
+def get_firestore():
+    """Return the shared firestore.Client, creating it on first use"""
+    global _firestore
+    if _firestore is None:
+        with _lock:
+            if _firestore is None:
+                from google.cloud import firestore
+                _firestore = firestore.Client()
+    return _firestore
+
+
+def set_firestore(client):
+    """Use ``client`` as the shared Firestore client, e.g. an emulator or fake"""
+    global _firestore
+    with _lock:
+        _firestore = client
+
+
+def get_spotify_client():
+    """Return the shared pooled SpotifyClient"""
+    from .spotify.client import get_spotify_client as spotify_client
+    return spotify_client()
+
+
+def get_async_spotify_client():
+    """Return the shared AsyncSpotifyClient, importing aiohttp on first use"""
+    from .spotify.async_client import get_async_spotify_client as async_spotify_client
+    return async_spotify_client()
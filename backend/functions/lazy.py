@@ -0,0 +1,25 @@
+# backend/functions/lazy.py
+"""Lazy package re-exports.
+
+Packages used to star-import every submodule, so importing any one module
+(``functions.auth.token_manager``, say) also imported numpy, aiohttp and the
+rest of the tree. A package ``__getattr__`` built here keeps package-level
+names available but imports a submodule only when one of its names is used.
+"""
+from importlib import import_module
+
+
+def lazy_exports(package, submodules):
+    """Module ``__getattr__`` resolving public names from ``submodules`` on first use"""
+
+    def __getattr__(name):
+        if name in submodules:
+            return import_module(f".{name}", package)
+        if not name.startswith('_'):
+            for submodule in submodules:
+                module = import_module(f".{submodule}", package)
+                if hasattr(module, name):
+                    return getattr(module, name)
+        raise AttributeError(f"module {package!r} has no attribute {name!r}")
+
+    return __getattr__
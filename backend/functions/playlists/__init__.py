@@ -1 +1,3 @@
-from .playlist_operations import *
\ No newline at end of file
+from ..lazy import lazy_exports
+
+__getattr__ = lazy_exports(__name__, ('playlist_operations',))
@@ -1 +1,12 @@
-from .recommendation_operations import *
\ No newline at end of file
+from ..lazy import lazy_exports
+
+__getattr__ = lazy_exports(__name__, (
+    'recommendation_operations',
+    'track_record',
+    'ranking',
+    'precompute',
+    'genre_index',
+    'feature_index',
+    'co_listening',
+    'metrics',
+))
@@ -0,0 +1,297 @@
+# backend/functions/recommendations/co_listening.py
+"""Item-item co-listening graph built from every user's stored plays.
+
+Two items co-occur when one user plays them within ``SESSION_WINDOW``
+plays and ``SESSION_GAP_MS`` of each other. Pairs are packed into int64
+keys and counted with np.unique in bounded chunks, so the build runs over
+millions of plays on one machine. Pair counts are normalised by both
+items' play counts (cosine similarity), and each item keeps its
+``TOP_NEIGHBOURS`` best neighbours as one small document in
+``co_listening_artists/{id}`` or ``co_listening_tracks/{id}``. Serving is a
+point lookup through an in-process cache, so collaborative-filtering
+candidates need no Spotify calls.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from google.cloud import firestore
+
+from ..analytics.event_store import ARTIST_ID, PLAYED_AT_MS, TRACK_ID, read_events
+from ..clients import get_firestore
+
+ARTISTS = 'artists'
+TRACKS = 'tracks'
+KINDS = {ARTISTS: ARTIST_ID, TRACKS: TRACK_ID}
+# Plays this many positions apart, at most, count as co-listened
+SESSION_WINDOW = 5
+SESSION_GAP_MS = 30 * 60 * 1000
+LOOKBACK_DAYS = 90
+TOP_NEIGHBOURS = 20
+# Pairs seen fewer times are noise
+MIN_CO_COUNT = 2
+# Pair keys buffered before they are folded into the running counts
+CHUNK_PAIRS = 5_000_000
+CO_LISTENING_TTL = 6 * 60 * 60
+DEFAULT_MAX_ITEMS = int(os.getenv("SPOTIFY_CO_LISTENING_CACHE_SIZE", "50000"))
+
+
+def collection_name(kind):
+    return f"co_listening_{kind}"
+
+
+class CoListeningBuilder:
+    """Accumulates co-occurrence counts for one kind of item, user by user"""
+
+    def __init__(self, window=SESSION_WINDOW, gap_ms=SESSION_GAP_MS, chunk_pairs=CHUNK_PAIRS):
+        self.window = window
+        self.gap_ms = gap_ms
+        self.chunk_pairs = chunk_pairs
+        self.codes = {}  # item id -> dense code
+        self.item_ids = []
+        self.plays = 0
+        self._play_codes = []
+        self._pending = []
+        self._pending_size = 0
+        self._keys = np.empty(0, dtype=np.int64)
+        self._counts = np.empty(0, dtype=np.int64)
+
+    def _code(self, item_id):
+        code = self.codes.get(item_id)
+        if code is None:
+            code = self.codes[item_id] = len(self.item_ids)
+            self.item_ids.append(item_id)
+        return code
+
+    def add_sequence(self, item_ids, played_ms):
+        """Count one user's plays; items and times in any order, None items skipped"""
+        kept = [(ms, item_id) for item_id, ms in zip(item_ids, played_ms) if item_id]
+        if not kept:
+            return
+        kept.sort(key=lambda play: play[0])
+        times = np.fromiter((ms for ms, _ in kept), np.int64, len(kept))
+        codes = np.fromiter((self._code(item_id) for _, item_id in kept), np.int64, len(kept))
+        self.plays += len(codes)
+        self._play_codes.append(codes)
+        for offset in range(1, min(self.window, len(codes) - 1) + 1):
+            first, second = codes[:-offset], codes[offset:]
+            mask = (times[offset:] - times[:-offset] <= self.gap_ms) & (first != second)
+            if not mask.any():
+                continue
+            first, second = first[mask], second[mask]
+            # Both directions, so every item's row holds all of its pairs
+            self._pending.append((first << 32) | second)
+            self._pending.append((second << 32) | first)
+            self._pending_size += 2 * len(first)
+        if self._pending_size >= self.chunk_pairs:
+            self._fold()
+
+    def _fold(self):
+        if not self._pending:
+            return
+        keys, counts = np.unique(np.concatenate(self._pending), return_counts=True)
+        self._pending, self._pending_size = [], 0
+        if len(self._keys):
+            keys, inverse = np.unique(np.concatenate([self._keys, keys]), return_inverse=True)
+            counts = np.bincount(inverse, weights=np.concatenate([self._counts, counts])).astype(np.int64)
+        self._keys, self._counts = keys, counts
+
+    @property
+    def pairs(self):
+        self._fold()
+        return len(self._keys)
+
+    def neighbours(self, top_n=TOP_NEIGHBOURS, min_count=MIN_CO_COUNT):
+        """Yield (item_id, [neighbour ids], [scores]) for every item with neighbours"""
+        self._fold()
+        keep = self._counts >= min_count
+        keys, counts = self._keys[keep], self._counts[keep]
+        if not len(keys):
+            return
+        first, second = keys >> 32, keys & 0xFFFFFFFF
+        plays = np.bincount(np.concatenate(self._play_codes), minlength=len(self.item_ids))
+        scores = counts / np.sqrt(plays[first].astype(np.float64) * plays[second])
+        # Group by item, best score first, ties to the lower code
+        order = np.lexsort((second, -scores, first))
+        first, second, scores = first[order], second[order], scores[order]
+        starts = np.flatnonzero(np.r_[True, first[1:] != first[:-1]])
+        ends = np.r_[starts[1:], len(first)]
+        for start, end in zip(starts, np.minimum(ends, starts + top_n)):
+            yield (
+                self.item_ids[first[start]],
+                [self.item_ids[code] for code in second[start:end]],
+                [round(float(score), 4) for score in scores[start:end]],
+            )
+
+
+def build_co_listening_graph(db_client=None, lookback_days=LOOKBACK_DAYS, top_n=TOP_NEIGHBOURS,
+                             min_count=MIN_CO_COUNT, now_ms=None):
+    """Rebuild the artist and track graphs from every user's recent plays.
+
+    Reads each user's day shards for the last ``lookback_days`` and writes
+    one neighbour document per item through a BulkWriter, deleting the
+    documents of items left without neighbours. Returns build stats.
+    """
+    client_db = db_client or get_firestore()
+    now_ms = now_ms or int(time.time() * 1000)
+    start_ms = now_ms - lookback_days * 24 * 60 * 60 * 1000
+    started = time.perf_counter()
+    builders = {kind: CoListeningBuilder() for kind in KINDS}
+    stats = {'users': 0}
+
+    for user_doc in client_db.collection('users').select([]).stream():
+        events = read_events(client_db, user_doc.id, start_ms, now_ms)
+        if not events:
+            continue
+        stats['users'] += 1
+        played = [event[PLAYED_AT_MS] for event in events]
+        for kind, column in KINDS.items():
+            builders[kind].add_sequence(
+                [event[column] if len(event) > column else None for event in events], played
+            )
+
+    stats['plays'] = builders[TRACKS].plays
+    writer = client_db.bulk_writer()
+    for kind, builder in builders.items():
+        stats[f"{kind[:-1]}_pairs"] = builder.pairs
+        collection = client_db.collection(collection_name(kind))
+        written = set()
+        for item_id, neighbours, scores in builder.neighbours(top_n, min_count):
+            writer.set(collection.document(item_id), {
+                'neighbours': neighbours,
+                'scores': scores,
+                'updated_at': firestore.SERVER_TIMESTAMP,
+            })
+            written.add(item_id)
+        # Items that lost every pair since the last build would otherwise keep
+        # serving their old neighbours
+        stale = 0
+        for doc in collection.select([]).stream():
+            if doc.id not in written:
+                writer.delete(doc.reference)
+                stale += 1
+        stats[kind] = len(written)
+        stats[f"stale_{kind}"] = stale
+    writer.close()
+
+    stats['elapsed_seconds'] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+def interleave(groups, limit, exclude=()):
+    """Round-robin merge of id lists, de-duplicated, up to ``limit`` ids"""
+    seen = set(exclude)
+    merged = []
+    for rank in range(max((len(group) for group in groups), default=0)):
+        for group in groups:
+            if rank < len(group) and group[rank] not in seen:
+                seen.add(group[rank])
+                merged.append(group[rank])
+                if len(merged) == limit:
+                    return merged
+    return merged
+
+
+class CoListeningIndex:
+    """Cached point lookups into the stored co-listening graphs.
+
+    Unknown items are read with one ``get_all`` per call and kept, misses
+    included, for ``ttl`` seconds, least-recently-used past ``max_entries``.
+    Without a ``db_client`` the index is disabled and every lookup is empty.
+    """
+
+    def __init__(self, db_client=None, ttl=CO_LISTENING_TTL, max_entries=None, clock=time.time):
+        self.db = db_client
+        self.ttl = ttl
+        self.max_entries = max_entries or DEFAULT_MAX_ITEMS
+        self.clock = clock
+        self._entries = OrderedDict()  # (kind, item id) -> (expires_at, neighbour ids)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reads = 0
+
+    def _lookup(self, kind, item_ids):
+        now = self.clock()
+        found, missing = {}, []
+        with self._lock:
+            for item_id in dict.fromkeys(item_ids):
+                entry = self._entries.get((kind, item_id))
+                if entry is not None and entry[0] > now:
+                    self._entries.move_to_end((kind, item_id))
+                    found[item_id] = entry[1]
+                    self.hits += 1
+                else:
+                    missing.append(item_id)
+                    self.misses += 1
+        if not missing:
+            return found
+        collection = self.db.collection(collection_name(kind))
+        try:
+            docs = {doc.id: doc for doc in self.db.get_all([collection.document(i) for i in missing])}
+        except Exception as e:
+            logging.warning(f"Co-listening lookup failed: {e}")
+            return found
+        with self._lock:
+            self.reads += 1
+            for item_id in missing:
+                doc = docs.get(item_id)
+                neighbours = (doc.to_dict() or {}).get('neighbours', []) if doc and doc.exists else []
+                found[item_id] = neighbours
+                self._entries[(kind, item_id)] = (now + self.ttl, neighbours)
+                self._entries.move_to_end((kind, item_id))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return found
+
+    def is_cached(self, kind, item_ids):
+        """True when ``neighbours(kind, item_ids)`` would not read Firestore"""
+        if self.db is None:
+            return True
+        now = self.clock()
+        with self._lock:
+            return all(
+                (kind, item_id) in self._entries and self._entries[(kind, item_id)][0] > now
+                for item_id in item_ids
+            )
+
+    def neighbours(self, kind, item_ids, per_item=TOP_NEIGHBOURS, limit=None):
+        """Neighbour ids of several items, taken from each in turn, seeds excluded"""
+        if self.db is None or not item_ids:
+            return []
+        found = self._lookup(kind, item_ids)
+        groups = [found.get(item_id, [])[:per_item] for item_id in dict.fromkeys(item_ids)]
+        return interleave(groups, limit or per_item * len(groups), exclude=item_ids)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'reads': self.reads,
+                'entries': len(self._entries),
+            }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_co_listening_index():
+    """Return the process-wide co-listening index.
+
+    Backed by Firestore unless SPOTIFY_CO_LISTENING=false, in which case it
+    is disabled.
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                if os.getenv("SPOTIFY_CO_LISTENING", "true").lower() != "false":
+                    _index = CoListeningIndex(get_firestore())
+                else:
+                    _index = CoListeningIndex()
+    return _index
@@ -0,0 +1,322 @@
+# backend/functions/recommendations/feature_index.py
+"""Nearest neighbours over cached audio features, answered locally.
+
+Every track users have played (``tracks/{id}``) or the genre index has
+posted gets an audio-feature vector. The vectors are scaled to [0, 1] and
+stored as uint8 rows in ``feature_index/{version}-part-{n}`` documents,
+about 20k tracks per document; ``feature_index/current`` names the version
+to read, so a rebuild never changes parts a reader may be loading.
+Instances load the parts in the background into a float32 matrix; a query
+is a brute-force squared-distance scan, which costs a few milliseconds per
+seed for a million tracks and makes no upstream calls.
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from ..clients import get_firestore
+from ..spotify.client import get_spotify_client
+from ..spotify.scheduler import BACKGROUND
+from .genre_index import GENRE_INDEX_COLLECTION
+
+FEATURE_INDEX_COLLECTION = 'feature_index'
+# Pointer document: {'version', 'parts', 'tracks'} of the complete build to read
+CURRENT_DOC = 'current'
+# (feature, low, high): values are clipped to the range and scaled to [0, 1]
+AUDIO_FEATURES = (
+    ('danceability', 0.0, 1.0),
+    ('energy', 0.0, 1.0),
+    ('valence', 0.0, 1.0),
+    ('acousticness', 0.0, 1.0),
+    ('instrumentalness', 0.0, 1.0),
+    ('speechiness', 0.0, 1.0),
+    ('liveness', 0.0, 1.0),
+    ('tempo', 40.0, 220.0),
+    ('loudness', -60.0, 0.0),
+)
+FEATURE_DIMENSIONS = len(AUDIO_FEATURES)
+# Rows per stored part; 20k ids plus uint8 vectors stay well under 1 MiB
+PART_SIZE = 20000
+# /audio-features takes up to 100 ids per call
+AUDIO_FEATURES_BATCH_SIZE = 100
+FEATURE_INDEX_TTL = 6 * 60 * 60
+
+
+def feature_vector(features):
+    """Scaled float32 vector for a Spotify audio-features object"""
+    return np.array([
+        (min(max(features.get(name) or 0.0, low), high) - low) / (high - low)
+        for name, low, high in AUDIO_FEATURES
+    ], dtype=np.float32)
+
+
+def quantize(matrix):
+    return np.rint(np.clip(matrix, 0.0, 1.0) * 255).astype(np.uint8)
+
+
+def dequantize(packed):
+    return packed.astype(np.float32) / 255
+
+
+class AudioFeatureIndex:
+    """Brute-force k-nearest-neighbour search over an (n, d) feature matrix.
+
+    Features are kept column-major, (d, n), so scoring every track against a
+    handful of seeds is one small matrix product over contiguous rows. Track
+    ids are held as a fixed-width bytes array plus a sorted copy, so mapping
+    ids to rows is a ``searchsorted`` rather than a million-entry dict.
+    """
+
+    def __init__(self, track_ids, matrix):
+        # Spotify ids are ASCII
+        self.track_ids = np.asarray(track_ids, dtype=np.bytes_)
+        self.columns = np.ascontiguousarray(np.asarray(matrix, dtype=np.float32).T)
+        self._order = np.argsort(self.track_ids, kind='stable')
+        self._sorted_ids = self.track_ids[self._order]
+        # ||x||^2 once; a query then only needs -2 x.q
+        self.norms = np.einsum('ij,ij->j', self.columns, self.columns)
+
+    def __len__(self):
+        return len(self.track_ids)
+
+    def rows_for(self, track_ids):
+        """Row number per track id, -1 for ids not in the index"""
+        keys = np.asarray(list(track_ids), dtype=np.bytes_)
+        if not len(self) or not len(keys):
+            return np.full(len(keys), -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self._sorted_ids, keys), len(self) - 1)
+        return np.where(self._sorted_ids[positions] == keys, self._order[positions], -1)
+
+    def track_id(self, row):
+        return self.track_ids[row].decode()
+
+    def vectors(self, rows):
+        """(len(rows), d) feature matrix for row numbers"""
+        return self.columns[:, rows].T
+
+    def nearest_rows(self, vectors, k, exclude=()):
+        """Per query vector, row numbers of its k nearest rows, closest first"""
+        # ||x - q||^2 less the per-query constant ||q||^2
+        distances = vectors @ self.columns
+        distances *= -2
+        distances += self.norms
+        if len(exclude):
+            distances[:, list(exclude)] = np.inf
+        k = min(k, len(self.track_ids) - len(exclude))
+        if k <= 0:
+            return [np.empty(0, dtype=np.int64) for _ in distances]
+        nearest = []
+        for row_distances in distances:
+            candidates = np.argpartition(row_distances, k - 1)[:k]
+            # Ties go to the lower row so results are deterministic
+            nearest.append(candidates[np.lexsort((candidates, row_distances[candidates]))])
+        return nearest
+
+    def nearest(self, seed_ids, k):
+        """Up to k track ids nearest the indexed seeds, taken from each seed in turn.
+
+        Seeds themselves are never returned; seeds missing from the index are
+        ignored, so no seed in the index means no neighbours.
+        """
+        seed_rows = [int(row) for row in self.rows_for(dict.fromkeys(seed_ids)) if row >= 0]
+        if not seed_rows:
+            return []
+        per_seed = self.nearest_rows(self.vectors(seed_rows), k, exclude=seed_rows)
+        picked = {}
+        for rank in range(k):
+            for rows in per_seed:
+                if rank < len(rows):
+                    picked.setdefault(int(rows[rank]), None)
+                if len(picked) == k:
+                    return [self.track_id(row) for row in picked]
+        return [self.track_id(row) for row in picked]
+
+
+def pack_parts(track_ids, matrix, part_size=PART_SIZE):
+    """Firestore part documents for an index: comma-joined ids and uint8 rows"""
+    packed = quantize(matrix)
+    return [
+        {
+            'ids': ','.join(track_ids[start:start + part_size]),
+            'vectors': packed[start:start + part_size].tobytes(),
+            'dimensions': FEATURE_DIMENSIONS,
+        }
+        for start in range(0, len(track_ids), part_size)
+    ]
+
+
+def unpack_parts(parts):
+    """(track_ids, float32 matrix) from stored part documents"""
+    track_ids, blocks = [], []
+    for part in parts:
+        ids = part['ids'].split(',') if part.get('ids') else []
+        rows = np.frombuffer(part['vectors'], dtype=np.uint8).reshape(len(ids), part['dimensions'])
+        track_ids.extend(ids)
+        blocks.append(rows)
+    if not blocks:
+        return [], np.empty((0, FEATURE_DIMENSIONS), dtype=np.float32)
+    return track_ids, dequantize(np.concatenate(blocks))
+
+
+def part_id(version, number):
+    return f"{version}-part-{number}"
+
+
+def load_feature_index(db_client):
+    """The stored index, or None when nothing has been built yet"""
+    collection = db_client.collection(FEATURE_INDEX_COLLECTION)
+    current = collection.document(CURRENT_DOC).get()
+    if not current.exists:
+        return None
+    pointer = current.to_dict()
+    refs = [collection.document(part_id(pointer['version'], n)) for n in range(pointer['parts'])]
+    docs = {doc.id: doc for doc in db_client.get_all(refs)}
+    parts = []
+    for ref in refs:
+        doc = docs.get(ref.id)
+        if doc is None or not doc.exists:
+            raise LookupError(f"Feature index part {ref.id} is missing")
+        parts.append(doc.to_dict())
+    track_ids, matrix = unpack_parts(parts)
+    return AudioFeatureIndex(track_ids, matrix) if track_ids else None
+
+
+def rebuild_feature_index(access_token, db_client=None, client=None, part_size=PART_SIZE):
+    """Index audio features for every played or genre-indexed track.
+
+    Vectors already stored are reused; only new track ids are fetched, 100
+    per ``/audio-features`` call. Tracks Spotify has no features for are left
+    out. Returns build stats.
+    """
+    client_db = db_client or get_firestore()
+    client = client or get_spotify_client()
+    headers = {"Authorization": f"Bearer {access_token}"}
+    started = time.perf_counter()
+
+    track_ids = {doc.id: None for doc in client_db.collection('tracks').select([]).stream()}
+    for doc in client_db.collection(GENRE_INDEX_COLLECTION).stream():
+        track_ids.update(dict.fromkeys((doc.to_dict() or {}).get('tracks') or {}))
+
+    known = load_feature_index(client_db)
+    known_rows = dict(zip(track_ids, known.rows_for(track_ids) if known is not None else []))
+    missing = [track_id for track_id in track_ids if known_rows.get(track_id, -1) < 0]
+
+    fetched, calls = {}, 0
+    for start in range(0, len(missing), AUDIO_FEATURES_BATCH_SIZE):
+        chunk = missing[start:start + AUDIO_FEATURES_BATCH_SIZE]
+        data = client.get_json(
+            "/audio-features", headers=headers, params={"ids": ",".join(chunk)}, priority=BACKGROUND
+        )
+        calls += 1
+        fetched.update(
+            (item['id'], item) for item in (data or {}).get('audio_features') or [] if item
+        )
+
+    kept = [track_id for track_id in track_ids if known_rows.get(track_id, -1) >= 0]
+    added = [track_id for track_id in missing if fetched.get(track_id)]
+    blocks = [np.empty((0, FEATURE_DIMENSIONS), dtype=np.float32)]
+    if kept:
+        blocks.append(known.vectors([known_rows[track_id] for track_id in kept]))
+    if added:
+        blocks.append(np.vstack([feature_vector(fetched[track_id]) for track_id in added]))
+    ids, matrix = kept + added, np.concatenate(blocks)
+
+    collection = client_db.collection(FEATURE_INDEX_COLLECTION)
+    previous = collection.document(CURRENT_DOC).get()
+    previous_version = previous.to_dict()['version'] if previous.exists else None
+    version = f"{int(time.time() * 1000)}-{uuid.uuid4().hex[:6]}"
+    parts = pack_parts(ids, matrix, part_size)
+    # One write per part: a batch of several would pass the 10 MiB request limit
+    for number, part in enumerate(parts):
+        collection.document(part_id(version, number)).set(part)
+    collection.document(CURRENT_DOC).set({'version': version, 'parts': len(parts), 'tracks': len(ids)})
+    # Older builds; the previous one stays for readers that are still loading it
+    for doc in collection.select([]).stream():
+        if doc.id != CURRENT_DOC and doc.id.rsplit('-part-', 1)[0] not in (version, previous_version):
+            doc.reference.delete()
+
+    return {
+        'tracks': len(ids),
+        'fetched': len(added),
+        'without_features': len(missing) - len(added),
+        'feature_calls': calls,
+        'parts': len(parts),
+        'version': version,
+        'elapsed_seconds': round(time.perf_counter() - started, 3),
+    }
+
+
+class FeatureIndexHandle:
+    """Periodically reloaded AudioFeatureIndex for one instance.
+
+    Loads run on a background thread and replace the index in one assignment,
+    so ``get`` never waits on Firestore: it returns the current index, or None
+    until the first load finishes, and starts a reload once the TTL passes.
+    Without a ``db_client`` the index is disabled and ``get`` returns None.
+    """
+
+    def __init__(self, db_client=None, ttl=FEATURE_INDEX_TTL, clock=time.time):
+        self.db = db_client
+        self.ttl = ttl
+        self.clock = clock
+        self._index = None
+        self._expires_at = 0
+        self._loader = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self.db is None:
+            return None
+        with self._lock:
+            if self.clock() >= self._expires_at and self._loader is None:
+                self._loader = threading.Thread(target=self._load, name="feature-index-load", daemon=True)
+                self._loader.start()
+            return self._index
+
+    def _load(self):
+        index = self._index
+        try:
+            index = load_feature_index(self.db)
+        except Exception as e:
+            logging.warning(f"Feature index load failed: {e}")
+        with self._lock:
+            self._index = index
+            self._expires_at = self.clock() + self.ttl
+            self._loader = None
+
+    def wait(self, timeout=None):
+        """Start a load if one is due, wait for it and return the index"""
+        self.get()
+        loader = self._loader
+        if loader is not None:
+            loader.join(timeout)
+        return self._index
+
+    def clear(self):
+        with self._lock:
+            self._expires_at = 0
+
+
+_handle = None
+_handle_lock = threading.Lock()
+
+
+def get_feature_index():
+    """Return the process-wide feature index handle.
+
+    Backed by the Firestore ``feature_index`` collection unless
+    SPOTIFY_FEATURE_INDEX=false, in which case it is disabled.
+    """
+    global _handle
+    if _handle is None:
+        with _handle_lock:
+            if _handle is None:
+                if os.getenv("SPOTIFY_FEATURE_INDEX", "true").lower() != "false":
+                    _handle = FeatureIndexHandle(get_firestore())
+                else:
+                    _handle = FeatureIndexHandle()
+    return _handle
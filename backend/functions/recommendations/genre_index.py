@@ -0,0 +1,486 @@
+# backend/functions/recommendations/genre_index.py
+"""Genre -> candidate track and artist ids, served without live genre searches.
+
+Each genre is one document in ``genre_index/{quoted genre}``::
+
+    {'genre': name,
+     'tracks': {track_id: [release_year, popularity]},
+     'artists': {artist_id: popularity},
+     'updated_at': timestamp}
+
+A track's display fields (TrackRecord.details) and popularity are stored
+once, in the shared ``tracks/{track_id}`` dictionary, so a hit is served
+without hydrating ids through ``/tracks``; only ids with no stored details
+are hydrated. Strategies ask the index first and only search live on a
+miss; what a live search returns is merged back into the genre's document
+on a background thread, off the request path. A scheduled rebuild
+re-harvests every known genre and files tracks under all of their artist's
+genres. Both trim each document to its most popular entries.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait as wait_for
+from datetime import datetime
+from urllib.parse import quote
+
+from google.api_core.exceptions import Conflict, FailedPrecondition
+from google.cloud import firestore
+
+from ..clients import get_firestore
+from ..spotify.artist_index import ArtistGenreIndex
+from ..spotify.client import get_spotify_client
+from ..spotify.scheduler import BACKGROUND
+from .track_record import TrackRecord
+
+GENRE_INDEX_COLLECTION = 'genre_index'
+# Genre documents change once a day at most; instances re-read them hourly
+GENRE_INDEX_TTL = 60 * 60
+MAX_INDEXED_TRACKS = 300
+MAX_INDEXED_ARTISTS = 200
+# Search page size used when harvesting a genre
+HARVEST_LIMIT = 50
+# Read-merge-write attempts per harvest when other harvests write in between
+HARVEST_ATTEMPTS = 3
+# Background threads writing harvests back, and how many may wait for them;
+# past that, harvests are dropped and the genre is searched live again
+HARVEST_WORKERS = 2
+MAX_PENDING_HARVESTS = 64
+# Firestore's limit on writes per commit
+MAX_BATCH_WRITES = 500
+
+
+def genre_doc_id(genre):
+    return quote(genre.lower(), safe='')
+
+
+def release_year(release_date):
+    year = (release_date or '')[:4]
+    return int(year) if year.isdigit() else 0
+
+
+def harvest_tracks(tracks):
+    """{track_id: [release_year, popularity]} for Spotify track objects"""
+    return {
+        track['id']: [
+            release_year((track.get('album') or {}).get('release_date')),
+            track.get('popularity', 0),
+        ]
+        for track in tracks if track and track.get('id')
+    }
+
+
+def compact_postings(tracks):
+    """Track postings without the details older documents stored inline"""
+    return {track_id: posting[:2] for track_id, posting in tracks.items()}
+
+
+def track_details(tracks):
+    """{track_id: TrackRecord} for Spotify track objects"""
+    return {
+        track['id']: TrackRecord.from_spotify(track)
+        for track in tracks if track and track.get('id')
+    }
+
+
+def store_track_details(db_client, records):
+    """Merge records' display fields and popularity into ``tracks/{track_id}``"""
+    records = list(records)
+    for start in range(0, len(records), MAX_BATCH_WRITES):
+        batch = db_client.batch()
+        for record in records[start:start + MAX_BATCH_WRITES]:
+            batch.set(
+                db_client.collection('tracks').document(record.id),
+                {**record.details(), 'popularity': record.popularity},
+                merge=True,
+            )
+        batch.commit()
+
+
+def record_from_doc(track_id, data):
+    """TrackRecord from a ``tracks`` document, or None when it lacks display fields.
+
+    Documents written only by listening ingest hold play metadata without
+    release dates or links; those ids still need hydrating.
+    """
+    if 'release_date' not in data:
+        return None
+    return TrackRecord.from_details(track_id, data.get('popularity', 0), data)
+
+
+def harvest_artists(artists):
+    """{artist_id: popularity} for Spotify artist objects"""
+    return {
+        artist['id']: artist.get('popularity', 0)
+        for artist in artists if artist and artist.get('id')
+    }
+
+
+class GenreEntry:
+    """One genre's postings, ranked by popularity (ties by id) when loaded"""
+
+    __slots__ = ('tracks', 'artists')
+
+    def __init__(self, tracks, artists):
+        # (track_id, release_year, popularity) and (artist_id, popularity)
+        self.tracks = sorted(
+            ((track_id, posting[0], posting[1]) for track_id, posting in tracks.items()),
+            key=lambda posting: (-posting[2], posting[0]),
+        )
+        self.artists = sorted(artists.items(), key=lambda posting: (-posting[1], posting[0]))
+
+    @classmethod
+    def from_doc(cls, data):
+        return cls(data.get('tracks') or {}, data.get('artists') or {})
+
+
+class GenreIndex:
+    """In-process view of the Firestore genre index.
+
+    ``load`` fetches every genre not held in memory with one ``get_all``, and
+    ``records`` does the same for the tracks it serves; entries, including
+    misses, are kept for ``ttl`` seconds. ``harvest`` only queues the write
+    back, which up to ``HARVEST_WORKERS`` threads perform. Without a
+    ``db_client`` the index is disabled: lookups always miss and harvests are
+    dropped, leaving the strategies on live search.
+    """
+
+    def __init__(self, db_client=None, ttl=GENRE_INDEX_TTL, clock=time.time,
+                 collection=GENRE_INDEX_COLLECTION, max_tracks=MAX_INDEXED_TRACKS,
+                 max_artists=MAX_INDEXED_ARTISTS):
+        self.db = db_client
+        self.ttl = ttl
+        self.clock = clock
+        self.collection = collection
+        self.max_tracks = max_tracks
+        self.max_artists = max_artists
+        self._entries = {}  # genre -> (expires_at, GenreEntry or None)
+        self._records = {}  # track_id -> (expires_at, TrackRecord or None)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pending = set()  # harvest futures not yet written
+        self.hits = 0
+        self.misses = 0
+        self.harvests = 0
+        self.dropped_harvests = 0
+
+    def _ref(self, genre):
+        return self.db.collection(self.collection).document(genre_doc_id(genre))
+
+    def is_loaded(self, genres):
+        """True when ``load(genres)`` would not read Firestore"""
+        if self.db is None:
+            return True
+        with self._lock:
+            return not _stale(self._entries, genres, self.clock())
+
+    def has_records(self, track_ids):
+        """True when ``records(track_ids)`` would not read Firestore"""
+        if self.db is None:
+            return True
+        with self._lock:
+            return not _stale(self._records, track_ids, self.clock())
+
+    def load(self, genres):
+        """Make sure every genre's document is in memory; failures count as misses"""
+        if self.db is None:
+            return
+        now = self.clock()
+        with self._lock:
+            missing = _stale(self._entries, genres, now)
+        if not missing:
+            return
+        try:
+            docs = {doc.id: doc for doc in self.db.get_all([self._ref(genre) for genre in missing])}
+        except Exception as e:
+            logging.warning(f"Genre index read failed: {e}")
+            return
+        with self._lock:
+            for genre in missing:
+                doc = docs.get(genre_doc_id(genre))
+                entry = GenreEntry.from_doc(doc.to_dict()) if doc is not None and doc.exists else None
+                self._entries[genre] = (now + self.ttl, entry)
+
+    def _entry(self, genre):
+        with self._lock:
+            cached = self._entries.get(genre)
+        return cached[1] if cached and cached[0] > self.clock() else None
+
+    def tracks(self, genre, limit, year=None):
+        """Most popular indexed track ids for a loaded genre, or None on a miss"""
+        entry = self._entry(genre)
+        track_ids = [
+            track_id for track_id, track_year, _ in (entry.tracks if entry else ())
+            if year is None or track_year == year
+        ][:limit]
+        self._count(track_ids)
+        return track_ids or None
+
+    def records(self, track_ids):
+        """{track_id: TrackRecord} for the ids whose display fields are stored.
+
+        Ids not held in memory are read from ``tracks`` with one ``get_all``;
+        ids missing from the result need hydrating.
+        """
+        if self.db is None or not track_ids:
+            return {}
+        now = self.clock()
+        with self._lock:
+            missing = _stale(self._records, track_ids, now)
+        if missing:
+            try:
+                docs = {
+                    doc.id: doc for doc in
+                    self.db.get_all([self.db.collection('tracks').document(i) for i in missing])
+                }
+            except Exception as e:
+                logging.warning(f"Genre index track read failed: {e}")
+                docs = {}
+            with self._lock:
+                for track_id in missing:
+                    doc = docs.get(track_id)
+                    exists = doc is not None and doc.exists
+                    record = record_from_doc(track_id, doc.to_dict() or {}) if exists else None
+                    self._records[track_id] = (now + self.ttl, record)
+        with self._lock:
+            cached = {track_id: self._records.get(track_id) for track_id in track_ids}
+        return {
+            track_id: entry[1] for track_id, entry in cached.items()
+            if entry is not None and entry[1] is not None
+        }
+
+    def artists(self, genre, limit, min_popularity=0, max_popularity=100):
+        """Most popular indexed artist ids within a popularity band, or None on a miss"""
+        entry = self._entry(genre)
+        artist_ids = [
+            artist_id for artist_id, popularity in (entry.artists if entry else ())
+            if min_popularity <= popularity <= max_popularity
+        ][:limit]
+        self._count(artist_ids)
+        return artist_ids or None
+
+    def _count(self, found):
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def harvest(self, genre, tracks=(), artists=()):
+        """Queue live search results to be merged into a genre's document; never blocks.
+
+        On a background thread the tracks' details are stored, then the
+        document is read, merged, trimmed to ``max_tracks`` and
+        ``max_artists`` and written back only if it has not changed in
+        between, retrying when a concurrent harvest got there first.
+        """
+        postings = {'tracks': harvest_tracks(tracks), 'artists': harvest_artists(artists)}
+        if self.db is None or not (postings['tracks'] or postings['artists']):
+            return
+        records = track_details(tracks)
+        with self._lock:
+            now = self.clock()
+            # This instance serves the searched tracks without reading them back
+            for track_id, record in records.items():
+                self._records[track_id] = (now + self.ttl, record)
+            if len(self._pending) >= MAX_PENDING_HARVESTS:
+                self.dropped_harvests += 1
+                return
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=HARVEST_WORKERS, thread_name_prefix="genre-harvest"
+                )
+            future = self._executor.submit(self._write_harvest, genre, postings, records)
+            self._pending.add(future)
+        future.add_done_callback(self._harvest_done)
+
+    def _harvest_done(self, future):
+        with self._lock:
+            self._pending.discard(future)
+
+    def wait(self, timeout=None):
+        """Block until the harvests queued so far are written"""
+        with self._lock:
+            pending = list(self._pending)
+        wait_for(pending, timeout)
+
+    def _write_harvest(self, genre, postings, records):
+        try:
+            if records:
+                store_track_details(self.db, records.values())
+            merged = self._merge(genre, postings)
+        except Exception as e:
+            logging.warning(f"Genre index harvest failed for {genre}: {e}")
+            return
+        if merged is None:
+            logging.warning(f"Genre index harvest for {genre} kept losing to concurrent writes")
+            return
+        with self._lock:
+            self.harvests += 1
+            self._entries[genre] = (
+                self.clock() + self.ttl, GenreEntry(merged['tracks'], merged['artists'])
+            )
+
+    def _merge(self, genre, postings):
+        """Write the genre's postings merged with ``postings`` and trimmed; None if every attempt lost"""
+        ref = self._ref(genre)
+        for _ in range(HARVEST_ATTEMPTS):
+            doc = ref.get()
+            data = (doc.to_dict() or {}) if doc.exists else {}
+            merged = {
+                'tracks': _trim(
+                    {**compact_postings(data.get('tracks') or {}), **postings['tracks']},
+                    self.max_tracks, lambda posting: posting[1],
+                ),
+                'artists': _trim(
+                    {**(data.get('artists') or {}), **postings['artists']},
+                    self.max_artists, lambda popularity: popularity,
+                ),
+            }
+            fields = {'genre': genre, **merged, 'updated_at': firestore.SERVER_TIMESTAMP}
+            try:
+                if doc.exists:
+                    ref.update(fields, option=self.db.write_option(last_update_time=doc.update_time))
+                else:
+                    ref.create(fields)
+            except (FailedPrecondition, Conflict):
+                continue
+            return merged
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._records.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'harvests': self.harvests,
+                'pending_harvests': len(self._pending),
+                'dropped_harvests': self.dropped_harvests,
+                'genres': len(self._entries),
+            }
+
+
+def _stale(entries, keys, now):
+    """Keys with no entry, or an expired one, in {key: (expires_at, value)}"""
+    return [key for key in dict.fromkeys(keys) if key not in entries or entries[key][0] <= now]
+
+
+def _trim(postings, size, popularity):
+    ranked = sorted(postings.items(), key=lambda item: (-popularity(item[1]), item[0]))
+    return dict(ranked[:size])
+
+
+def rebuild_genre_index(access_token, genres=None, db_client=None, client=None, artist_index=None,
+                        max_tracks=MAX_INDEXED_TRACKS, max_artists=MAX_INDEXED_ARTISTS):
+    """Re-harvest every known genre (or ``genres``) and rewrite its document.
+
+    For each genre this makes three searches: tracks, this year's tracks and
+    artists. Every harvested track is also filed under the other indexed
+    genres of its primary artist, whose genres come from ``/artists?ids=`` in
+    chunks of 50. Harvested tracks' details are stored once in ``tracks``.
+    Existing postings are kept, and each document is trimmed to the most
+    popular ``max_tracks`` tracks and ``max_artists`` artists.
+    """
+    client_db = db_client or get_firestore()
+    client = client or get_spotify_client()
+    artist_index = artist_index or ArtistGenreIndex(client=client)
+    headers = {"Authorization": f"Bearer {access_token}"}
+    collection = client_db.collection(GENRE_INDEX_COLLECTION)
+    started = time.perf_counter()
+
+    existing = {}
+    for doc in collection.stream():
+        data = doc.to_dict() or {}
+        if data.get('genre'):
+            existing[data['genre']] = data
+    genres = list(dict.fromkeys(genres or existing))
+    known = set(genres)
+    stats = {'genres': len(genres), 'searches': 0, 'search_failures': 0, 'cross_filed': 0}
+
+    def search(query, item_type):
+        stats['searches'] += 1
+        data = client.get_json(
+            "/search",
+            headers=headers,
+            params={"q": query, "type": item_type, "limit": HARVEST_LIMIT, "market": "US"},
+            priority=BACKGROUND,
+        )
+        if data is None:
+            stats['search_failures'] += 1
+        return (data or {}).get(f"{item_type}s", {}).get('items', [])
+
+    year = datetime.now().year
+    harvested = {}
+    for genre in genres:
+        tracks = search(f"genre:{genre}", "track") + search(f"genre:{genre} year:{year}", "track")
+        artists = search(f"genre:{genre}", "artist")
+        artist_index.seed(artists)
+        harvested[genre] = (tracks, artists)
+
+    postings = {
+        genre: {
+            'tracks': compact_postings((existing.get(genre) or {}).get('tracks') or {}),
+            'artists': dict((existing.get(genre) or {}).get('artists') or {}),
+        }
+        for genre in genres
+    }
+    records = {}
+    primary_artists = {}
+    for genre, (tracks, artists) in harvested.items():
+        records.update(track_details(tracks))
+        postings[genre]['tracks'].update(harvest_tracks(tracks))
+        postings[genre]['artists'].update(harvest_artists(artists))
+        for track in tracks:
+            if track and track.get('artists'):
+                primary_artists.setdefault(track['artists'][0].get('id'), []).append(track)
+    primary_artists.pop(None, None)
+
+    artist_genres = artist_index.genres(list(primary_artists), headers) if primary_artists else {}
+    for artist_id, tracks in primary_artists.items():
+        for genre in known.intersection(artist_genres.get(artist_id, ())):
+            for track_id, posting in harvest_tracks(tracks).items():
+                if track_id not in postings[genre]['tracks']:
+                    stats['cross_filed'] += 1
+                postings[genre]['tracks'][track_id] = posting
+
+    store_track_details(client_db, records.values())
+    for start in range(0, len(genres), MAX_BATCH_WRITES):
+        batch = client_db.batch()
+        for genre in genres[start:start + MAX_BATCH_WRITES]:
+            batch.set(collection.document(genre_doc_id(genre)), {
+                'genre': genre,
+                'tracks': _trim(postings[genre]['tracks'], max_tracks, lambda posting: posting[1]),
+                'artists': _trim(postings[genre]['artists'], max_artists, lambda popularity: popularity),
+                'updated_at': firestore.SERVER_TIMESTAMP,
+            })
+        batch.commit()
+
+    stats['elapsed_seconds'] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_genre_index():
+    """Return the process-wide genre index.
+
+    Backed by the Firestore ``genre_index`` collection unless
+    SPOTIFY_GENRE_INDEX=false, in which case it is disabled.
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                if os.getenv("SPOTIFY_GENRE_INDEX", "true").lower() != "false":
+                    _index = GenreIndex(get_firestore())
+                else:
+                    _index = GenreIndex()
+    return _index
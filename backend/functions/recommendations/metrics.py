@@ -0,0 +1,140 @@
+# backend/functions/recommendations/metrics.py
+"""Write-behind buffer for per-request recommendation metrics.
+
+Requests append a metrics dict and return; a background thread writes
+them to ``metrics/{user_id}/recommendations`` in batched commits once
+``max_batch`` entries are waiting or ``flush_interval`` seconds have
+passed, and once more when the process exits. Past ``max_pending``
+queued entries the oldest are dropped, so a Firestore outage costs
+metrics, never memory or latency.
+"""
+import atexit
+import logging
+import threading
+from collections import deque
+
+from ..clients import get_firestore
+
+METRICS_COLLECTION = 'metrics'
+METRICS_FLUSH_INTERVAL = 10
+METRICS_MAX_BATCH = 100
+METRICS_MAX_PENDING = 5000
+# Firestore's limit on writes per commit
+MAX_BATCH_WRITES = 500
+
+
+class MetricsBuffer:
+    """Buffers metrics in memory and writes them off the request path"""
+
+    def __init__(self, db_client, flush_interval=METRICS_FLUSH_INTERVAL,
+                 max_batch=METRICS_MAX_BATCH, max_pending=METRICS_MAX_PENDING,
+                 collection=METRICS_COLLECTION):
+        self.db = db_client
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.collection = collection
+        self._pending = deque()  # (user_id, metrics)
+        self._lock = threading.Lock()
+        # Serializes flushes so a shutdown flush waits for one in flight
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self.added = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.failed_flushes = 0
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name="metrics-flush", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def add(self, user_id, metrics):
+        """Queue one metrics document; never blocks on Firestore"""
+        with self._lock:
+            if self._stopped.is_set():
+                self.dropped += 1
+                return
+            if self._thread is None:
+                self._start()
+            self._pending.append((user_id, metrics))
+            self.added += 1
+            if len(self._pending) > self.max_pending:
+                self._pending.popleft()
+                self.dropped += 1
+            if len(self._pending) >= self.max_batch:
+                self._wake.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Write everything queued so far; returns the number of entries written"""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    count = min(len(self._pending), MAX_BATCH_WRITES)
+                    entries = [self._pending.popleft() for _ in range(count)]
+                if not entries:
+                    return written
+                batch = self.db.batch()
+                for user_id, metrics in entries:
+                    ref = (self.db.collection(self.collection).document(user_id)
+                           .collection('recommendations').document())
+                    batch.set(ref, metrics)
+                try:
+                    batch.commit()
+                except Exception as e:
+                    logging.warning(f"Metrics flush of {len(entries)} entries failed: {e}")
+                    self._requeue(entries)
+                    return written
+                written += len(entries)
+                with self._lock:
+                    self.flushed += len(entries)
+
+    def _requeue(self, entries):
+        """Put a failed batch back in front, keeping at most max_pending entries"""
+        with self._lock:
+            self.failed_flushes += 1
+            self._pending.extendleft(reversed(entries))
+            while len(self._pending) > self.max_pending:
+                self._pending.popleft()
+                self.dropped += 1
+
+    def close(self, timeout=5):
+        """Stop the flush thread and write what is left"""
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': len(self._pending),
+                'added': self.added,
+                'flushed': self.flushed,
+                'dropped': self.dropped,
+                'failed_flushes': self.failed_flushes,
+            }
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_metrics_buffer():
+    """Return the process-wide MetricsBuffer, writing through the shared Firestore client"""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = MetricsBuffer(get_firestore())
+    return _buffer
@@ -0,0 +1,133 @@
+# backend/functions/recommendations/precompute.py
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import hashlib
+import logging
+import time
+import pytz
+from ..auth.token_manager import (
+    ACTIVE_USER_DAYS,
+    app_headers as get_app_headers,
+    get_access_token,
+    is_active,
+)
+from ..clients import get_firestore
+from ..spotify.batch_loader import BatchLoader, authorization
+from ..spotify.client import get_spotify_client
+
+
+def shard_for(user_id, shards):
+    """Stable shard index for a user; the same in every process, unlike hash()"""
+    digest = hashlib.sha1(user_id.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % shards
+
+
+def catalog_key(path, params=None):
+    return path, tuple(sorted((params or {}).items()))
+
+
+class SharedCatalogLoader(BatchLoader):
+    """BatchLoader over catalog GETs that counts how many its catalog cache answered.
+
+    Lookups go out under ``app_headers()`` when it returns headers. Without
+    an app token each user's lookups run under their own token and are only
+    shared with loads under the same token.
+    """
+
+    def __init__(self, client, app_headers=None):
+        # A failed lookup (None) is not kept, so a later user retries it
+        super().__init__(self._fetch, max_batch=1, window=0, memoize=True, memoize_none=False,
+                         context_key=authorization)
+        self.client = client
+        self.app_headers = app_headers
+        self.cache_hits = 0
+
+    def load(self, key, context=None):
+        headers = self.app_headers() if self.app_headers is not None else None
+        return super().load(key, headers or context)
+
+    def _fetch(self, keys, headers):
+        results = {}
+        for key in keys:
+            results[key], hit = self.client.get_json_cached(
+                key[0], headers=headers, params=dict(key[1]) or None
+            )
+            if hit:
+                with self._lock:
+                    self.cache_hits += 1
+        return results
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats['cache_hits'] = self.cache_hits
+        return stats
+
+
+def shared_catalog_loader(client=None, app_headers=get_app_headers):
+    """Run-scoped memo for user-agnostic catalog GETs (search, related artists, top tracks).
+
+    Every user's recommender in a run loads through it under the app token,
+    so a lookup two users need is made once even when both ask at the same
+    moment.
+    """
+    return SharedCatalogLoader(client or get_spotify_client(), app_headers)
+
+
+def precompute_recommendations(generate, shard=0, shards=1, max_workers=8, db_client=None,
+                               token_fn=None, catalog=None, active_days=ACTIVE_USER_DAYS):
+    """Generate and store recommendations for every active user in one shard.
+
+    Active users are those who logged in (``last_login``) or listened
+    (``listening_cursor``) within ``active_days``. ``generate(user_id,
+    access_token, catalog)`` builds and stores one user's list; ``catalog`` is
+    the shared_catalog_loader for the run. Users run on a bounded pool.
+    Returns per-shard throughput stats and how many upstream catalog calls
+    sharing and the catalog cache saved.
+    """
+    client_db = db_client or get_firestore()
+    token_fn = token_fn or get_access_token
+    catalog = catalog or shared_catalog_loader()
+    started = time.perf_counter()
+    stats = {
+        'shard': shard, 'shards': shards, 'users_scanned': 0, 'users': 0,
+        'generated': 0, 'skipped_inactive': 0, 'skipped_no_token': 0, 'failures': 0,
+    }
+
+    since = datetime.now(pytz.UTC) - timedelta(days=active_days)
+    user_ids = []
+    users = client_db.collection('users').select(['last_login', 'listening_cursor'])
+    for user_doc in users.stream():
+        stats['users_scanned'] += 1
+        if shard_for(user_doc.id, shards) != shard:
+            continue
+        if not is_active(user_doc.to_dict() or {}, since):
+            stats['skipped_inactive'] += 1
+            continue
+        user_ids.append(user_doc.id)
+    stats['users'] = len(user_ids)
+
+    def run(user_id):
+        try:
+            access_token = token_fn(user_id)
+            if not access_token:
+                return 'skipped_no_token'
+            generate(user_id, access_token, catalog)
+            return 'generated'
+        except Exception as e:
+            logging.error(f"Error precomputing recommendations for {user_id}: {str(e)}")
+            return 'failures'
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="precompute") as pool:
+        for outcome in pool.map(run, user_ids):
+            stats[outcome] += 1
+
+    elapsed = time.perf_counter() - started
+    loads = catalog.stats()
+    stats['elapsed_seconds'] = round(elapsed, 3)
+    stats['users_per_second'] = round(stats['generated'] / elapsed, 1) if elapsed else 0
+    stats['catalog_lookups'] = loads['requested']
+    stats['catalog_fetches'] = loads['batches']
+    stats['catalog_cache_hits'] = loads['cache_hits']
+    stats['upstream_calls_saved'] = loads['deduped'] + loads['cache_hits']
+    return stats
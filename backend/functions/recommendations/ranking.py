@@ -0,0 +1,167 @@
+# backend/functions/recommendations/ranking.py
+"""Popularity-stratified top-k selection over TrackRecords.
+
+Candidates rank by (popularity, release_date), highest first, ties going to
+the earlier candidate. A single pass keeps one bounded min-heap per
+popularity stratum plus one for the overall top-k, so picking 20 tracks out
+of n costs O(n log k) rather than a full sort.
+"""
+import heapq
+import logging
+import random
+from collections import Counter
+
+# (stratum, minimum popularity, tracks guaranteed from it), highest first
+POPULARITY_QUOTAS = (
+    ('high', 70, 4),
+    ('medium', 40, 4),
+    ('low', 0, 2),
+)
+# Diversity re-ranking looks at this many ranked candidates per final slot
+POOL_FACTOR = 2
+# MMR trade-off: 1.0 is pure rank order, 0.0 pure novelty
+DIVERSITY_LAMBDA = 0.7
+MAX_TRACKS_PER_ARTIST = 2
+MAX_TRACKS_PER_GENRE = 6
+
+
+def _stratum(popularity, quotas):
+    for index, (_, floor, _) in enumerate(quotas):
+        if popularity >= floor:
+            return index
+    return len(quotas) - 1
+
+
+def _push(heap, size, entry):
+    if len(heap) < size:
+        heapq.heappush(heap, entry)
+    elif entry > heap[0]:
+        heapq.heapreplace(heap, entry)
+
+
+def select_ranked(tracks, target_size=20, quotas=POPULARITY_QUOTAS):
+    """Fill each stratum's quota with its best tracks, then top up with the best of the rest.
+
+    Returns the selection in rank order: quota picks stratum by stratum, then
+    the top-up.
+    """
+    strata = [[] for _ in quotas]
+    overall = []
+    for index, track in enumerate(tracks):
+        # -index makes earlier candidates win ties, like a stable sort
+        entry = (track.popularity, track.release_date, -index)
+        stratum = _stratum(track.popularity, quotas)
+        _push(strata[stratum], quotas[stratum][2], entry)
+        _push(overall, target_size, entry)
+
+    picked = set()
+    selection = []
+    for heap in strata:
+        for entry in sorted(heap, reverse=True):
+            picked.add(entry[2])
+            selection.append(tracks[-entry[2]])
+    # The overall top-k always holds enough unpicked tracks to reach target_size
+    for entry in sorted(overall, reverse=True):
+        if len(selection) >= target_size:
+            break
+        if entry[2] not in picked:
+            selection.append(tracks[-entry[2]])
+    return selection[:target_size]
+
+
+def track_genres(track, artist_genres):
+    """Genres of a track's primary artist"""
+    return frozenset(artist_genres.get(track.artist_ids[0], ())) if track.artist_ids else frozenset()
+
+
+def diversify(tracks, artist_genres, target_size=20, diversity=DIVERSITY_LAMBDA,
+              max_per_artist=MAX_TRACKS_PER_ARTIST, max_per_genre=MAX_TRACKS_PER_GENRE, quotas=None):
+    """Maximal-marginal-relevance re-rank of a ranked list under artist and genre caps.
+
+    Relevance falls linearly with the input position; similarity to the
+    selection is the largest genre Jaccard overlap with an already picked
+    track (1.0 for the same primary artist). Candidates that would exceed a
+    cap are skipped; if the caps leave slots empty they are filled in rank
+    order so the list still reaches ``target_size``.
+
+    With ``quotas`` (see select_ranked) every popularity stratum still gets
+    its guaranteed tracks: once the open slots only just cover the strata
+    short of their quota, candidates are drawn from those strata alone, and
+    the final fill serves them first even past the caps.
+    """
+    count = len(tracks)
+    genres = [track_genres(track, artist_genres) for track in tracks]
+    strata = [_stratum(track.popularity, quotas) if quotas else 0 for track in tracks]
+    available = Counter(strata)
+    owed = Counter({
+        stratum: min(quota, available[stratum]) for stratum, (_, _, quota) in enumerate(quotas or ())
+    })
+    artist_counts, genre_counts = Counter(), Counter()
+    best_similarity = [0.0] * count
+    remaining = set(range(count))
+    chosen = []
+
+    while remaining and len(chosen) < target_size:
+        restricted = sum(owed.values()) >= target_size - len(chosen)
+        best, best_score = None, None
+        for i in remaining:
+            if restricted and owed[strata[i]] <= 0:
+                continue
+            artist = tracks[i].primary_artist
+            if artist_counts[artist] >= max_per_artist:
+                continue
+            if any(genre_counts[genre] >= max_per_genre for genre in genres[i]):
+                continue
+            score = diversity * (1 - i / count) - (1 - diversity) * best_similarity[i]
+            if best_score is None or score > best_score or (score == best_score and i < best):
+                best, best_score = i, score
+        if best is None:
+            break
+        remaining.discard(best)
+        chosen.append(best)
+        if owed[strata[best]] > 0:
+            owed[strata[best]] -= 1
+        artist_counts[tracks[best].primary_artist] += 1
+        genre_counts.update(genres[best])
+        # Only the newly picked track can raise a candidate's similarity
+        for i in remaining:
+            if tracks[i].primary_artist == tracks[best].primary_artist:
+                similarity = 1.0
+            elif genres[i] and genres[best]:
+                similarity = len(genres[i] & genres[best]) / len(genres[i] | genres[best])
+            else:
+                similarity = 0.0
+            if similarity > best_similarity[i]:
+                best_similarity[i] = similarity
+
+    fill = []
+    for i in sorted(remaining):
+        if owed[strata[i]] > 0:
+            owed[strata[i]] -= 1
+            fill.append(i)
+    fill += [i for i in sorted(remaining) if i not in fill]
+    chosen += fill[:target_size - len(chosen)]
+    return [tracks[i] for i in chosen]
+
+
+def rank_recommendations(tracks, target_size=20, seed=None, quotas=POPULARITY_QUOTAS, genre_lookup=None):
+    """Select with select_ranked, then shuffle; a fixed seed makes the order reproducible.
+
+    With ``genre_lookup`` (artist ids -> {artist_id: genres}) the selection is
+    drawn from a larger ranked pool by diversify, under the same quotas, so
+    only the pool's primary artists need genres. If the lookup fails the
+    plain ranked selection is used.
+    """
+    selection = None
+    if genre_lookup is not None:
+        pool = select_ranked(tracks, target_size * POOL_FACTOR, quotas)
+        try:
+            artist_genres = genre_lookup([track.artist_ids[0] for track in pool if track.artist_ids])
+        except Exception as e:
+            logging.warning(f"Genre lookup for diversity failed, ranking without it: {e}")
+        else:
+            selection = diversify(pool, artist_genres, target_size, quotas=quotas)
+    if selection is None:
+        selection = select_ranked(tracks, target_size, quotas)
+    random.Random(seed).shuffle(selection)
+    return selection
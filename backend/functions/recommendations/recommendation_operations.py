@@ -1,13 +1,16 @@
 # backend/functions/recommendations/recommendation_operations.py
-from google.cloud import firestore
-import requests
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+import os
+from ..clients import get_firestore
+from ..spotify.client import get_spotify_client
+from .track_record import TrackRecord
 
-db = firestore.Client()
+# How long a materialized recommendations list is served without regenerating
+RECOMMENDATIONS_TTL = timedelta(hours=float(os.getenv("RECOMMENDATIONS_TTL_HOURS", "24")))
 
 def get_user_top_items(access_token, item_type='tracks', limit=5):
-    response = requests.get(
-        f'https://api.spotify.com/v1/me/top/{item_type}',
+    response = get_spotify_client().get(
+        f'/me/top/{item_type}',
         headers={'Authorization': f'Bearer {access_token}'},
         params={'limit': limit, 'time_range': 'medium_term'}
     )
@@ -22,30 +25,47 @@ def get_spotify_recommendations(access_token, seed_tracks, seed_artists):
         'target_popularity': 70
     }
     
-    response = requests.get(
-        'https://api.spotify.com/v1/recommendations',
+    response = get_spotify_client().get(
+        '/recommendations',
         headers={'Authorization': f'Bearer {access_token}'},
         params=params
     )
     return response.json()['tracks'] if response.ok else []
 
-def process_recommendations(user_id, tracks_data):
-    recommendations_ref = db.collection('users').document(user_id)\
-                          .collection('recommendations').document('current')
-    
-    recommendations = [{
-        'id': track['id'],
-        'name': track['name'],
-        'artists': [artist['name'] for artist in track['artists']],
-        'album': track['album']['name'],
-        'preview_url': track['preview_url'],
-        'image_url': track['album']['images'][0]['url'] if track['album']['images'] else None
-    } for track in tracks_data]
-    
-    recommendations_ref.set({
+def _current_ref(user_id, db_client=None):
+    return (db_client or get_firestore()).collection('users').document(user_id)\
+           .collection('recommendations').document('current')
+
+def store_recommendations(user_id, tracks, db_client=None, ttl=RECOMMENDATIONS_TTL):
+    """Materialize TrackRecords as the user's current list; returns the stored dicts"""
+    now = datetime.now(timezone.utc)
+    recommendations = [track.to_dict() for track in tracks]
+    _current_ref(user_id, db_client).set({
         'tracks': recommendations,
-        'generated_at': datetime.now(),
-        'expires_at': datetime.now() + timedelta(hours=24)
+        'generated_at': now,
+        'expires_at': now + ttl
     })
-    
-    return recommendations
\ No newline at end of file
+    return recommendations
+
+def load_recommendations(user_id, db_client=None):
+    """The materialized list with its age, or None when nothing is stored"""
+    doc = _current_ref(user_id, db_client).get()
+    data = doc.to_dict() if doc.exists else None
+    if not data or not data.get('tracks'):
+        return None
+    now = datetime.now(timezone.utc)
+    # Lists written before timestamps were UTC-aware hold naive UTC times
+    generated_at = data.get('generated_at') or now
+    expires_at = data.get('expires_at') or now
+    if generated_at.tzinfo is None:
+        generated_at = generated_at.replace(tzinfo=timezone.utc)
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    return {
+        'tracks': data['tracks'],
+        'age_seconds': max(int((now - generated_at).total_seconds()), 0),
+        'stale': expires_at <= now
+    }
+
+def process_recommendations(user_id, tracks_data):
+    return store_recommendations(user_id, [TrackRecord.from_spotify(track) for track in tracks_data])
@@ -0,0 +1,104 @@
+# backend/functions/recommendations/track_record.py
+"""Compact track record shared by the recommendation pipeline.
+
+Spotify track JSON is parsed once into a TrackRecord; candidate generation,
+de-duplication, ranking and metrics all read its attributes, and to_dict()
+produces the response/Firestore shape at the edge.
+"""
+
+
+class TrackRecord:
+    """A recommendation candidate. Equal and hashed by Spotify track id."""
+
+    __slots__ = (
+        'id', 'name', 'artists', 'artist_ids', 'album', 'image_url',
+        'preview_url', 'external_url', 'popularity', 'release_date',
+    )
+
+    def __init__(self, id, name, artists=(), artist_ids=(), album=None, image_url=None,
+                 preview_url=None, external_url=None, popularity=0, release_date=''):
+        self.id = id
+        self.name = name
+        self.artists = artists
+        self.artist_ids = artist_ids
+        self.album = album
+        self.image_url = image_url
+        self.preview_url = preview_url
+        self.external_url = external_url
+        self.popularity = popularity
+        self.release_date = release_date
+
+    @classmethod
+    def from_spotify(cls, track):
+        """Parse a Web API track object"""
+        album = track.get('album') or {}
+        images = album.get('images') or []
+        artists = track.get('artists') or []
+        return cls(
+            track['id'],
+            track.get('name'),
+            tuple([artist.get('name') for artist in artists]),
+            tuple([artist.get('id') for artist in artists]),
+            album.get('name'),
+            images[0]['url'] if images else None,
+            track.get('preview_url'),
+            (track.get('external_urls') or {}).get('spotify'),
+            track.get('popularity', 0),
+            album.get('release_date') or '',
+        )
+
+    @classmethod
+    def from_details(cls, id, popularity, details):
+        """Rebuild a record from its id, popularity and details()"""
+        return cls(
+            id,
+            details.get('name'),
+            tuple(details.get('artists') or ()),
+            tuple(details.get('artist_ids') or ()),
+            details.get('album'),
+            details.get('image_url'),
+            details.get('preview_url'),
+            details.get('external_url'),
+            popularity,
+            details.get('release_date') or '',
+        )
+
+    def details(self):
+        """Display fields kept alongside an id and popularity, e.g. in the tracks dictionary"""
+        return {
+            'name': self.name,
+            'artists': list(self.artists),
+            'artist_ids': list(self.artist_ids),
+            'album': self.album,
+            'image_url': self.image_url,
+            'preview_url': self.preview_url,
+            'external_url': self.external_url,
+            'release_date': self.release_date,
+        }
+
+    @property
+    def primary_artist(self):
+        return self.artists[0] if self.artists else None
+
+    def to_dict(self):
+        """JSON-ready dict in the shape the frontend reads"""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'artists': list(self.artists),
+            'album': self.album,
+            'image_url': self.image_url,
+            'preview_url': self.preview_url,
+            'external_url': self.external_url,
+            'popularity': self.popularity,
+            'release_date': self.release_date,
+        }
+
+    def __eq__(self, other):
+        return isinstance(other, TrackRecord) and self.id == other.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return f"TrackRecord({self.id!r}, {self.name!r})"
@@ -0,0 +1,10 @@
+from ..lazy import lazy_exports
+
+__getattr__ = lazy_exports(__name__, (
+    'client',
+    'cache',
+    'shared_cache',
+    'scheduler',
+    'batch_loader',
+    'artist_index',
+))
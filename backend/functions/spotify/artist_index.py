@@ -0,0 +1,129 @@
+# backend/functions/spotify/artist_index.py
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from .batch_loader import MAX_IDS_PER_CALL, BatchLoader, authorization, multi_id_fetcher
+from .client import get_spotify_client
+
+ARTISTS_BATCH_SIZE = MAX_IDS_PER_CALL
+# Genres change rarely; a day matches the related-artists catalog TTL
+ARTIST_GENRES_TTL = 24 * 60 * 60
+DEFAULT_MAX_ARTISTS = int(os.getenv("SPOTIFY_ARTIST_INDEX_SIZE", "50000"))
+
+
+class ArtistGenreIndex:
+    """In-process artist id -> genres index, filled in bulk.
+
+    Full artist objects the recommender already fetched (top artists, related
+    artists, artist searches) are recorded for free via ``seed``; ``genres``
+    resolves whatever is still unknown through ``/artists?ids=`` in chunks of
+    50, coalesced across concurrent requests so an artist two users need at
+    once is fetched once. Entries expire after ``ttl`` and are evicted
+    least-recently-used past ``max_entries``.
+
+    Those fetches go out under ``app_headers()`` (an app token) when it
+    returns headers; otherwise each caller's own headers are used and only
+    lookups under the same token are coalesced, so one user's ids are never
+    fetched with another user's token.
+    """
+
+    def __init__(self, client=None, ttl=ARTIST_GENRES_TTL, max_entries=None, clock=time.time,
+                 app_headers=None):
+        self.client = client
+        self.app_headers = app_headers
+        self.ttl = ttl
+        self.max_entries = max_entries or DEFAULT_MAX_ARTISTS
+        self.clock = clock
+        self._entries = OrderedDict()  # artist id -> (expires_at, genres)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.seeded = 0
+        self.upstream_calls = 0
+        self._loader = BatchLoader(self._fetch, max_batch=ARTISTS_BATCH_SIZE, context_key=authorization)
+
+    def _put(self, artist_id, genres, now):
+        self._entries[artist_id] = (now + self.ttl, tuple(genres))
+        self._entries.move_to_end(artist_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def seed(self, artists):
+        """Record genres from full artist objects already in hand"""
+        now = self.clock()
+        with self._lock:
+            for artist in artists:
+                if artist and artist.get('id') and 'genres' in artist:
+                    self._put(artist['id'], artist['genres'], now)
+                    self.seeded += 1
+
+    def cached(self, artist_ids):
+        """Return ({artist_id: genres} for fresh entries, [ids still unknown])"""
+        now = self.clock()
+        found, missing = {}, []
+        with self._lock:
+            for artist_id in dict.fromkeys(artist_ids):
+                entry = self._entries.get(artist_id)
+                if entry is not None and entry[0] > now:
+                    self._entries.move_to_end(artist_id)
+                    found[artist_id] = entry[1]
+                    self.hits += 1
+                else:
+                    missing.append(artist_id)
+                    self.misses += 1
+        return found, missing
+
+    def _fetch(self, artist_ids, headers):
+        with self._lock:
+            self.upstream_calls += 1
+        artists = multi_id_fetcher(self.client or get_spotify_client(), "/artists", "artists")(
+            artist_ids, headers
+        )
+        now = self.clock()
+        with self._lock:
+            for artist_id, artist in artists.items():
+                self._put(artist_id, artist.get('genres', []), now)
+        return artists
+
+    def genres(self, artist_ids, headers):
+        """{artist_id: genres} for every id, fetching unknown ids 50 at a time.
+
+        Ids the upstream call fails for map to no genres and are not cached.
+        """
+        found, missing = self.cached(artist_ids)
+        if missing:
+            headers = (self.app_headers() if self.app_headers is not None else None) or headers
+            for artist_id, artist in self._loader.load_many(missing, headers).items():
+                found[artist_id] = tuple((artist or {}).get('genres', []))
+        return found
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'seeded': self.seeded,
+                'upstream_calls': self.upstream_calls,
+                'entries': len(self._entries),
+            }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_artist_genre_index():
+    """Return the process-wide artist genre index, fetching under the app token"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                from ..auth.token_manager import app_headers
+                _index = ArtistGenreIndex(app_headers=app_headers)
+    return _index
@@ -0,0 +1,143 @@
+# backend/functions/spotify/async_client.py
+import asyncio
+import os
+import threading
+import aiohttp
+
+from .cache import get_catalog_cache
+from .scheduler import INTERACTIVE, BACKGROUND, get_request_scheduler
+from .client import (
+    API_BASE_URL,
+    DEFAULT_POOL_SIZE,
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_READ_TIMEOUT,
+    get_spotify_client,
+)
+
+
+class AsyncSpotifyClient:
+    """asyncio counterpart of SpotifyClient backed by one aiohttp session.
+
+    The session and its connector are created lazily inside the event loop
+    that first uses the client, so an instance must only be used from that loop.
+    Shares the in-process CatalogCache and RequestScheduler with the threaded
+    client when attached.
+    """
+
+    def __init__(self, api_base_url=None, pool_size=None,
+                 connect_timeout=None, read_timeout=None, cache=None, scheduler=None):
+        self.api_base_url = (api_base_url or os.getenv("SPOTIFY_API_BASE_URL", API_BASE_URL)).rstrip('/')
+        self.pool_size = pool_size or DEFAULT_POOL_SIZE
+        self.timeout = aiohttp.ClientTimeout(
+            sock_connect=connect_timeout or DEFAULT_CONNECT_TIMEOUT,
+            sock_read=read_timeout or DEFAULT_READ_TIMEOUT,
+        )
+        self.cache = cache
+        self.scheduler = scheduler
+        self._session = None
+
+    def url(self, path):
+        """Resolve an API path such as '/me/top/artists' to a full URL"""
+        if path.startswith("http://") or path.startswith("https://"):
+            return path
+        return f"{self.api_base_url}/{path.lstrip('/')}"
+
+    @property
+    def session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=self.pool_size),
+                timeout=self.timeout,
+            )
+        return self._session
+
+    async def fetch(self, path, headers=None, params=None, priority=INTERACTIVE):
+        """GET a Spotify Web API path, returning (status_code, JSON body or None)"""
+        query = {k: str(v) for k, v in params.items()} if params else None
+        attempt = 0
+        while True:
+            if self.scheduler is not None:
+                await self.scheduler.acquire_async(priority)
+            async with self.session.get(self.url(path), headers=headers, params=query) as response:
+                if self.scheduler is not None and self.scheduler.should_retry(
+                    response.status, response.headers, attempt
+                ):
+                    attempt += 1
+                    continue
+                payload = await response.json(content_type=None) if response.status == 200 else None
+                return response.status, payload
+
+    async def get_json(self, path, headers=None, params=None, priority=INTERACTIVE):
+        """GET a Spotify Web API path, returning the JSON body or None on failure"""
+        cacheable = self.cache is not None and self.cache.is_cacheable(path, params)
+        if cacheable:
+            # Shared-tier reads run on a worker thread, and stale entries are
+            # revalidated off-loop by the threaded client
+            url = self.url(path)
+            hit, value = await self.cache.lookup_async(
+                path, params,
+                refresh=lambda: get_spotify_client().fetch(url, headers, params, BACKGROUND),
+            )
+            if hit:
+                return value
+
+        status_code, payload = await self.fetch(path, headers=headers, params=params, priority=priority)
+        if cacheable:
+            self.cache.store_response(path, params, status_code, payload)
+        return payload
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class AsyncBridge:
+    """Runs coroutines from synchronous code on one long-lived event loop.
+
+    Flask handlers call ``run`` from their own threads; every coroutine shares
+    the same loop, so in-flight Spotify calls cost a socket, not a thread.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self.loop.run_forever, name="spotify-async", daemon=True
+        )
+        self._thread.start()
+
+    def run(self, coro, timeout=None):
+        """Block the calling thread until coro finishes on the bridge loop"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+
+_bridge = None
+_async_client = None
+_lock = threading.Lock()
+
+
+def get_async_bridge():
+    """Return the process-wide AsyncBridge, starting its loop on first use"""
+    global _bridge
+    if _bridge is None:
+        with _lock:
+            if _bridge is None:
+                _bridge = AsyncBridge()
+    return _bridge
+
+
+def get_async_spotify_client():
+    """Return the AsyncSpotifyClient bound to the bridge loop"""
+    global _async_client
+    if _async_client is None:
+        with _lock:
+            if _async_client is None:
+                _async_client = AsyncSpotifyClient(
+                    cache=get_catalog_cache(), scheduler=get_request_scheduler()
+                )
+    return _async_client
+
+
+def run_async(coro, timeout=None):
+    """Synchronously run a coroutine on the shared bridge loop"""
+    return get_async_bridge().run(coro, timeout)
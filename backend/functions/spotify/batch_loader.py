@@ -0,0 +1,217 @@
+# backend/functions/spotify/batch_loader.py
+"""DataLoader-style request coalescing for Spotify lookups by id.
+
+Ids requested within a short window, from any thread (or coroutine), are
+gathered and fetched together through one batch function, in chunks of at
+most ``max_batch``. An id that is already pending or in flight shares the
+existing future instead of being requested again; with ``memoize`` finished
+results are kept too, which suits loaders that live for a single request.
+Without ``memoize_none`` a None result is not kept, so the next load of that
+id asks again. With ``context_key`` loads are only coalesced with others
+whose context (e.g. the caller's credentials) maps to the same key.
+"""
+import asyncio
+import threading
+from concurrent.futures import Future
+
+# Spotify's multi-id endpoints (/artists, /tracks, /albums) take 50 ids
+MAX_IDS_PER_CALL = 50
+# Long enough for concurrent strategies to pile on, short against a round trip
+DEFAULT_WINDOW = 0.002
+
+
+def authorization(headers):
+    """context_key for loaders whose context is request headers"""
+    return (headers or {}).get("Authorization")
+
+
+def multi_id_fetcher(client, path, field):
+    """batch_fn for a multi-id endpoint, e.g. ('/artists', 'artists'), on a sync client"""
+    def fetch(ids, headers):
+        data = client.get_json(path, headers=headers, params={"ids": ",".join(ids)})
+        return {item['id']: item for item in (data or {}).get(field, []) if item}
+    return fetch
+
+
+def async_multi_id_fetcher(client, path, field):
+    """multi_id_fetcher for an AsyncSpotifyClient"""
+    async def fetch(ids, headers):
+        data = await client.get_json(path, headers=headers, params={"ids": ",".join(ids)})
+        return {item['id']: item for item in (data or {}).get(field, []) if item}
+    return fetch
+
+
+class BatchLoader:
+    """Thread-safe coalescer around ``batch_fn(keys, context) -> {key: value}``.
+
+    Keys missing from the returned mapping resolve to None; an exception from
+    ``batch_fn`` fails every future in that batch. ``context`` (e.g. request
+    headers) is taken from the first load of each batch; without
+    ``context_key`` every load shares one batch whatever its context, so pass
+    one when contexts are not interchangeable.
+    """
+
+    def __init__(self, batch_fn, max_batch=MAX_IDS_PER_CALL, window=DEFAULT_WINDOW, memoize=False,
+                 memoize_none=True, context_key=None):
+        self.batch_fn = batch_fn
+        self.max_batch = max_batch
+        self.window = window
+        self.memoize = memoize
+        self.memoize_none = memoize_none
+        self.context_key = context_key
+        # (context key, key) -> Future, pending or in flight (or done, if memoized)
+        self._futures = {}
+        self._pending = {}  # context key -> keys waiting for the window
+        self._contexts = {}  # context key -> context of its first pending load
+        self._timer = None
+        self._lock = threading.Lock()
+        self.requested = 0
+        self.deduped = 0
+        self.batches = 0
+
+    def load(self, key, context=None):
+        """Future for one key's value"""
+        group = self.context_key(context) if self.context_key is not None else None
+        batch = None
+        with self._lock:
+            self.requested += 1
+            future = self._futures.get((group, key))
+            if future is not None:
+                self.deduped += 1
+                return future
+            future = Future()
+            self._futures[(group, key)] = future
+            pending = self._pending.setdefault(group, [])
+            if not pending:
+                self._contexts[group] = context
+            pending.append(key)
+            if len(pending) >= self.max_batch or self.window <= 0:
+                batch = self._take(group)
+            elif self._timer is None:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if batch:
+            self._dispatch(*batch)
+        return future
+
+    def load_many(self, keys, context=None, timeout=None):
+        """{key: value} for every key, blocking until all are loaded"""
+        futures = {key: self.load(key, context) for key in keys}
+        return {key: future.result(timeout) for key, future in futures.items()}
+
+    def flush(self):
+        """Dispatch whatever is pending now instead of waiting for the window"""
+        with self._lock:
+            batches = [self._take(group) for group in list(self._pending)]
+        for batch in batches:
+            self._dispatch(*batch)
+
+    def _take(self, group):
+        keys = self._pending.pop(group)
+        context = self._contexts.pop(group)
+        if not self._pending and self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return group, keys, context
+
+    def _dispatch(self, group, keys, context):
+        with self._lock:
+            self.batches += 1
+            futures = [self._futures[(group, key)] for key in keys]
+        try:
+            results = self.batch_fn(keys, context) or {}
+        except Exception as e:
+            results, error = None, e
+        with self._lock:
+            for key in keys:
+                if not self.memoize or results is None or (
+                    not self.memoize_none and results.get(key) is None
+                ):
+                    self._futures.pop((group, key), None)
+        for key, future in zip(keys, futures):
+            if results is None:
+                future.set_exception(error)
+            else:
+                future.set_result(results.get(key))
+
+    def stats(self):
+        with self._lock:
+            return {'requested': self.requested, 'deduped': self.deduped, 'batches': self.batches}
+
+
+class AsyncBatchLoader:
+    """asyncio version of BatchLoader around ``async batch_fn(keys, context)``.
+
+    Must be used from a single event loop, which it binds to on first load.
+    """
+
+    def __init__(self, batch_fn, max_batch=MAX_IDS_PER_CALL, window=DEFAULT_WINDOW, memoize=False):
+        self.batch_fn = batch_fn
+        self.max_batch = max_batch
+        self.window = window
+        self.memoize = memoize
+        self._futures = {}
+        self._pending = []
+        self._context = None
+        self._handle = None
+        self._tasks = set()
+        self.requested = 0
+        self.deduped = 0
+        self.batches = 0
+
+    def load(self, key, context=None):
+        """Awaitable future for one key's value"""
+        self.requested += 1
+        future = self._futures.get(key)
+        if future is not None:
+            self.deduped += 1
+            return future
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._futures[key] = future
+        if not self._pending:
+            self._context = context
+        self._pending.append(key)
+        if len(self._pending) >= self.max_batch or self.window <= 0:
+            self.flush()
+        elif self._handle is None:
+            self._handle = loop.call_later(self.window, self.flush)
+        return future
+
+    async def load_many(self, keys, context=None):
+        futures = {key: self.load(key, context) for key in keys}
+        return {key: await future for key, future in futures.items()}
+
+    def flush(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if not self._pending:
+            return
+        keys, self._pending = self._pending, []
+        self.batches += 1
+        # The loop only keeps weak references to tasks
+        task = asyncio.get_running_loop().create_task(self._dispatch(keys, self._context))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self, keys, context):
+        futures = [self._futures[key] for key in keys]
+        try:
+            results = await self.batch_fn(keys, context) or {}
+        except Exception as e:
+            results, error = None, e
+        if not self.memoize or results is None:
+            for key in keys:
+                self._futures.pop(key, None)
+        for key, future in zip(keys, futures):
+            if future.done():
+                continue
+            if results is None:
+                future.set_exception(error)
+            else:
+                future.set_result(results.get(key))
+
+    def stats(self):
+        return {'requested': self.requested, 'deduped': self.deduped, 'batches': self.batches}
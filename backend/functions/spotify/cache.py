@@ -0,0 +1,182 @@
+# backend/functions/spotify/cache.py
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+# Catalog endpoints whose responses are identical for every user, with how
+# long (seconds) a cached response stays valid
+CATALOG_TTLS = [
+    (re.compile(r"^/artists/[^/]+/top-tracks$"), 6 * 60 * 60),
+    (re.compile(r"^/artists/[^/]+/related-artists$"), 24 * 60 * 60),
+    (re.compile(r"^/search$"), 60 * 60),
+]
+# 404s and empty results are remembered for less time than real data
+NEGATIVE_TTL = 10 * 60
+DEFAULT_MAX_BYTES = int(float(os.getenv("SPOTIFY_CATALOG_CACHE_MB", "32")) * 1024 * 1024)
+
+
+def is_empty_result(payload):
+    """True when a catalog response carries no items, e.g. {'tracks': {'items': []}}"""
+    if not payload:
+        return True
+    for value in payload.values():
+        if isinstance(value, dict):
+            value = value.get('items')
+        if value:
+            return False
+    return True
+
+
+class CatalogCache:
+    """In-process, user-agnostic cache for Spotify catalog responses.
+
+    Entries are keyed by endpoint path plus normalized query params, expire on a
+    per-endpoint TTL and are evicted least-recently-used once the estimated
+    size of the cached JSON exceeds ``max_bytes``. A cached value of None is a
+    negative entry (404 or empty result).
+    """
+
+    def __init__(self, max_bytes=None, ttls=None, negative_ttl=NEGATIVE_TTL, clock=time.time):
+        self.max_bytes = max_bytes or DEFAULT_MAX_BYTES
+        self.ttls = ttls or CATALOG_TTLS
+        self.negative_ttl = negative_ttl
+        self.clock = clock
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.evictions = 0
+
+    def ttl_for(self, path, params=None):
+        """TTL for a catalog request, or None when the request is user-specific"""
+        if path == "/search" and not str((params or {}).get("q", "")).startswith("genre:"):
+            return None
+        for pattern, ttl in self.ttls:
+            if pattern.match(path):
+                return ttl
+        return None
+
+    def is_cacheable(self, path, params=None):
+        return self.ttl_for(path, params) is not None
+
+    @staticmethod
+    def key(path, params=None):
+        """Stable key: path plus sorted params, with the search query case-folded"""
+        normalized = sorted(
+            (k, " ".join((str(v).lower() if k == "q" else str(v)).split()))
+            for k, v in (params or {}).items()
+        )
+        return f"{path}?{urlencode(normalized)}" if normalized else path
+
+    def lookup(self, path, params=None, refresh=None):
+        """Return (hit, value); value is None for a negative hit.
+
+        ``refresh`` is accepted for interface parity with TieredCatalogCache and
+        is unused here: expired in-process entries are simply misses.
+        """
+        key = self.key(path, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= self.clock():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            if entry[2] is None:
+                self.negative_hits += 1
+            return True, entry[2]
+
+    async def lookup_async(self, path, params=None, refresh=None):
+        """lookup for coroutines; in-process only, so it never blocks the loop"""
+        return self.lookup(path, params)
+
+    def normalize(self, path, params, value, ttl=None):
+        """Return the (value, ttl) to cache, or None if the request isn't cacheable"""
+        ttl = ttl or self.ttl_for(path, params)
+        if ttl is None:
+            return None
+        if value is not None and is_empty_result(value):
+            value = None
+        if value is None:
+            ttl = min(ttl, self.negative_ttl)
+        return value, ttl
+
+    def store(self, path, params, value, ttl=None):
+        """Cache a response body; None or empty results become negative entries"""
+        entry = self.normalize(path, params, value, ttl)
+        if entry is None:
+            return
+        value, ttl = entry
+        size = len(json.dumps(value, separators=(',', ':'))) if value is not None else 0
+        size += len(self.key(path, params))
+        if size > self.max_bytes:
+            return
+
+        key = self.key(path, params)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (self.clock() + ttl, size, value)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def store_response(self, path, params, status_code, payload):
+        """Cache an upstream result: 200 bodies and 404s only, never errors"""
+        if status_code == 200:
+            self.store(path, params, payload)
+        elif status_code == 404:
+            self.store(path, params, None)
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'negative_hits': self.negative_hits,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_catalog_cache():
+    """Return the process-wide catalog cache.
+
+    Backed by the Firestore ``catalog_cache`` collection as a second tier unless
+    SPOTIFY_SHARED_CACHE=false.
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                cache = CatalogCache()
+                if os.getenv("SPOTIFY_SHARED_CACHE", "true").lower() != "false":
+                    from ..clients import get_firestore
+                    from .shared_cache import FirestoreCatalogCache, TieredCatalogCache
+                    cache = TieredCatalogCache(cache, FirestoreCatalogCache(get_firestore()))
+                _cache = cache
+    return _cache
@@ -0,0 +1,124 @@
+# backend/functions/spotify/client.py
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from .cache import get_catalog_cache
+from .scheduler import INTERACTIVE, BACKGROUND, get_request_scheduler
+
+API_BASE_URL = "https://api.spotify.com/v1"
+ACCOUNTS_BASE_URL = "https://accounts.spotify.com"
+
+# Connection pool and timeout defaults, overridable per deployment
+DEFAULT_POOL_SIZE = int(os.getenv("SPOTIFY_POOL_SIZE", "16"))
+DEFAULT_CONNECT_TIMEOUT = float(os.getenv("SPOTIFY_CONNECT_TIMEOUT", "3.05"))
+DEFAULT_READ_TIMEOUT = float(os.getenv("SPOTIFY_READ_TIMEOUT", "10"))
+
+
+class SpotifyClient:
+    """Keep-alive HTTP client shared by every Spotify call in the backend.
+
+    All requests go through one ``requests.Session`` so TCP+TLS connections to
+    api.spotify.com and accounts.spotify.com are reused across calls instead of
+    being opened per request. When a CatalogCache is attached, user-agnostic
+    catalog lookups made through ``get_json`` are served from it. When a
+    RequestScheduler is attached, every call is throttled by it and 429s are
+    retried after their Retry-After delay.
+    """
+
+    def __init__(self, api_base_url=None, accounts_base_url=None,
+                 pool_size=None, connect_timeout=None, read_timeout=None,
+                 cache=None, scheduler=None):
+        self.api_base_url = (api_base_url or os.getenv("SPOTIFY_API_BASE_URL", API_BASE_URL)).rstrip('/')
+        self.accounts_base_url = (
+            accounts_base_url or os.getenv("SPOTIFY_ACCOUNTS_BASE_URL", ACCOUNTS_BASE_URL)
+        ).rstrip('/')
+        self.pool_size = pool_size or DEFAULT_POOL_SIZE
+        self.timeout = (
+            connect_timeout or DEFAULT_CONNECT_TIMEOUT,
+            read_timeout or DEFAULT_READ_TIMEOUT,
+        )
+
+        self.cache = cache
+        self.scheduler = scheduler
+        self.session = requests.Session()
+        # One pool per host (API + accounts), each holding up to pool_size sockets
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def url(self, path):
+        """Resolve an API path such as '/me/top/artists' to a full URL"""
+        if path.startswith("http://") or path.startswith("https://"):
+            return path
+        return f"{self.api_base_url}/{path.lstrip('/')}"
+
+    def _request(self, method, url, priority=INTERACTIVE, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+        while True:
+            if self.scheduler is not None:
+                self.scheduler.acquire(priority)
+            response = self.session.request(method, url, **kwargs)
+            if self.scheduler is None or not self.scheduler.should_retry(
+                response.status_code, response.headers, attempt
+            ):
+                return response
+            attempt += 1
+
+    def get(self, path, headers=None, params=None, priority=INTERACTIVE, **kwargs):
+        """GET a Spotify Web API path and return the raw response"""
+        return self._request("GET", self.url(path), priority, headers=headers, params=params, **kwargs)
+
+    def post(self, path, data=None, headers=None, priority=INTERACTIVE, **kwargs):
+        """POST to a Spotify Web API path and return the raw response"""
+        return self._request("POST", self.url(path), priority, data=data, headers=headers, **kwargs)
+
+    def fetch(self, path, headers=None, params=None, priority=INTERACTIVE):
+        """GET a Spotify Web API path, returning (status_code, JSON body or None)"""
+        response = self.get(path, headers=headers, params=params, priority=priority)
+        return response.status_code, (response.json() if response.status_code == 200 else None)
+
+    def get_json(self, path, headers=None, params=None, priority=INTERACTIVE):
+        """GET a Spotify Web API path, returning the JSON body or None on failure"""
+        return self.get_json_cached(path, headers, params, priority)[0]
+
+    def get_json_cached(self, path, headers=None, params=None, priority=INTERACTIVE):
+        """get_json that also says whether the catalog cache answered: (body or None, cache hit)"""
+        cacheable = self.cache is not None and self.cache.is_cacheable(path, params)
+        if cacheable:
+            hit, value = self.cache.lookup(
+                path, params, refresh=lambda: self.fetch(path, headers, params, BACKGROUND)
+            )
+            if hit:
+                return value, True
+
+        status_code, payload = self.fetch(path, headers=headers, params=params, priority=priority)
+        if cacheable:
+            self.cache.store_response(path, params, status_code, payload)
+        return payload, False
+
+    def request_token(self, data, auth=None, priority=INTERACTIVE):
+        """POST to the accounts service token endpoint"""
+        return self._request(
+            "POST", f"{self.accounts_base_url}/api/token", priority, data=data, auth=auth
+        )
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_spotify_client():
+    """Return the process-wide SpotifyClient, creating it on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = SpotifyClient(
+                    cache=get_catalog_cache(), scheduler=get_request_scheduler()
+                )
+    return _client
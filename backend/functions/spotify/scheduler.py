@@ -0,0 +1,123 @@
+# backend/functions/spotify/scheduler.py
+import asyncio
+import os
+import threading
+import time
+
+# Call priorities: interactive endpoints are served ahead of background sweeps
+INTERACTIVE = 0
+BACKGROUND = 1
+
+DEFAULT_RATE = float(os.getenv("SPOTIFY_RATE_LIMIT_RPS", "10"))
+DEFAULT_BURST = float(os.getenv("SPOTIFY_RATE_LIMIT_BURST", "20"))
+DEFAULT_RETRY_AFTER = 1.0
+
+
+class RequestScheduler:
+    """Token-bucket throttle shared by every outgoing Spotify call.
+
+    Interactive calls may drain the bucket completely; background calls only
+    proceed while more than ``background_reserve`` of the burst is left, so a
+    sweep never starves user-facing requests. A 429 response blocks all calls
+    until its Retry-After delay has passed, after which the caller retries.
+    """
+
+    def __init__(self, rate=None, burst=None, background_reserve=0.5,
+                 max_retries=3, max_retry_after=30.0, clock=time.monotonic):
+        self.rate = rate or DEFAULT_RATE
+        self.burst = burst or DEFAULT_BURST
+        self.background_reserve = background_reserve * self.burst
+        self.max_retries = max_retries
+        self.max_retry_after = max_retry_after
+        self.clock = clock
+        self._tokens = self.burst
+        self._updated = clock()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+        self.throttled = 0
+        self.rate_limited = 0
+        self.retried = 0
+        self.dropped = 0
+
+    def reserve(self, priority=INTERACTIVE):
+        """Take a token if one is available now; otherwise return seconds to wait"""
+        with self._lock:
+            now = self.clock()
+            if now < self._blocked_until:
+                return self._blocked_until - now
+
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            floor = self.background_reserve if priority == BACKGROUND else 0.0
+            if self._tokens - floor >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (floor + 1 - self._tokens) / self.rate
+
+    def acquire(self, priority=INTERACTIVE):
+        """Block the calling thread until a call may be sent"""
+        wait = self.reserve(priority)
+        if wait:
+            self._count_throttled()
+        while wait:
+            time.sleep(wait)
+            wait = self.reserve(priority)
+
+    async def acquire_async(self, priority=INTERACTIVE):
+        """Coroutine version of acquire for the asyncio client"""
+        wait = self.reserve(priority)
+        if wait:
+            self._count_throttled()
+        while wait:
+            await asyncio.sleep(wait)
+            wait = self.reserve(priority)
+
+    def _count_throttled(self):
+        with self._lock:
+            self.throttled += 1
+
+    def should_retry(self, status_code, headers, attempt):
+        """Record a response; True when a 429 should be retried after its delay.
+
+        Only a retried 429 blocks other callers, and never for longer than
+        ``max_retry_after``; a dropped one fails just its own call.
+        """
+        if status_code != 429:
+            return False
+
+        try:
+            delay = float(headers.get("Retry-After", DEFAULT_RETRY_AFTER))
+        except (TypeError, ValueError):
+            delay = DEFAULT_RETRY_AFTER
+        with self._lock:
+            self.rate_limited += 1
+            if attempt >= self.max_retries or delay > self.max_retry_after:
+                self.dropped += 1
+                return False
+            blocked_until = self.clock() + min(max(delay, 0.0), self.max_retry_after)
+            self._blocked_until = max(self._blocked_until, blocked_until)
+            self.retried += 1
+            return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                'throttled': self.throttled,
+                'rate_limited': self.rate_limited,
+                'retried': self.retried,
+                'dropped': self.dropped,
+            }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_request_scheduler():
+    """Return the process-wide RequestScheduler"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = RequestScheduler()
+    return _scheduler
@@ -0,0 +1,213 @@
+# backend/functions/spotify/shared_cache.py
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+# How long past expiry a shared entry may still be served while it refreshes
+DEFAULT_MAX_STALE = 7 * 24 * 60 * 60
+# How long a stale value is kept in memory while its refresh is in flight
+STALE_MEMORY_TTL = 60
+
+
+class FirestoreCatalogCache:
+    """Catalog cache tier shared by every function instance.
+
+    Each entry lives in ``catalog_cache/{sha256(key)}`` with the JSON payload
+    stored as a string, its expiry as epoch seconds and a ``purge_at``
+    timestamp that a Firestore TTL policy can use to delete dead entries.
+    """
+
+    def __init__(self, db, collection="catalog_cache", max_stale=DEFAULT_MAX_STALE):
+        self.db = db
+        self.collection = collection
+        self.max_stale = max_stale
+
+    @staticmethod
+    def doc_id(key):
+        return hashlib.sha256(key.encode()).hexdigest()[:40]
+
+    def get(self, key):
+        """Return (value, expires_at) for a stored key, or None"""
+        doc = self.db.collection(self.collection).document(self.doc_id(key)).get()
+        if not doc.exists:
+            return None
+        data = doc.to_dict()
+        if data.get('key') != key:  # hash collision
+            return None
+        payload = data.get('payload')
+        return (json.loads(payload) if payload is not None else None), data['expires_at']
+
+    def put(self, key, value, expires_at):
+        self.db.collection(self.collection).document(self.doc_id(key)).set({
+            'key': key,
+            'payload': json.dumps(value, separators=(',', ':')) if value is not None else None,
+            'expires_at': expires_at,
+            'purge_at': datetime.fromtimestamp(expires_at + self.max_stale, tz=timezone.utc),
+        })
+
+
+class TieredCatalogCache:
+    """In-process CatalogCache in front of a shared FirestoreCatalogCache.
+
+    Memory misses fall through to the shared tier, so a cold instance starts
+    warm from entries other instances already fetched. Expired shared entries
+    are served immediately (stale-while-revalidate) while the ``refresh``
+    callable passed to ``lookup`` re-fetches them on a background thread.
+    Shared-tier writes also happen off the request path.
+    """
+
+    def __init__(self, memory, shared, executor=None):
+        self.memory = memory
+        self.shared = shared
+        self.clock = memory.clock
+        self.executor = executor or ThreadPoolExecutor(max_workers=2, thread_name_prefix="catalog-cache")
+        self._refreshing = set()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self.shared_hits = 0
+        self.shared_misses = 0
+        self.stale_served = 0
+        self.refreshes = 0
+        self.shared_errors = 0
+
+    def ttl_for(self, path, params=None):
+        return self.memory.ttl_for(path, params)
+
+    def is_cacheable(self, path, params=None):
+        return self.memory.is_cacheable(path, params)
+
+    def key(self, path, params=None):
+        return self.memory.key(path, params)
+
+    def lookup(self, path, params=None, refresh=None):
+        """Return (hit, value), consulting the shared tier on a memory miss"""
+        hit, value = self.memory.lookup(path, params)
+        if hit:
+            return hit, value
+        return self._shared_lookup(path, params, refresh)
+
+    async def lookup_async(self, path, params=None, refresh=None):
+        """lookup for coroutines: memory inline, the blocking shared-tier read on a worker thread"""
+        hit, value = self.memory.lookup(path, params)
+        if hit:
+            return hit, value
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self._shared_lookup, path, params, refresh
+        )
+
+    def _shared_lookup(self, path, params, refresh):
+        key = self.key(path, params)
+        try:
+            entry = self.shared.get(key)
+        except Exception as e:
+            logging.warning(f"Shared catalog cache read failed: {e}")
+            self.shared_errors += 1
+            entry = None
+        if entry is None:
+            self.shared_misses += 1
+            return False, None
+
+        value, expires_at = entry
+        now = self.clock()
+        if expires_at > now:
+            self.shared_hits += 1
+            self.memory.store(path, params, value, ttl=expires_at - now)
+            return True, value
+
+        if refresh is None or now - expires_at > self.shared.max_stale:
+            self.shared_misses += 1
+            return False, None
+
+        # Serve stale and revalidate in the background
+        self.stale_served += 1
+        self.memory.store(path, params, value, ttl=STALE_MEMORY_TTL)
+        self._schedule_refresh(key, path, params, refresh)
+        return True, value
+
+    def _schedule_refresh(self, key, path, params, refresh):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                status_code, payload = refresh()
+                self.refreshes += 1
+                self.store_response(path, params, status_code, payload, background=False)
+            except Exception as e:
+                logging.warning(f"Catalog cache refresh failed for {key}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._submit(run)
+
+    def store(self, path, params, value, ttl=None, background=True):
+        entry = self.memory.normalize(path, params, value, ttl)
+        if entry is None:
+            return
+        value, ttl = entry
+        self.memory.store(path, params, value, ttl=ttl)
+        key = self.key(path, params)
+        expires_at = self.clock() + ttl
+
+        def write():
+            try:
+                self.shared.put(key, value, expires_at)
+            except Exception as e:
+                logging.warning(f"Shared catalog cache write failed: {e}")
+                self.shared_errors += 1
+
+        if background:
+            self._submit(write)
+        else:
+            write()
+
+    def store_response(self, path, params, status_code, payload, background=True):
+        """Cache an upstream result in both tiers: 200 bodies and 404s only"""
+        if status_code == 200:
+            self.store(path, params, payload, background=background)
+        elif status_code == 404:
+            self.store(path, params, None, background=background)
+
+    def _submit(self, fn):
+        future = self.executor.submit(fn)
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._discard_pending)
+
+    def _discard_pending(self, future):
+        with self._lock:
+            self._pending.discard(future)
+
+    def wait(self, timeout=None):
+        """Block until queued shared-tier writes and refreshes have finished"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                pending = list(self._pending)
+            if not pending:
+                return
+            for future in pending:
+                remaining = None if deadline is None else max(0, deadline - time.monotonic())
+                future.result(remaining)
+
+    def clear(self):
+        self.memory.clear()
+
+    def stats(self):
+        stats = self.memory.stats()
+        stats.update({
+            'shared_hits': self.shared_hits,
+            'shared_misses': self.shared_misses,
+            'stale_served': self.stale_served,
+            'refreshes': self.refreshes,
+            'shared_errors': self.shared_errors,
+        })
+        return stats
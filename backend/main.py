@@ -2,24 +2,67 @@ import os
 import functions_framework
 import time
 from flask import jsonify, redirect, request
-import requests
 from datetime import datetime, timedelta
-from google.cloud import firestore
 from flask_cors import cross_origin
-from functions.analytics.history_operations import (
-    process_listening_history,
-    get_listening_stats as get_user_stats,
+# Clients are created on first use. Modules only some entry points need
+# (numpy-backed analytics and indexes, aiohttp) are imported where they are
+# used, so each deployed function pays only for its own dependencies.
+from functions.clients import get_async_spotify_client, get_firestore, get_spotify_client
+from functions.analytics.collection_operations import (
+    collect_listening_data,
+    ingest_recent_plays,
 )
-from google.api_core import retry
+from functions.analytics.event_store import read_events
 from functions.recommendations.recommendation_operations import (
     get_user_top_items,
     get_spotify_recommendations,
     process_recommendations,
+    load_recommendations,
+    store_recommendations,
 )
-import random
+from functions.recommendations.precompute import catalog_key, precompute_recommendations
+from functions.recommendations.genre_index import get_genre_index, rebuild_genre_index
+from functions.recommendations.metrics import get_metrics_buffer
+from functions.recommendations.ranking import rank_recommendations
+from functions.recommendations.track_record import TrackRecord
+from functions.auth.token_manager import (
+    get_access_token,
+    get_token_cache,
+    refresh_expiring_tokens,
+    request_app_token,
+)
+from functions.spotify.artist_index import get_artist_genre_index
+from functions.spotify.batch_loader import AsyncBatchLoader, BatchLoader, multi_id_fetcher
+import asyncio
+import pytz
+import threading
+from concurrent.futures import ThreadPoolExecutor
 #from llama_cpp import Llama  # For local LLM inference
 import re  # For response parsing
-db = firestore.Client()
+
+# Bounded worker pools for the recommendation fan-out. Strategies get their own
+# small pool so they can wait on per-call futures without starving the call pool.
+SPOTIFY_MAX_WORKERS = int(os.getenv("SPOTIFY_MAX_WORKERS", "8"))
+strategy_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="strategy")
+spotify_executor = ThreadPoolExecutor(
+    max_workers=SPOTIFY_MAX_WORKERS, thread_name_prefix="spotify"
+)
+# Background regeneration of stale recommendation lists; kept apart from the
+# strategy pool, whose tasks a refresh waits on
+refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="recs-refresh")
+# Firestore reads behind the async path's local indexes. Lookups already in
+# memory run inline; the rest share these few threads, however many requests
+# the event loop is serving
+index_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="index-io")
+# Serve recommendations from the asyncio recommender unless explicitly disabled
+USE_ASYNC_RECOMMENDER = os.getenv("SPOTIFY_ASYNC_RECOMMENDER", "true").lower() != "false"
+# Popularity band of the "rising" artists strategy
+RISING_ARTIST_POPULARITY = (20, 60)
+# Similar-track candidates per request from the local indexes, as many as the
+# related-artists path yields (3 seeds x 3 related artists x 2 tracks)
+SIMILAR_TRACKS_K = 18
+# Related artists explored per seed artist
+RELATED_PER_SEED = 3
 
 
 # Common CORS configuration
@@ -45,7 +88,7 @@ CORS_CONFIG = {
 def get_user_data(user_id):
     """Get user data without retry logic"""
     try:
-        user_ref = db.collection("users").document(user_id)
+        user_ref = get_firestore().collection("users").document(user_id)
         user_doc = user_ref.get()  # Remove _retry parameter
         if not user_doc.exists:
             raise ValueError("User not found")
@@ -67,7 +110,6 @@ def spotify_auth(request):
             code = request.args.get("code")
 
             # Exchange code for access token
-            token_url = "https://accounts.spotify.com/api/token"
             token_data = {
                 "grant_type": "authorization_code",
                 "code": code,
@@ -76,33 +118,35 @@ def spotify_auth(request):
                 "client_secret": os.getenv("SPOTIFY_CLIENT_SECRET"),
             }
 
-            token_response = requests.post(token_url, data=token_data)
+            token_response = get_spotify_client().request_token(token_data)
             token_info = token_response.json()
 
             if token_response.status_code != 200:
                 return redirect(f"{frontend_url}/callback?error=token_error")
 
             # Get user profile
-            profile_response = requests.get(
-                "https://api.spotify.com/v1/me",
+            profile_response = get_spotify_client().get(
+                "/me",
                 headers={"Authorization": f"Bearer {token_info['access_token']}"},
             )
             profile = profile_response.json()
 
             # Store in Firestore
-            user_ref = db.collection("users").document(profile["id"])
+            token_expiry = datetime.now(pytz.UTC) + timedelta(seconds=token_info["expires_in"])
+            user_ref = get_firestore().collection("users").document(profile["id"])
             user_ref.set(
                 {
                     "spotify_id": profile["id"],
                     "access_token": token_info["access_token"],
                     "refresh_token": token_info["refresh_token"],
-                    "token_expiry": datetime.now()
-                    + timedelta(seconds=token_info["expires_in"]),
+                    "token_expiry": token_expiry,
                     "display_name": profile["display_name"],
                     "email": profile.get("email"),
                     "last_updated": datetime.now(),
+                    "last_login": datetime.now(pytz.UTC),
                 }
             )
+            get_token_cache().store(profile["id"], token_info["access_token"], token_expiry)
 
             return redirect(
                 f"{frontend_url}/callback?auth=success&user_id={profile['id']}"
@@ -127,7 +171,7 @@ def refresh_token(request):
         user_id = request_json["user_id"]
 
         # Get user from Firestore
-        user_ref = db.collection("users").document(user_id)
+        user_ref = get_firestore().collection("users").document(user_id)
         user_doc = user_ref.get()
 
         if not user_doc.exists:
@@ -136,7 +180,6 @@ def refresh_token(request):
         user_data = user_doc.to_dict()
 
         # Refresh token
-        token_url = "https://accounts.spotify.com/api/token"
         payload = {
             "grant_type": "refresh_token",
             "refresh_token": user_data["refresh_token"],
@@ -144,21 +187,22 @@ def refresh_token(request):
             "client_secret": os.getenv("SPOTIFY_CLIENT_SECRET"),
         }
 
-        response = requests.post(token_url, data=payload)
+        response = get_spotify_client().request_token(payload)
         token_info = response.json()
 
         if response.status_code != 200:
             return jsonify({"error": "Failed to refresh token"}), 400
 
         # Update user in Firestore
+        token_expiry = datetime.now(pytz.UTC) + timedelta(seconds=token_info["expires_in"])
         user_ref.update(
             {
                 "access_token": token_info["access_token"],
-                "token_expiry": datetime.now()
-                + timedelta(seconds=token_info["expires_in"]),
+                "token_expiry": token_expiry,
                 "last_updated": datetime.now(),
             }
         )
+        get_token_cache().store(user_id, token_info["access_token"], token_expiry)
 
         return jsonify(
             {
@@ -171,6 +215,22 @@ def refresh_token(request):
         return jsonify({"error": str(e)}), 500
 
 
+@functions_framework.http
+def refresh_expiring_tokens_background(request):
+    """
+    Scheduled function that refreshes tokens about to expire, so interactive
+    endpoints almost never have to refresh inline
+    """
+    try:
+        window_minutes = int(request.args.get("window_minutes", 15))
+        max_workers = int(request.args.get("max_workers", 8))
+        stats = refresh_expiring_tokens(window_minutes, max_workers)
+        return jsonify({"status": "success", **stats}), 200
+    except Exception as e:
+        print(f"❌ Proactive token refresh error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
 @functions_framework.http
 @cross_origin(**CORS_CONFIG)
 def get_listening_history(request):
@@ -183,135 +243,29 @@ def get_listening_history(request):
         if not user_id:
             return jsonify({"error": "Missing user_id"}), 400
 
-        # Get user's access token
-        user_ref = db.collection("users").document(user_id)
-        user_doc = user_ref.get()
+        # Get user's access token, refreshing it if it is about to expire
+        access_token = get_access_token(user_id)
+        if not access_token:
+            return jsonify({"error": "No valid access token"}), 401
 
-        if not user_doc.exists:
-            return jsonify({"error": "User not found"}), 404
+        from functions.analytics.history_operations import get_listening_summary
 
-        user_data = user_doc.to_dict()
-        access_token = user_data.get("access_token")
+        # One delta fetch after the cursor, then a single rollup read
+        metadata = ingest_recent_plays(user_id, access_token)
+        processed_data = get_listening_summary(user_id)
+        plays = sum(day['count'] for day in processed_data["history"])
+        print(f"🔍 {plays} plays this week, {metadata['new_plays']} new")
 
-        # SOLUTION 1: Try to get more historical data using pagination
-        all_tracks = []
-        after_timestamp = None
-        max_requests = 10  # Limit to prevent infinite loops
-        requests_made = 0
-        
-        print(f"🔍 Starting paginated fetch for user {user_id}")
-        
-        while requests_made < max_requests:
-            # Build URL with pagination
-            url = "https://api.spotify.com/v1/me/player/recently-played?limit=50"
-            if after_timestamp:
-                url += f"&after={after_timestamp}"
-            
-            print(f"🔍 Request {requests_made + 1}: {url}")
-            
-            response = requests.get(url, headers={"Authorization": f"Bearer {access_token}"})
-            
-            if response.status_code != 200:
-                print(f"❌ API error on request {requests_made + 1}: {response.status_code}")
-                break
-                
-            data = response.json()
-            tracks = data.get("items", [])
-            
-            if not tracks:
-                print(f"✅ No more tracks available")
-                break
-            
-            print(f"✅ Got {len(tracks)} tracks in request {requests_made + 1}")
-            all_tracks.extend(tracks)
-            
-            # Check if we have enough coverage
-            now = datetime.now(pytz.UTC)
-            oldest_track_time = datetime.fromisoformat(tracks[-1]['played_at'].replace('Z', '+00:00'))
-            days_covered = (now - oldest_track_time).days
-            
-            print(f"🔍 Coverage: {days_covered} days back")
-            
-            # Stop if we have 7+ days of data
-            if days_covered >= 7:
-                print(f"✅ Sufficient coverage achieved ({days_covered} days)")
-                break
-            
-            # Get cursor for next page
-            cursors = data.get("cursors", {})
-            after_timestamp = cursors.get("after")
-            
-            if not after_timestamp:
-                print(f"✅ No more pages available")
-                break
-                
-            requests_made += 1
-        
-        print(f"🔍 Total tracks collected: {len(all_tracks)}")
-        
-        # SOLUTION 2: If still not enough data, supplement with stored history
-        if len(all_tracks) < 20:  # Very few tracks
-            print(f"⚠️ Very few recent tracks, checking stored data...")
-            
-            # Try to get cached history from Firestore
-            stored_history_ref = db.collection('users').document(user_id)\
-                                 .collection('analytics').document('listening_history')
-            stored_doc = stored_history_ref.get()
-            
-            if stored_doc.exists:
-                stored_data = stored_doc.to_dict()
-                last_updated = stored_data.get('last_updated')
-                
-                # If stored data is recent (within last 12 hours), use it as fallback
-                if last_updated and isinstance(last_updated, datetime):
-                    hours_old = (datetime.now(pytz.UTC) - last_updated).total_seconds() / 3600
-                    if hours_old < 12:
-                        print(f"✅ Using stored history from {hours_old:.1f} hours ago")
-                        return jsonify({
-                            "history": stored_data.get('daily_counts', []),
-                            "totalHours": stored_data.get('total_hours', 0)
-                        }), 200
-
-        # SOLUTION 3: Better distribution analysis
-        if all_tracks:
-            print(f"🔍 Analyzing {len(all_tracks)} tracks...")
-            
-            # Analyze actual distribution
-            now = datetime.now(pytz.UTC)
-            day_analysis = {}
-            
-            for track in all_tracks:
-                played_at = datetime.fromisoformat(track['played_at'].replace('Z', '+00:00'))
-                days_ago = (now - played_at).days
-                day_name = played_at.strftime('%a')
-                
-                if 0 <= days_ago < 7:
-                    day_analysis[day_name] = day_analysis.get(day_name, 0) + 1
-            
-            print(f"🔍 Distribution: {day_analysis}")
-            
-            # Check for poor distribution
-            days_with_data = len([d for d in day_analysis.values() if d > 0])
-            if days_with_data < 3:
-                print(f"⚠️ Poor distribution: only {days_with_data} days have data")
-        
-        # Process the collected data
-        processed_data = process_listening_history(user_id, all_tracks)
-        
-        # SOLUTION 4: Enhanced response with metadata
         response_data = {
             "history": processed_data["history"],
             "totalHours": processed_data["total_hours"],
             "metadata": {
-                "tracks_analyzed": len(all_tracks),
-                "api_requests_made": requests_made + 1,
-                "coverage_days": max((datetime.now(pytz.UTC) - 
-                                    datetime.fromisoformat(all_tracks[-1]['played_at'].replace('Z', '+00:00'))).days 
-                                   if all_tracks else 0, 0),
-                "data_quality": "good" if len(all_tracks) >= 30 else "limited"
+                **metadata,
+                "tracks_analyzed": plays,
+                "data_quality": "good" if plays >= 30 else "limited"
             }
         }
-        
+
         print(f"✅ Returning {len(processed_data['history'])} days of data")
         return jsonify(response_data), 200
 
@@ -322,6 +276,60 @@ def get_listening_history(request):
         return jsonify({"error": str(e)}), 500
 
 
+# Longest window the analytics endpoint will read shards for
+MAX_ANALYTICS_DAYS = 366
+
+
+@functions_framework.http
+@cross_origin(**CORS_CONFIG)
+def get_listening_analytics(request):
+    """Daily histograms for several windows plus an hour x weekday heatmap"""
+    try:
+        if request.method == "OPTIONS":
+            return ("", 204)
+
+        user_id = request.args.get("user_id")
+        if not user_id:
+            return jsonify({"error": "Missing user_id"}), 400
+
+        from functions.analytics.engine import (
+            DAY_MS,
+            DEFAULT_WINDOWS,
+            event_arrays,
+            summarize_listening,
+        )
+        try:
+            windows = tuple(
+                int(days) for days in request.args.get("windows", ",".join(map(str, DEFAULT_WINDOWS))).split(",")
+            )
+            tz = request.args.get("tz", "UTC")
+            pytz.timezone(tz)
+        except (ValueError, pytz.UnknownTimeZoneError):
+            return jsonify({"error": "Invalid windows or tz"}), 400
+        if not windows or min(windows) < 1 or max(windows) > MAX_ANALYTICS_DAYS:
+            return jsonify({"error": f"Windows must be between 1 and {MAX_ANALYTICS_DAYS} days"}), 400
+
+        # Local days can start up to a day before the UTC day shards do
+        now_ms = int(time.time() * 1000)
+        events = read_events(get_firestore(), user_id, now_ms - (max(windows) + 1) * DAY_MS, now_ms + DAY_MS)
+        played_at_ms, durations = event_arrays(events)
+        summary = summarize_listening(played_at_ms, durations, windows, tz, now_ms)
+
+        return jsonify({
+            "windows": {
+                str(days): {"history": window["history"], "totalHours": window["total_hours"]}
+                for days, window in summary["windows"].items()
+            },
+            "heatmap": summary["heatmap"],
+            "plays": summary["plays"],
+            "tz": tz,
+        }), 200
+
+    except Exception as e:
+        print(f"❌ Error in get_listening_analytics: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
 # Background data collection
 @functions_framework.http 
 def collect_listening_data_background(request):
@@ -330,49 +338,117 @@ def collect_listening_data_background(request):
     Call this every few hours to build up historical data
     """
     try:
-        # Get all users
-        users_ref = db.collection('users')
-        
-        for user_doc in users_ref.stream():
-            user_id = user_doc.id
-            user_data = user_doc.to_dict()
-            access_token = user_data.get('access_token')
-            
-            if not access_token:
-                continue
-                
-            print(f"🔄 Collecting data for user {user_id}")
-            
-            # Get recent tracks
-            response = requests.get(
-                "https://api.spotify.com/v1/me/player/recently-played?limit=50",
-                headers={"Authorization": f"Bearer {access_token}"}
-            )
-            
-            if response.status_code != 200:
-                continue
-                
-            tracks = response.json().get("items", [])
-            
-            # Store raw tracks for later analysis
-            if tracks:
-                track_storage_ref = db.collection('users').document(user_id)\
-                                    .collection('raw_tracks').document('latest')
-                
-                track_storage_ref.set({
-                    'tracks': tracks,
-                    'collected_at': datetime.now(pytz.UTC),
-                    'count': len(tracks)
-                })
-                
-                print(f"✅ Stored {len(tracks)} tracks for {user_id}")
+        max_workers = int(request.args.get("max_workers", 16))
+        stats = collect_listening_data(max_workers=max_workers)
+        print(f"✅ Background collection finished: {stats}")
         
-        return jsonify({"status": "success"}), 200
+        return jsonify({"status": "success", **stats, "rate_limit": get_spotify_client().scheduler.stats()}), 200
         
     except Exception as e:
         print(f"❌ Background collection error: {e}")
         return jsonify({"error": str(e)}), 500
 
+@functions_framework.http
+def precompute_recommendations_background(request):
+    """
+    Scheduled function that materializes recommendations for active users.
+    ?shard=i&shards=n splits users by a hash of user_id so n invocations can
+    share the work.
+    """
+    try:
+        shards = int(request.args.get("shards", 1))
+        shard = int(request.args.get("shard", 0))
+        if shards < 1 or not 0 <= shard < shards:
+            return jsonify({"error": "shard must be in [0, shards)"}), 400
+        max_workers = int(request.args.get("max_workers", 8))
+        
+        stats = precompute_recommendations(
+            lambda user_id, access_token, catalog: generate_recommendations(
+                user_id, access_token, catalog=catalog
+            ),
+            shard=shard,
+            shards=shards,
+            max_workers=max_workers,
+        )
+        # Write the run's metrics before the instance can be idled
+        get_metrics_buffer().flush()
+        print(f"✅ Recommendation precompute finished: {stats}")
+        
+        return jsonify({
+            "status": "success",
+            **stats,
+            "rate_limit": get_spotify_client().scheduler.stats(),
+            "metrics": get_metrics_buffer().stats(),
+        }), 200
+        
+    except Exception as e:
+        print(f"❌ Recommendation precompute error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@functions_framework.http
+def rebuild_genre_index_background(request):
+    """
+    Scheduled function that re-harvests the genre -> track/artist index.
+    Catalog searches need no user, so it runs on a client-credentials token.
+    """
+    try:
+        access_token = request_app_token()
+        if not access_token:
+            return jsonify({"error": "Could not obtain an app access token"}), 502
+
+        stats = rebuild_genre_index(access_token, db_client=get_firestore())
+        get_genre_index().clear()
+        print(f"✅ Genre index rebuilt: {stats}")
+
+        return jsonify({"status": "success", **stats, "rate_limit": get_spotify_client().scheduler.stats()}), 200
+
+    except Exception as e:
+        print(f"❌ Genre index rebuild error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@functions_framework.http
+def rebuild_feature_index_background(request):
+    """
+    Scheduled function that indexes audio features of played and genre-indexed
+    tracks for nearest-neighbour candidates. Run after the genre index rebuild.
+    """
+    try:
+        access_token = request_app_token()
+        if not access_token:
+            return jsonify({"error": "Could not obtain an app access token"}), 502
+
+        from functions.recommendations.feature_index import get_feature_index, rebuild_feature_index
+        stats = rebuild_feature_index(access_token, db_client=get_firestore())
+        get_feature_index().clear()
+        print(f"✅ Feature index rebuilt: {stats}")
+
+        return jsonify({"status": "success", **stats, "rate_limit": get_spotify_client().scheduler.stats()}), 200
+
+    except Exception as e:
+        print(f"❌ Feature index rebuild error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@functions_framework.http
+def build_co_listening_background(request):
+    """
+    Scheduled function that rebuilds the artist and track co-listening graphs
+    from every user's stored plays. ?days= sets the lookback (default 90).
+    """
+    try:
+        lookback_days = int(request.args.get("days", 90))
+        if not 1 <= lookback_days <= MAX_ANALYTICS_DAYS:
+            return jsonify({"error": f"days must be between 1 and {MAX_ANALYTICS_DAYS}"}), 400
+
+        from functions.recommendations.co_listening import build_co_listening_graph
+        stats = build_co_listening_graph(db_client=get_firestore(), lookback_days=lookback_days)
+        print(f"✅ Co-listening graph built: {stats}")
+
+        return jsonify({"status": "success", **stats}), 200
+
+    except Exception as e:
+        print(f"❌ Co-listening build error: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @functions_framework.http
 @cross_origin(**CORS_CONFIG)
 def get_listening_stats(request):
@@ -388,10 +464,13 @@ def get_listening_stats(request):
         if not user_id:
             return jsonify({"error": "Missing user_id"}), 400
 
-        # Get stats using the renamed imported function
+        from functions.analytics.history_operations import get_listening_stats as get_user_stats
         stats = get_user_stats(user_id)
 
-        return jsonify({"total_hours": stats.get("total_hours", 0)}), 200
+        return jsonify({
+            "total_hours": stats.get("total_hours", 0),
+            "total_plays": stats.get("total_plays", 0),
+        }), 200
 
     except Exception as e:
         print(f"Error in get_listening_stats: {str(e)}")
@@ -403,225 +482,556 @@ def get_listening_stats(request):
 @functions_framework.http
 @cross_origin(**CORS_CONFIG)
 def get_recommendations(request):
-    """Get personalized track recommendations using multiple strategies"""
+    """Get personalized track recommendations using multiple strategies.
+
+    Serves the materialized list while it is fresh. A stale list is still
+    served while a fresh one is generated in the background; only a user
+    with nothing stored (or ?refresh=true / ?seed=) waits for generation.
+    """
     try:
         user_id = request.args.get("user_id")
         print(f"Processing recommendations for user_id: {user_id}")
+        seed = request.args.get("seed", type=int)
+        force = request.args.get("refresh", "").lower() == "true" or seed is not None
         
-        # Get user data and validate
-        user_data = get_user_data(user_id)
-        access_token = user_data.get("access_token")
+        stored = None if force else load_recommendations(user_id)
+        if stored and not stored["stale"]:
+            return jsonify({
+                "tracks": stored["tracks"],
+                "cached": True,
+                "stale": False,
+                "age_seconds": stored["age_seconds"],
+            }), 200
+        
+        # Get a valid access token from the instance token cache
+        access_token = get_access_token(user_id)
+        
+        if stored:
+            if access_token:
+                schedule_recommendation_refresh(user_id, access_token)
+            return jsonify({
+                "tracks": stored["tracks"],
+                "cached": True,
+                "stale": True,
+                "age_seconds": stored["age_seconds"],
+            }), 200
         
         if not access_token:
             return jsonify({"error": "No access token found"}), 401
             
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json"
-        }
+        final_recommendations = generate_recommendations(user_id, access_token, seed=seed)
+        return jsonify({
+            "tracks": [track.to_dict() for track in final_recommendations],
+            "cached": False,
+            "stale": False,
+            "age_seconds": 0,
+        }), 200
         
-        # Initialize recommendation engine
+    except Exception as e:
+        print(f"Error in get_recommendations: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+def generate_recommendations(user_id, access_token, seed=None, catalog=None):
+    """Run every strategy, rank, log metrics and materialize the list.
+
+    ``catalog`` is a precompute run's shared catalog loader; it implies the
+    threaded recommender.
+    """
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json"
+    }
+    
+    # Generate recommendations using all strategies concurrently
+    if catalog is not None:
+        recommender = SpotifyRecommender(headers, catalog=catalog)
+        recommendations = collect_strategy_tracks(recommender)
+    elif USE_ASYNC_RECOMMENDER:
+        recommender = AsyncSpotifyRecommender(headers)
+        from functions.spotify.async_client import run_async
+        recommendations = run_async(collect_strategy_tracks_async(recommender))
+    else:
         recommender = SpotifyRecommender(headers)
+        recommendations = collect_strategy_tracks(recommender)
+    
+    # Popularity-balanced pool, diversified by genre and artist;
+    # a seed makes the final shuffle reproducible
+    genre_index = get_artist_genre_index()
+    final_recommendations = rank_recommendations(
+        recommendations,
+        seed=seed,
+        genre_lookup=lambda artist_ids: genre_index.genres(artist_ids, headers),
+    )
+    
+    # Log recommendation metrics
+    log_recommendation_metrics(final_recommendations, user_id)
+    store_recommendations(user_id, final_recommendations)
+    return final_recommendations
+
+# Users whose stale list is being regenerated on this instance
+_refreshing_users = set()
+_refreshing_lock = threading.Lock()
+
+def schedule_recommendation_refresh(user_id, access_token):
+    """Regenerate a user's list in the background, at most once at a time per user"""
+    with _refreshing_lock:
+        if user_id in _refreshing_users:
+            return None
+        _refreshing_users.add(user_id)
         
-        # Get seed data
-        top_artists = recommender.get_top_artists(limit=3)
-        top_tracks = recommender.get_top_tracks(limit=2)
-        
-        # Generate recommendations using different strategies
-        recommendations = []
-        seen_tracks = set()
-        
+    def refresh():
+        try:
+            generate_recommendations(user_id, access_token)
+        except Exception as e:
+            print(f"❌ Background recommendation refresh failed for {user_id}: {e}")
+        finally:
+            with _refreshing_lock:
+                _refreshing_users.discard(user_id)
+                
+    return refresh_executor.submit(refresh)
+
+def collect_strategy_tracks(recommender):
+    """Run every recommendation strategy concurrently and merge the results.
+
+    Tracks are merged in fixed strategy order (genre, similar artists, new
+    releases, rising artists) so de-duplication is deterministic no matter
+    which strategy finishes first.
+    """
+    # Get seed data
+    top_artists_future = strategy_executor.submit(recommender.get_top_artists, 3)
+    top_tracks_future = strategy_executor.submit(recommender.get_top_tracks, 2)
+    top_artists = top_artists_future.result()
+    top_tracks = top_tracks_future.result()
+    genres = extract_genres(top_artists)
+    
+    strategies = [
         # Strategy 1: Genre-based discovery
-        genre_tracks = recommender.get_genre_based_tracks(top_artists)
-        recommendations.extend(filter_unique_tracks(genre_tracks, seen_tracks))
-        
+        strategy_executor.submit(recommender.get_genre_based_tracks, top_artists),
         # Strategy 2: Similar artists' tracks
-        similar_artist_tracks = recommender.get_similar_artist_tracks(top_artists)
-        recommendations.extend(filter_unique_tracks(similar_artist_tracks, seen_tracks))
-        
+        strategy_executor.submit(recommender.get_similar_artist_tracks, top_artists, top_tracks),
         # Strategy 3: New releases in preferred genres
-        new_releases = recommender.get_new_releases_in_genres(extract_genres(top_artists))
-        recommendations.extend(filter_unique_tracks(new_releases, seen_tracks))
-        
+        strategy_executor.submit(recommender.get_new_releases_in_genres, genres),
         # Strategy 4: Rising artists in similar genres
-        rising_tracks = recommender.get_rising_artist_tracks(extract_genres(top_artists))
-        recommendations.extend(filter_unique_tracks(rising_tracks, seen_tracks))
+        strategy_executor.submit(recommender.get_rising_artist_tracks, genres),
+    ]
+    
+    recommendations = []
+    seen_tracks = set()
+    for future in strategies:
+        recommendations.extend(filter_unique_tracks(future.result(), seen_tracks))
+    return recommendations
+
+class SpotifyRecommender:
+    def __init__(self, headers, client=None, executor=None, genre_index=None, catalog=None,
+                 genre_catalog=None, feature_index=None, co_listening=None):
+        self.headers = headers
+        self.client = client or get_spotify_client()
+        self.executor = executor or spotify_executor
+        # Optional loader shared by every user in a precompute run
+        self.catalog = catalog
+        # Artists fetched along the way seed the genre index used for diversity
+        self.genre_index = genre_index or get_artist_genre_index()
+        # Genre -> candidate ids, consulted before any genre search
+        self.genre_catalog = genre_catalog or get_genre_index()
+        # Audio-feature and co-listening neighbours, consulted before any
+        # related-artists lookup
+        from functions.recommendations.co_listening import get_co_listening_index
+        from functions.recommendations.feature_index import get_feature_index
+        self.feature_index = feature_index or get_feature_index()
+        self.co_listening = co_listening or get_co_listening_index()
+        # Per-request loaders: an artist reached by two strategies is fetched
+        # once, and track lookups by id go out 50 per call
+        self._top_tracks = BatchLoader(
+            lambda ids, _: {ids[0]: self._fetch_top_tracks(ids[0])}, max_batch=1, memoize=True
+        )
+        self._tracks = BatchLoader(multi_id_fetcher(self.client, "/tracks", "tracks"), memoize=True)
         
-        # Balance and diversify recommendations
-        final_recommendations = balance_recommendations(recommendations)
+    def _map(self, fn, items):
+        """Run fn over items on the bounded call pool, preserving input order"""
+        return list(self.executor.map(fn, items))
         
-        # Log recommendation metrics
-        log_recommendation_metrics(final_recommendations, user_id)
+    def _catalog_json(self, path, params=None):
+        """GET a user-agnostic catalog resource, through the shared loader if any"""
+        if self.catalog is not None:
+            return self.catalog.load(catalog_key(path, params), self.headers).result()
+        return self.client.get_json(path, headers=self.headers, params=params)
         
-        return jsonify({"tracks": final_recommendations}), 200
+    def _search(self, query, item_type, limit):
+        return self._catalog_json(
+            "/search",
+            params={
+                "q": query,
+                "type": item_type,
+                "limit": limit,
+                "market": "US"
+            }
+        )
         
-    except Exception as e:
-        print(f"Error in get_recommendations: {str(e)}")
-        return jsonify({"error": str(e)}), 500
-
-class SpotifyRecommender:
-    def __init__(self, headers):
-        self.headers = headers
+    def _fetch_top_tracks(self, artist_id):
+        return self._catalog_json(f"/artists/{artist_id}/top-tracks", params={"market": "US"})
+        
+    def _artist_top_tracks(self, artist_id):
+        return self._top_tracks.load(artist_id).result()
+        
+    def get_tracks(self, track_ids):
+        """TrackRecords for track ids, in order, skipping unknown ids"""
+        tracks = self._tracks.load_many(track_ids, self.headers)
+        return [TrackRecord.from_spotify(tracks[i]) for i in track_ids if tracks.get(i)]
+        
+    def _related_artists(self, artist_id):
+        return self._catalog_json(f"/artists/{artist_id}/related-artists")
+        
+    def _related_ids(self, related_results):
+        return related_artist_ids(related_results, self.genre_index)
         
     def get_top_artists(self, limit=3):
-        response = requests.get(
-            f"https://api.spotify.com/v1/me/top/artists",
+        data = self.client.get_json(
+            "/me/top/artists",
             headers=self.headers,
             params={"limit": limit, "time_range": "medium_term"}
         )
-        return response.json().get('items', []) if response.status_code == 200 else []
+        artists = data.get('items', []) if data else []
+        self.genre_index.seed(artists)
+        return artists
         
     def get_top_tracks(self, limit=2):
-        response = requests.get(
-            f"https://api.spotify.com/v1/me/top/tracks",
+        data = self.client.get_json(
+            "/me/top/tracks",
             headers=self.headers,
             params={"limit": limit, "time_range": "medium_term"}
         )
-        return response.json().get('items', []) if response.status_code == 200 else []
+        return data.get('items', []) if data else []
+        
+    def _genre_tracks(self, genres, limit, year=None):
+        """Tracks per genre from the genre index, searching live only for the genres it misses"""
+        self.genre_catalog.load(genres)
+        indexed = {genre: self.genre_catalog.tracks(genre, limit, year) for genre in genres}
+        misses = [genre for genre in genres if indexed[genre] is None]
+        searched = dict(zip(misses, self._map(
+            lambda genre: self._search(genre_search_query(genre, year), "track", limit), misses
+        )))
+        records = self.genre_catalog.records(indexed_ids(indexed))
+        records.update((track.id, track) for track in self.get_tracks(unhydrated_ids(indexed, records)))
+        tracks, harvests = assemble_genre_tracks(genres, indexed, records, searched)
+        for genre, items in harvests:
+            self.genre_catalog.harvest(genre, tracks=items)
+        return tracks
         
     def get_genre_based_tracks(self, seed_artists, tracks_per_genre=3):
-        genres = extract_genres(seed_artists)
-        tracks = []
+        genres = extract_genres(seed_artists)[:3]  # Limit to top 3 genres
+        return self._genre_tracks(genres, tracks_per_genre)
         
-        for genre in genres[:3]:  # Limit to top 3 genres
-            search_response = requests.get(
-                "https://api.spotify.com/v1/search",
-                headers=self.headers,
-                params={
-                    "q": f"genre:{genre}",
-                    "type": "track",
-                    "limit": tracks_per_genre,
-                    "market": "US"
-                }
-            )
-            if search_response.status_code == 200:
-                tracks.extend(process_track_results(search_response.json().get('tracks', {}).get('items', [])))
-                
-        return tracks
+    def get_similar_artist_tracks(self, seed_artists, seed_tracks=()):
+        from functions.recommendations.co_listening import ARTISTS
+        # Neighbours of the top tracks come from local indexes, without catalog lookups
+        similar_ids = similar_track_ids(self.co_listening, self.feature_index.get(), seed_tracks)
+        if similar_ids:
+            return self.get_tracks(similar_ids)
         
-    def get_similar_artist_tracks(self, seed_artists):
-        tracks = []
-        for artist in seed_artists:
-            # Get related artists
-            related_response = requests.get(
-                f"https://api.spotify.com/v1/artists/{artist['id']}/related-artists",
-                headers=self.headers
-            )
-            if related_response.status_code == 200:
-                related_artists = related_response.json().get('artists', [])[:3]
-                for related_artist in related_artists:
-                    # Get their top tracks
-                    top_tracks_response = requests.get(
-                        f"https://api.spotify.com/v1/artists/{related_artist['id']}/top-tracks?market=US",
-                        headers=self.headers
-                    )
-                    if top_tracks_response.status_code == 200:
-                        tracks.extend(process_track_results(top_tracks_response.json().get('tracks', [])[:2]))
+        # Artists other listeners play alongside the seeds; Spotify's related
+        # artists, fetched in parallel, only when the graph knows none
+        related_ids = self.co_listening.neighbours(
+            ARTISTS, [artist['id'] for artist in seed_artists], per_item=RELATED_PER_SEED
+        )
+        if not related_ids:
+            related_results = self._map(lambda artist: self._related_artists(artist['id']), seed_artists)
+            related_ids = self._related_ids(related_results)
+        top_tracks_results = self._map(self._artist_top_tracks, related_ids)
         
+        tracks = []
+        for top_tracks in top_tracks_results:
+            if top_tracks:
+                tracks.extend(process_track_results(top_tracks.get('tracks', [])[:2]))
         return tracks
         
     def get_new_releases_in_genres(self, genres):
+        return self._genre_tracks(genres[:3], 3, year=datetime.now().year)
+        
+    def get_rising_artist_tracks(self, genres):
+        genres = genres[:3]
+        self.genre_catalog.load(genres)
+        indexed = {
+            genre: self.genre_catalog.artists(genre, 3, *RISING_ARTIST_POPULARITY) for genre in genres
+        }
+        misses = [genre for genre in genres if indexed[genre] is None]
+        searched = dict(zip(misses, self._map(
+            lambda genre: self._search(f"genre:{genre}", "artist", 3), misses
+        )))
+        rising_ids, harvests, rising_artists = assemble_rising_artists(genres, indexed, searched)
+        for genre, items in harvests:
+            self.genre_catalog.harvest(genre, artists=items)
+        self.genre_index.seed(rising_artists)
+        top_tracks_results = self._map(self._artist_top_tracks, rising_ids)
+        
         tracks = []
-        for genre in genres[:3]:
-            search_response = requests.get(
-                "https://api.spotify.com/v1/search",
-                headers=self.headers,
-                params={
-                    "q": f"genre:{genre} year:{datetime.now().year}",
-                    "type": "track",
-                    "limit": 3,
-                    "market": "US"
-                }
-            )
-            if search_response.status_code == 200:
-                tracks.extend(process_track_results(search_response.json().get('tracks', {}).get('items', [])))
+        for top_tracks in top_tracks_results:
+            if top_tracks:
+                tracks.extend(process_track_results(top_tracks.get('tracks', [])[:1]))
+        return tracks
+
+async def collect_strategy_tracks_async(recommender):
+    """asyncio version of collect_strategy_tracks with the same merge order"""
+    top_artists, top_tracks = await asyncio.gather(
+        recommender.get_top_artists(limit=3),
+        recommender.get_top_tracks(limit=2),
+    )
+    genres = extract_genres(top_artists)
+    
+    results = await asyncio.gather(
+        recommender.get_genre_based_tracks(top_artists),
+        recommender.get_similar_artist_tracks(top_artists, top_tracks),
+        recommender.get_new_releases_in_genres(genres),
+        recommender.get_rising_artist_tracks(genres),
+    )
+    
+    recommendations = []
+    seen_tracks = set()
+    for tracks in results:
+        recommendations.extend(filter_unique_tracks(tracks, seen_tracks))
+    return recommendations
+
+class AsyncSpotifyRecommender:
+    """Coroutine-based SpotifyRecommender for serving many users on one event loop.
+
+    Each instance handles one user's request; its semaphore bounds how many of
+    that request's Spotify calls are in flight at once.
+    """
+    def __init__(self, headers, client=None, max_concurrency=None, genre_index=None, genre_catalog=None,
+                 feature_index=None, co_listening=None):
+        self.headers = headers
+        self.client = client or get_async_spotify_client()
+        self.max_concurrency = max_concurrency or SPOTIFY_MAX_WORKERS
+        self.genre_index = genre_index or get_artist_genre_index()
+        self.genre_catalog = genre_catalog or get_genre_index()
+        from functions.recommendations.co_listening import get_co_listening_index
+        from functions.recommendations.feature_index import get_feature_index
+        self.feature_index = feature_index or get_feature_index()
+        self.co_listening = co_listening or get_co_listening_index()
+        self._semaphore = None
+        self._top_tracks = AsyncBatchLoader(
+            self._fetch_top_tracks_batch, max_batch=1, memoize=True
+        )
+        self._tracks = AsyncBatchLoader(self._fetch_tracks_batch, memoize=True)
         
+    async def _get_json(self, path, params=None):
+        # Created lazily so the semaphore binds to the loop running the request
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            return await self.client.get_json(path, headers=self.headers, params=params)
+        
+    async def _search(self, query, item_type, limit):
+        return await self._get_json(
+            "/search",
+            params={"q": query, "type": item_type, "limit": limit, "market": "US"}
+        )
+        
+    async def _fetch_top_tracks_batch(self, artist_ids, _):
+        artist_id = artist_ids[0]
+        return {artist_id: await self._get_json(f"/artists/{artist_id}/top-tracks", params={"market": "US"})}
+        
+    async def _fetch_tracks_batch(self, track_ids, _):
+        data = await self._get_json("/tracks", params={"ids": ",".join(track_ids)})
+        return {track['id']: track for track in (data or {}).get('tracks', []) if track}
+        
+    async def _artist_top_tracks(self, artist_id):
+        return await self._top_tracks.load(artist_id)
+        
+    def _related_ids(self, related_results):
+        return related_artist_ids(related_results, self.genre_index)
+        
+    async def get_tracks(self, track_ids):
+        """TrackRecords for track ids, in order, skipping unknown ids"""
+        tracks = await self._tracks.load_many(track_ids)
+        return [TrackRecord.from_spotify(tracks[i]) for i in track_ids if tracks.get(i)]
+        
+    async def get_top_artists(self, limit=3):
+        data = await self._get_json("/me/top/artists", params={"limit": limit, "time_range": "medium_term"})
+        artists = data.get('items', []) if data else []
+        self.genre_index.seed(artists)
+        return artists
+        
+    async def get_top_tracks(self, limit=2):
+        data = await self._get_json("/me/top/tracks", params={"limit": limit, "time_range": "medium_term"})
+        return data.get('items', []) if data else []
+        
+    async def _index_call(self, in_memory, fn, *args):
+        """Run an index lookup inline when it needs no Firestore read, else on index_executor"""
+        if in_memory:
+            return fn(*args)
+        return await asyncio.get_running_loop().run_in_executor(index_executor, fn, *args)
+        
+    async def _genre_tracks(self, genres, limit, year=None):
+        """Tracks per genre from the genre index, searching live only for the genres it misses"""
+        await self._index_call(self.genre_catalog.is_loaded(genres), self.genre_catalog.load, genres)
+        indexed = {genre: self.genre_catalog.tracks(genre, limit, year) for genre in genres}
+        misses = [genre for genre in genres if indexed[genre] is None]
+        records, *results = await asyncio.gather(
+            self._indexed_records(indexed),
+            *(self._search(genre_search_query(genre, year), "track", limit) for genre in misses)
+        )
+        tracks, harvests = assemble_genre_tracks(genres, indexed, records, dict(zip(misses, results)))
+        # Harvests are written back in the background
+        for genre, items in harvests:
+            self.genre_catalog.harvest(genre, tracks=items)
         return tracks
         
-    def get_rising_artist_tracks(self, genres):
-        tracks = []
-        for genre in genres[:3]:
-            search_response = requests.get(
-                "https://api.spotify.com/v1/search",
-                headers=self.headers,
-                params={
-                    "q": f"genre:{genre}",
-                    "type": "artist",
-                    "limit": 3,
-                    "market": "US"
-                }
+    async def _indexed_records(self, indexed):
+        """Records for genre index hits: stored details, else hydrated through /tracks"""
+        track_ids = indexed_ids(indexed)
+        records = await self._index_call(
+            self.genre_catalog.has_records(track_ids), self.genre_catalog.records, track_ids
+        )
+        records.update((track.id, track) for track in await self.get_tracks(unhydrated_ids(indexed, records)))
+        return records
+        
+    async def get_genre_based_tracks(self, seed_artists, tracks_per_genre=3):
+        genres = extract_genres(seed_artists)[:3]  # Limit to top 3 genres
+        return await self._genre_tracks(genres, tracks_per_genre)
+        
+    async def get_similar_artist_tracks(self, seed_artists, seed_tracks=()):
+        from functions.recommendations.co_listening import ARTISTS, TRACKS
+        # The feature index never blocks; co-listening lookups read Firestore on a miss
+        similar_ids = await self._index_call(
+            self.co_listening.is_cached(TRACKS, [track['id'] for track in seed_tracks]),
+            similar_track_ids, self.co_listening, self.feature_index.get(), seed_tracks,
+        )
+        if similar_ids:
+            return await self.get_tracks(similar_ids)
+        
+        seed_ids = [artist['id'] for artist in seed_artists]
+        related_ids = await self._index_call(
+            self.co_listening.is_cached(ARTISTS, seed_ids),
+            self.co_listening.neighbours, ARTISTS, seed_ids, RELATED_PER_SEED,
+        )
+        if not related_ids:
+            related_results = await asyncio.gather(
+                *(self._get_json(f"/artists/{artist['id']}/related-artists") for artist in seed_artists)
             )
-            if search_response.status_code == 200:
-                rising_artists = [
-                    artist for artist in search_response.json().get('artists', {}).get('items', [])
-                    if 20 <= artist.get('popularity', 0) <= 60  # Medium popularity artists
-                ]
-                for artist in rising_artists:
-                    top_tracks_response = requests.get(
-                        f"https://api.spotify.com/v1/artists/{artist['id']}/top-tracks?market=US",
-                        headers=self.headers
-                    )
-                    if top_tracks_response.status_code == 200:
-                        tracks.extend(process_track_results(top_tracks_response.json().get('tracks', [])[:1]))
+            related_ids = self._related_ids(related_results)
+        top_tracks_results = await asyncio.gather(
+            *(self._artist_top_tracks(artist_id) for artist_id in related_ids)
+        )
+        
+        tracks = []
+        for top_tracks in top_tracks_results:
+            if top_tracks:
+                tracks.extend(process_track_results(top_tracks.get('tracks', [])[:2]))
+        return tracks
+        
+    async def get_new_releases_in_genres(self, genres):
+        return await self._genre_tracks(genres[:3], 3, year=datetime.now().year)
+        
+    async def get_rising_artist_tracks(self, genres):
+        genres = genres[:3]
+        await self._index_call(self.genre_catalog.is_loaded(genres), self.genre_catalog.load, genres)
+        indexed = {
+            genre: self.genre_catalog.artists(genre, 3, *RISING_ARTIST_POPULARITY) for genre in genres
+        }
+        misses = [genre for genre in genres if indexed[genre] is None]
+        results = await asyncio.gather(*(self._search(f"genre:{genre}", "artist", 3) for genre in misses))
+        rising_ids, harvests, rising_artists = assemble_rising_artists(
+            genres, indexed, dict(zip(misses, results))
+        )
+        for genre, items in harvests:
+            self.genre_catalog.harvest(genre, artists=items)
+        self.genre_index.seed(rising_artists)
+        top_tracks_results = await asyncio.gather(
+            *(self._artist_top_tracks(artist_id) for artist_id in rising_ids)
+        )
         
+        tracks = []
+        for top_tracks in top_tracks_results:
+            if top_tracks:
+                tracks.extend(process_track_results(top_tracks.get('tracks', [])[:1]))
         return tracks
 
+def similar_track_ids(co_listening, feature_index, seed_tracks, k=SIMILAR_TRACKS_K):
+    """Up to k tracks co-listened with or sounding like the seed tracks, alternating sources.
+
+    Either source may be empty: no graph entries, or no loaded feature index.
+    """
+    from functions.recommendations.co_listening import TRACKS, interleave
+    seed_ids = [track['id'] for track in seed_tracks]
+    return interleave([
+        co_listening.neighbours(TRACKS, seed_ids, limit=k),
+        feature_index.nearest(seed_ids, k) if feature_index is not None else [],
+    ], k)
+
+def related_artist_ids(related_results, genre_index):
+    """Top related artists per seed from related-artists responses, seeding the genre index"""
+    related_artists = [
+        related_artist
+        for related in related_results if related
+        for related_artist in related.get('artists', [])[:RELATED_PER_SEED]
+    ]
+    genre_index.seed(related_artists)
+    return [artist['id'] for artist in related_artists]
+
+def genre_search_query(genre, year=None):
+    return f"genre:{genre} year:{year}" if year else f"genre:{genre}"
+
+def indexed_ids(indexed):
+    """Every track id among genre index hits"""
+    return [track_id for track_ids in indexed.values() if track_ids for track_id in track_ids]
+
+def unhydrated_ids(indexed, records):
+    """Ids among genre index hits with no stored display fields"""
+    return [track_id for track_id in indexed_ids(indexed) if track_id not in records]
+
+def assemble_genre_tracks(genres, indexed, records, searched):
+    """Merge per-genre results in genre order: index hits, else the live search.
+
+    ``records`` maps index hits to their TrackRecords, stored or hydrated.
+    Returns (tracks, [(genre, searched track items)] to harvest into the
+    index).
+    """
+    tracks, harvests = [], []
+    for genre in genres:
+        if indexed[genre] is not None:
+            tracks.extend(records[track_id] for track_id in indexed[genre] if track_id in records)
+            continue
+        items = (searched.get(genre) or {}).get('tracks', {}).get('items', [])
+        harvests.append((genre, items))
+        tracks.extend(process_track_results(items))
+    return tracks, harvests
+
+def assemble_rising_artists(genres, indexed, searched):
+    """Rising artist ids in genre order, from the index or else the live search.
+
+    Returns (artist ids, [(genre, searched artist items)] to harvest, the
+    searched artists that qualified).
+    """
+    low, high = RISING_ARTIST_POPULARITY
+    artist_ids, harvests, rising_artists = [], [], []
+    for genre in genres:
+        if indexed[genre] is not None:
+            artist_ids.extend(indexed[genre])
+            continue
+        items = (searched.get(genre) or {}).get('artists', {}).get('items', [])
+        harvests.append((genre, items))
+        rising = [artist for artist in items if low <= artist.get('popularity', 0) <= high]
+        rising_artists.extend(rising)
+        artist_ids.extend(artist['id'] for artist in rising)
+    return artist_ids, harvests, rising_artists
+
 def process_track_results(tracks):
-    """Process track results into a standardized format"""
-    return [{
-        'id': track['id'],
-        'name': track['name'],
-        'artists': [artist['name'] for artist in track['artists']],
-        'image_url': track['album']['images'][0]['url'] if track['album']['images'] else None,
-        'preview_url': track['preview_url'],
-        'external_url': track['external_urls']['spotify'],
-        'popularity': track['popularity'],
-        'release_date': track['album']['release_date']
-    } for track in tracks]
+    """Parse Spotify tracks into TrackRecords"""
+    return [TrackRecord.from_spotify(track) for track in tracks]
 
 def filter_unique_tracks(tracks, seen_tracks):
     """Filter out tracks that have already been seen"""
     unique_tracks = []
     for track in tracks:
-        if track['id'] not in seen_tracks:
+        if track.id not in seen_tracks:
             unique_tracks.append(track)
-            seen_tracks.add(track['id'])
+            seen_tracks.add(track.id)
     return unique_tracks
 
-def balance_recommendations(tracks, target_size=20):
-    """Balance recommendations for diversity"""
-    if not tracks:
-        return []
-    
-    # Sort by multiple factors
-    def score_track(track):
-        popularity = track['popularity']
-        is_recent = track['release_date'].startswith(str(datetime.now().year))
-        return (
-            0.4 * popularity +  # Weight popularity less
-            0.3 * (100 if is_recent else 50) +  # Boost recent tracks
-            0.3 * random.randint(0, 100)  # Add randomness
-        )
-    
-    tracks.sort(key=score_track, reverse=True)
-    
-    # Ensure genre diversity
-    genres_seen = set()
-    diverse_tracks = []
-    
-    for track in tracks:
-        artist_genres = set()  # You'd need to fetch this from artist data
-        if len(genres_seen.intersection(artist_genres)) < 2:  # Allow some genre overlap
-            diverse_tracks.append(track)
-            genres_seen.update(artist_genres)
-    
-    return diverse_tracks[:target_size]
-
-
 def get_top_artists(headers):
     """Get user's top artists"""
-    response = requests.get(
-        "https://api.spotify.com/v1/me/top/artists",
+    response = get_spotify_client().get(
+        "/me/top/artists",
         headers=headers,
         params={"limit": 5, "time_range": "medium_term"}
     )
@@ -647,8 +1057,8 @@ def perform_search(headers, query, filters=None):
     if filters:
         params["q"] = f"{params['q']} {filters}"
     
-    return requests.get(
-        "https://api.spotify.com/v1/search",
+    return get_spotify_client().get(
+        "/search",
         headers=headers,
         params=params
     )
@@ -661,69 +1071,46 @@ def process_search_results(response, all_tracks, seen_ids, seen_artists, max_per
     tracks = response.json().get('tracks', {}).get('items', [])
     for track in tracks:
         if track['id'] not in seen_ids:
-            primary_artist = track['artists'][0]['name']
+            record = TrackRecord.from_spotify(track)
+            primary_artist = record.primary_artist
             if seen_artists.get(primary_artist, 0) < max_per_artist:
-                all_tracks.append({
-                    'id': track['id'],
-                    'name': track['name'],
-                    'artists': [artist['name'] for artist in track['artists']],
-                    'image_url': track['album']['images'][0]['url'] if track['album']['images'] else None,
-                    'preview_url': track['preview_url'],
-                    'external_url': track['external_urls']['spotify'],
-                    'popularity': track['popularity'],
-                    'release_date': track['album']['release_date']
-                })
-                seen_ids.add(track['id'])
+                all_tracks.append(record)
+                seen_ids.add(record.id)
                 seen_artists[primary_artist] = seen_artists.get(primary_artist, 0) + 1
 
-def balance_recommendations(tracks, target_size=20):
-    """Balance recommendations by popularity and release date"""
+def log_recommendation_metrics(tracks, user_id):
+    """Queue recommendation metrics for the next batched Firestore write"""
     if not tracks:
-        return []
+        return
         
-    # Sort by popularity and date
-    tracks.sort(key=lambda x: (x['popularity'], x['release_date']), reverse=True)
-    
-    # Create balanced selection
-    high_pop = [t for t in tracks if t['popularity'] >= 70][:4]
-    med_pop = [t for t in tracks if 40 <= t['popularity'] < 70][:4]
-    low_pop = [t for t in tracks if t['popularity'] < 40][:2]
-    
-    balanced = high_pop + med_pop + low_pop
+    # One pass over the records for every aggregate
+    with_preview = total_popularity = 0
+    distribution = {'high': 0, 'medium': 0, 'low': 0}
+    artists = set()
+    for t in tracks:
+        with_preview += 1 if t.preview_url else 0
+        total_popularity += t.popularity
+        artists.update(t.artists)
+        if t.popularity >= 70:
+            distribution['high'] += 1
+        elif t.popularity >= 40:
+            distribution['medium'] += 1
+        else:
+            distribution['low'] += 1
+    release_dates = [t.release_date for t in tracks]
     
-    # Ensure we have enough tracks
-    while len(balanced) < target_size and tracks:
-        remaining = [t for t in tracks if t not in balanced]
-        if not remaining:
-            break
-        balanced.append(remaining[0])
-    
-    # Shuffle the final selection
-    import random
-    random.shuffle(balanced)
-    
-    return balanced[:target_size]
-
-def log_recommendation_metrics(tracks, user_id):
-    """Log recommendation metrics to Firestore"""
     metrics = {
         'timestamp': datetime.now(),
         'total_tracks': len(tracks),
-        'tracks_with_preview': len([t for t in tracks if t['preview_url']]),
-        'unique_artists': len(set(artist for t in tracks for artist in t['artists'])),
-        'avg_popularity': sum(t['popularity'] for t in tracks) / len(tracks),
-        'popularity_distribution': {
-            'high': len([t for t in tracks if t['popularity'] >= 70]),
-            'medium': len([t for t in tracks if 40 <= t['popularity'] < 70]),
-            'low': len([t for t in tracks if t['popularity'] < 40])
-        },
+        'tracks_with_preview': with_preview,
+        'unique_artists': len(artists),
+        'avg_popularity': total_popularity / len(tracks),
+        'popularity_distribution': distribution,
         'release_dates': {
-            'newest': max(t['release_date'] for t in tracks),
-            'oldest': min(t['release_date'] for t in tracks)
+            'newest': max(release_dates),
+            'oldest': min(release_dates)
         }
     }
     
-    db = firestore.Client()
-    metrics_ref = db.collection('metrics').document(user_id).collection('recommendations')
-    metrics_ref.add(metrics)
+    get_metrics_buffer().add(user_id, metrics)
     
\ No newline at end of file
@@ -0,0 +1,259 @@
+# firestore_fake.py
+"""In-memory stand-in for the parts of firestore.Client the backend uses"""
+import copy
+import operator
+import threading
+import uuid
+
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition
+
+# Points clients at a local emulator under a placeholder project, so a test
+# that does build one never needs credentials or reaches a real project
+OFFLINE_ENV = {
+    "GOOGLE_CLOUD_PROJECT": "offline-tests",
+    "FIRESTORE_EMULATOR_HOST": "localhost:8080",
+}
+
+OPERATORS = {
+    "==": operator.eq,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "in": lambda value, options: value in options,
+}
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id, data, reference=None, update_time=None):
+        self.id = doc_id
+        self._data = data
+        self.exists = data is not None
+        self.reference = reference
+        self.update_time = update_time
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+def _is_increment(value):
+    return type(value).__name__ == "Increment"
+
+
+def _deep_merge(target, data):
+    for key, value in data.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _deep_merge(target[key], value)
+        elif _is_increment(value):
+            target[key] = target.get(key, 0) + value.value
+        else:
+            target[key] = _resolve(value)
+
+
+def _resolve(value):
+    """Apply transforms in a value written to a missing field"""
+    if isinstance(value, dict):
+        return {key: _resolve(v) for key, v in value.items()}
+    return value.value if _is_increment(value) else value
+
+
+class FakeDocument:
+    def __init__(self, store, path):
+        self._store = store
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def get(self):
+        self._store.reads += 1
+        return self._store.snapshot(self.path, self)
+
+    def set(self, data, merge=False):
+        # Each write is atomic, as it is in Firestore
+        with self._store.lock:
+            self._store.touch(self.path)
+            if merge and self.path in self._store.docs:
+                _deep_merge(self._store.docs[self.path], copy.deepcopy(data))
+            else:
+                self._store.docs[self.path] = _resolve(copy.deepcopy(data))
+
+    def create(self, data):
+        with self._store.lock:
+            self._store.check(self.path, FakeWriteOption(exists=False))
+            self.set(data)
+
+    def update(self, data, option=None):
+        with self._store.lock:
+            if option is not None:
+                self._store.check(self.path, option)
+            self._store.touch(self.path)
+            if self.path not in self._store.docs:
+                raise KeyError(f"No document to update: {self.path}")
+            self._store.docs[self.path].update(data)
+
+    def delete(self):
+        with self._store.lock:
+            self._store.touch(self.path)
+            self._store.docs.pop(self.path, None)
+
+    def collection(self, name):
+        return FakeCollection(self._store, f"{self.path}/{name}")
+
+
+class FakeCollection:
+    def __init__(self, store, path):
+        self._store = store
+        self.path = path
+
+    def document(self, doc_id=None):
+        return FakeDocument(self._store, f"{self.path}/{doc_id or uuid.uuid4().hex[:20]}")
+
+    def where(self, filter):
+        return FakeQuery(self, [filter])
+
+    def select(self, field_paths):
+        """Projection; the fake always returns whole documents"""
+        return FakeQuery(self, [])
+
+    def stream(self):
+        return FakeQuery(self, []).stream()
+
+
+class FakeQuery:
+    def __init__(self, collection, filters):
+        self._collection = collection
+        self._filters = filters
+
+    def where(self, filter):
+        return FakeQuery(self._collection, self._filters + [filter])
+
+    def _matches(self, data):
+        for f in self._filters:
+            if f.field_path not in data:
+                return False
+            if not OPERATORS[f.op_string](data[f.field_path], f.value):
+                return False
+        return True
+
+    def stream(self):
+        store = self._collection._store
+        prefix = f"{self._collection.path}/"
+        for path in sorted(store.docs):
+            if path.startswith(prefix) and "/" not in path[len(prefix):]:
+                if not self._matches(store.docs[path]):
+                    continue
+                store.reads += 1
+                yield store.snapshot(path, FakeDocument(store, path))
+
+
+class FakeWriteOption:
+    """Precondition from ``write_option``: a last update time or existence"""
+
+    def __init__(self, last_update_time=None, exists=None):
+        self.last_update_time = last_update_time
+        self.exists = exists
+
+
+class FakeBatch:
+    """Write batch; checks preconditions, then applies queued writes, on commit"""
+
+    def __init__(self, store):
+        self._store = store
+        self._writes = []
+        self._preconditions = []
+
+    def set(self, reference, data, merge=False):
+        self._writes.append(lambda: reference.set(data, merge=merge))
+
+    def create(self, reference, data):
+        self._preconditions.append((reference, FakeWriteOption(exists=False)))
+        self._writes.append(lambda: reference.set(data))
+
+    def update(self, reference, data, option=None):
+        if option is not None:
+            self._preconditions.append((reference, option))
+        self._writes.append(lambda: reference.update(data))
+
+    def commit(self):
+        if len(self._writes) > 500:
+            raise ValueError("A batch can contain at most 500 writes")
+        # All or nothing, as in Firestore
+        with self._store.lock:
+            for reference, option in self._preconditions:
+                self._store.check(reference.path, option)
+            self._store.commits += 1
+            for write in self._writes:
+                write()
+        self._writes = []
+        self._preconditions = []
+
+
+class FakeBulkWriter:
+    """BulkWriter stand-in; writes apply immediately and close() flushes nothing"""
+
+    def __init__(self, store):
+        self._store = store
+        self.closed = False
+
+    def set(self, reference, data, merge=False):
+        reference.set(data, merge=merge)
+
+    def update(self, reference, data):
+        reference.update(data)
+
+    def delete(self, reference):
+        reference.delete()
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+        self._store.bulk_writers_closed += 1
+
+
+class FakeFirestore:
+    """Documents are kept in ``docs`` keyed by their full slash-separated path"""
+
+    def __init__(self):
+        self.docs = {}
+        self.lock = threading.RLock()
+        self.reads = 0
+        self.writes = 0
+        self.commits = 0
+        self.bulk_writers_closed = 0
+        # Stand-in for update_time: the store-wide write count at a doc's last write
+        self.versions = {}
+
+    def touch(self, path):
+        self.writes += 1
+        self.versions[path] = self.writes
+
+    def check(self, path, option):
+        """Raise as Firestore does when a write precondition fails"""
+        if option.exists is False and path in self.docs:
+            raise AlreadyExists(f"Document already exists: {path}")
+        if option.last_update_time is not None and self.versions.get(path, 0) != option.last_update_time:
+            raise FailedPrecondition(f"Document changed since it was read: {path}")
+
+    def snapshot(self, path, reference):
+        with self.lock:
+            # Snapshots keep the data as read, unaffected by later writes
+            data = copy.deepcopy(self.docs.get(path))
+            update_time = self.versions.get(path, 0) if data is not None else None
+            return FakeSnapshot(reference.id, data, reference, update_time)
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def get_all(self, references):
+        for reference in references:
+            yield reference.get()
+
+    def bulk_writer(self):
+        return FakeBulkWriter(self)
+
+    def write_option(self, last_update_time=None, exists=None):
+        return FakeWriteOption(last_update_time, exists)
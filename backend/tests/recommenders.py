@@ -0,0 +1,25 @@
+# recommenders.py
+"""Recommenders with the local indexes disabled, for tests and benchmarks"""
+from functions.recommendations.co_listening import CoListeningIndex
+from functions.recommendations.feature_index import FeatureIndexHandle
+from functions.recommendations.genre_index import GenreIndex
+from main import AsyncSpotifyRecommender, SpotifyRecommender
+
+
+# The genre, audio-feature and co-listening indexes default to shared
+# Firestore-backed instances; keyword arguments swap any of them back in,
+# e.g. genre_catalog=GenreIndex(db)
+def disabled_indexes():
+    return {
+        "genre_catalog": GenreIndex(),
+        "feature_index": FeatureIndexHandle(),
+        "co_listening": CoListeningIndex(),
+    }
+
+
+def make_recommender(headers, client, **kwargs):
+    return SpotifyRecommender(headers, client=client, **{**disabled_indexes(), **kwargs})
+
+
+def make_async_recommender(headers, client, **kwargs):
+    return AsyncSpotifyRecommender(headers, client=client, **{**disabled_indexes(), **kwargs})
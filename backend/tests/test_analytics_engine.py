@@ -0,0 +1,77 @@
+# test_analytics_engine.py
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from functions.analytics.engine import (
+    DAY_MS,
+    HOUR_MS,
+    event_arrays,
+    listening_history,
+    parse_played_at,
+    summarize_listening,
+)
+
+NOW_MS = 1767268800000  # 2026-01-01T12:00:00Z, a Thursday
+MINUTE_MS = 60 * 1000
+
+
+def test_parse_played_at_matches_spotify_timestamps():
+    parsed = parse_played_at(["2026-01-01T12:00:00.000Z", "2026-01-01T12:00:01.5Z", "2026-01-01T12:00:02Z"])
+    assert parsed.tolist() == [NOW_MS, NOW_MS + 1500, NOW_MS + 2000]
+
+
+def test_history_keeps_the_dashboard_shape():
+    played = np.array([NOW_MS - 1000, NOW_MS - DAY_MS, NOW_MS - 6 * DAY_MS, NOW_MS - 8 * DAY_MS])
+    durations = np.full(4, 30 * MINUTE_MS)
+
+    summary = listening_history(played, durations, days=7, now_ms=NOW_MS)
+
+    assert [day['date'] for day in summary['history']] == ['Fri', 'Sat', 'Sun', 'Mon', 'Tue', 'Wed', 'Thu']
+    assert [day['count'] for day in summary['history']] == [1, 0, 0, 0, 0, 1, 1]
+    assert summary['history'][-1]['timestamp'] == (NOW_MS - 12 * HOUR_MS) / 1000
+    assert summary['history'][-1]['duration_ms'] == 30 * MINUTE_MS
+    assert summary['total_hours'] == 1.5
+
+
+def test_windows_share_one_pass_and_nest():
+    played = NOW_MS - np.arange(400) * DAY_MS
+    summary = summarize_listening(played, np.ones(400, dtype=np.int64), now_ms=NOW_MS)
+
+    for days in (7, 30, 90, 365):
+        history = summary['windows'][days]['history']
+        assert len(history) == days
+        assert sum(day['count'] for day in history) == days
+    assert summary['windows'][30]['history'][-1]['date'] == "2026-01-01"
+    assert summary['plays'] == 365
+    assert sum(map(sum, summary['heatmap'])) == 365
+
+
+def test_timezone_moves_plays_across_days_and_hours():
+    # 02:30 UTC on Thursday is 21:30 Wednesday in New York
+    played = event_arrays([["t1", NOW_MS - 9 * HOUR_MS - 30 * MINUTE_MS, 1000, "a1"]])
+
+    utc = summarize_listening(*played, windows=(7,), now_ms=NOW_MS)
+    local = summarize_listening(*played, windows=(7,), tz="America/New_York", now_ms=NOW_MS)
+
+    assert utc['windows'][7]['history'][-1]['count'] == 1
+    assert local['windows'][7]['history'][-2]['count'] == 1
+    assert local['windows'][7]['history'][-2]['date'] == 'Wed'
+    assert utc['heatmap'][3][2] == 1
+    assert local['heatmap'][2][21] == 1
+    # Local midnight in New York is 05:00 UTC
+    assert local['windows'][7]['history'][-1]['timestamp'] == (NOW_MS - 7 * HOUR_MS) / 1000
+
+
+def test_daylight_saving_transition_is_exact():
+    # US clocks went forward at 2026-03-08T07:00:00Z
+    transition = 1772953200000
+    played = np.array([transition - MINUTE_MS, transition + MINUTE_MS])
+    summary = summarize_listening(played, np.zeros(2, dtype=np.int64), windows=(7,),
+                                  tz="America/New_York", now_ms=transition + DAY_MS)
+    # 01:59 EST and 03:01 EDT, both on Sunday
+    assert summary['heatmap'][6][1] == 1
+    assert summary['heatmap'][6][3] == 1
@@ -0,0 +1,132 @@
+# test_batch_loader.py
+import asyncio
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.stub_spotify import StubSpotifyServer
+from functions.spotify.async_client import AsyncSpotifyClient
+from functions.spotify.batch_loader import AsyncBatchLoader, BatchLoader
+from functions.spotify.client import SpotifyClient
+from tests.recommenders import make_async_recommender, make_recommender
+
+HEADERS = {"Authorization": "Bearer stub"}
+
+
+class RecordingBatch:
+    def __init__(self, delay=0.0):
+        self.calls = []
+        self.delay = delay
+        self.lock = threading.Lock()
+
+    def __call__(self, keys, context):
+        with self.lock:
+            self.calls.append(list(keys))
+        threading.Event().wait(self.delay)
+        return {key: f"value-{key}" for key in keys if key != "missing"}
+
+
+def test_concurrent_loads_coalesce_into_chunks_of_50():
+    batch = RecordingBatch(delay=0.1)
+    loader = BatchLoader(batch, window=0.02)
+
+    # Callers on many threads queue ids before any of them waits
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futures = list(pool.map(lambda i: loader.load(f"id{i % 60}"), range(120)))
+    values = [future.result() for future in futures]
+
+    assert values == [f"value-id{i % 60}" for i in range(120)]
+    assert sorted(len(call) for call in batch.calls) == [10, 50]
+    assert loader.stats() == {'requested': 120, 'deduped': 60, 'batches': 2}
+
+
+def test_in_flight_keys_share_one_request_and_errors_reach_every_caller():
+    batch = RecordingBatch(delay=0.05)
+    loader = BatchLoader(batch, max_batch=1)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(lambda _: loader.load("a").result(), range(4)))
+    assert results == ["value-a"] * 4
+    assert batch.calls == [["a"]]
+    assert loader.load_many(["missing"]) == {"missing": None}
+
+    def fail(keys, context):
+        raise RuntimeError("upstream down")
+
+    failing = BatchLoader(fail, window=0)
+    future = failing.load("x")
+    try:
+        future.result()
+        assert False, "expected the batch error"
+    except RuntimeError:
+        pass
+    # Failures are not memoized
+    assert failing.load("x") is not future
+
+
+def test_context_key_keeps_contexts_in_separate_batches():
+    contexts = []
+
+    def batch(keys, context):
+        contexts.append((context, sorted(keys)))
+        return {key: f"{context}-{key}" for key in keys}
+
+    loader = BatchLoader(batch, window=0.02, context_key=lambda context: context)
+    futures = [loader.load(key, context) for context, key in (("A", "x"), ("B", "x"), ("A", "y"))]
+
+    assert [future.result() for future in futures] == ["A-x", "B-x", "A-y"]
+    assert sorted(contexts) == [("A", ["x", "y"]), ("B", ["x"])]
+    assert loader.stats() == {'requested': 3, 'deduped': 0, 'batches': 2}
+
+
+def test_async_loader_coalesces_within_the_window():
+    calls = []
+
+    async def batch(keys, context):
+        calls.append(list(keys))
+        return {key: key.upper() for key in keys}
+
+    async def run():
+        loader = AsyncBatchLoader(batch, memoize=True)
+        values = await asyncio.gather(*(loader.load(key) for key in "abcab"))
+        again = await loader.load_many(["a", "c"])
+        return values, again
+
+    values, again = asyncio.run(run())
+    assert values == ["A", "B", "C", "A", "B"]
+    assert again == {"a": "A", "c": "C"}
+    assert calls == [["a", "b", "c"]]
+
+
+def test_recommenders_fetch_each_artists_top_tracks_once():
+    seeds = [{'id': "top0"}, {'id': "top0"}]
+    with StubSpotifyServer() as server:
+        base_url = f"{server.base_url}/v1"
+        client = SpotifyClient(api_base_url=base_url)
+        recommender = make_recommender(HEADERS, client)
+        server.reset_counters()
+        sync_tracks = recommender.get_similar_artist_tracks(seeds)
+        # 2 related-artists calls, then top-tracks for 3 distinct artists, not 6
+        assert server.requests == 2 + 3
+        assert [t.id for t in recommender.get_tracks(["t1", "t2", "t1"])] == ["t1", "t2", "t1"]
+        client.close()
+
+        async def run():
+            async_client = AsyncSpotifyClient(api_base_url=base_url)
+            try:
+                async_recommender = make_async_recommender(HEADERS, async_client)
+                server.reset_counters()
+                tracks = await async_recommender.get_similar_artist_tracks(seeds)
+                calls = server.requests
+                records = await async_recommender.get_tracks([f"t{i}" for i in range(60)])
+                return tracks, calls, records
+            finally:
+                await async_client.close()
+
+        async_tracks, async_calls, records = asyncio.run(run())
+
+    assert async_calls == 2 + 3
+    assert [t.id for t in async_tracks] == [t.id for t in sync_tracks]
+    assert len(records) == 60
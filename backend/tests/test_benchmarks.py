@@ -0,0 +1,38 @@
+# test_benchmarks.py
+import importlib
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from tests.firestore_fake import OFFLINE_ENV
+
+# Each benchmark's main() with arguments small enough for the test suite
+BENCHMARKS = (
+    ("bench_analytics", (2_000,)),
+    ("bench_async_recommender", (2, 4, 0.001)),
+    ("bench_co_listening", (20, 20, 100)),
+    ("bench_cold_start", (1,)),
+    ("bench_connection_pool", (1,)),
+    ("bench_event_store", (5, 2, 20)),
+    ("bench_feature_index", (2_000, 5, 3)),
+    ("bench_ranking", ((200,),)),
+    ("bench_track_records", (200,)),
+)
+
+
+def test_every_benchmark_is_covered():
+    modules = {path.stem for path in (Path(__file__).parent.parent / "benchmarks").glob("bench_*.py")}
+    assert modules == {name for name, _ in BENCHMARKS}
+
+
+@pytest.mark.parametrize("name,args", BENCHMARKS, ids=[name for name, _ in BENCHMARKS])
+def test_benchmark_runs(name, args, monkeypatch, capsys):
+    # Benchmarks default these at import; keep them scoped to the test
+    for key, value in OFFLINE_ENV.items():
+        monkeypatch.setenv(key, value)
+    module = importlib.import_module(f"benchmarks.{name}")
+    module.main(*args)
+    assert capsys.readouterr().out
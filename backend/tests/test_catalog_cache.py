@@ -0,0 +1,98 @@
+# test_catalog_cache.py
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.stub_spotify import StubSpotifyServer
+from functions.spotify.cache import CatalogCache
+from functions.spotify.client import SpotifyClient
+from main import collect_strategy_tracks
+from tests.recommenders import make_recommender
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+TOP_TRACKS = {'tracks': [{'id': 't1', 'name': 'Song'}]}
+
+
+def test_only_catalog_endpoints_are_cacheable():
+    cache = CatalogCache()
+    assert cache.is_cacheable("/artists/abc/top-tracks", {"market": "US"})
+    assert cache.is_cacheable("/artists/abc/related-artists")
+    assert cache.is_cacheable("/search", {"q": "genre:indie rock", "type": "track"})
+    assert not cache.is_cacheable("/search", {"q": "taylor", "type": "track"})
+    assert not cache.is_cacheable("/me/top/artists", {"limit": 3})
+
+
+def test_key_normalizes_param_order_and_query_case():
+    a = CatalogCache.key("/search", {"q": "genre:Indie  Rock", "type": "track", "limit": 3})
+    b = CatalogCache.key("/search", {"limit": "3", "type": "track", "q": "genre:indie rock"})
+    assert a == b
+
+
+def test_ttl_expiry_and_counters():
+    clock = FakeClock()
+    cache = CatalogCache(clock=clock)
+    path = "/artists/abc/top-tracks"
+
+    assert cache.lookup(path, {"market": "US"}) == (False, None)
+    cache.store(path, {"market": "US"}, TOP_TRACKS)
+    assert cache.lookup(path, {"market": "US"}) == (True, TOP_TRACKS)
+
+    clock.now += 6 * 60 * 60 + 1
+    assert cache.lookup(path, {"market": "US"}) == (False, None)
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 2
+    assert cache.stats()['entries'] == 0
+
+
+def test_negative_caching_for_404_and_empty_results():
+    clock = FakeClock()
+    cache = CatalogCache(clock=clock, negative_ttl=60)
+    cache.store_response("/artists/gone/related-artists", None, 404, None)
+    cache.store_response("/search", {"q": "genre:nothing"}, 200, {'tracks': {'items': []}})
+    cache.store_response("/artists/busy/top-tracks", None, 429, None)
+
+    assert cache.lookup("/artists/gone/related-artists") == (True, None)
+    assert cache.lookup("/search", {"q": "genre:nothing"}) == (True, None)
+    assert cache.lookup("/artists/busy/top-tracks") == (False, None)
+    assert cache.stats()['negative_hits'] == 2
+
+    clock.now += 61
+    assert cache.lookup("/artists/gone/related-artists") == (False, None)
+
+
+def test_lru_eviction_respects_memory_bound():
+    cache = CatalogCache(max_bytes=400)
+    for i in range(20):
+        cache.store(f"/artists/a{i}/top-tracks", None, TOP_TRACKS)
+        # Keep the first artist hot so it survives eviction
+        cache.lookup("/artists/a0/top-tracks")
+
+    stats = cache.stats()
+    assert stats['bytes'] <= 400
+    assert stats['evictions'] > 0
+    assert cache.lookup("/artists/a0/top-tracks")[0]
+    assert not cache.lookup("/artists/a1/top-tracks")[0]
+
+
+def test_warm_instance_skips_upstream_catalog_calls():
+    with StubSpotifyServer() as server:
+        client = SpotifyClient(api_base_url=f"{server.base_url}/v1", cache=CatalogCache())
+        recommender = make_recommender({"Authorization": "Bearer stub"}, client)
+
+        cold = collect_strategy_tracks(recommender)
+        server.reset_counters()
+        warm = collect_strategy_tracks(recommender)
+        client.close()
+
+    assert warm == cold
+    # Only the user-specific /me/top/artists and /me/top/tracks go upstream
+    assert server.requests == 2
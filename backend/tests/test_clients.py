@@ -0,0 +1,50 @@
+# test_clients.py
+import os
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from functions import clients
+from functions.recommendations import recommendation_operations
+from tests.firestore_fake import OFFLINE_ENV, FakeFirestore
+
+
+def test_firestore_client_is_created_once_on_first_use(monkeypatch):
+    created = []
+
+    class CountingClient(FakeFirestore):
+        def __init__(self):
+            super().__init__()
+            created.append(self)
+
+    monkeypatch.setattr(clients, "_firestore", None)
+    monkeypatch.setattr("google.cloud.firestore.Client", CountingClient)
+    threads = [threading.Thread(target=clients.get_firestore) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(created) == 1
+    assert clients.get_firestore() is created[0]
+    # Modules read through the shared client
+    assert recommendation_operations.load_recommendations("u1") is None
+    assert created[0].reads == 1
+
+
+def test_importing_main_builds_no_clients_and_defers_heavy_modules():
+    script = (
+        "import sys, main\n"
+        "from functions import clients\n"
+        "from functions.spotify import client, cache\n"
+        "print(clients._firestore, client._client, cache._cache,\n"
+        "      [m for m in ('numpy', 'aiohttp') if m in sys.modules])\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", script], cwd=Path(__file__).parent.parent,
+        env={**os.environ, **OFFLINE_ENV}, capture_output=True, text=True, check=True,
+    ).stdout
+    assert output.split("\n")[-2] == "None None None []"
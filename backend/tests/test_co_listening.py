@@ -0,0 +1,135 @@
+# test_co_listening.py
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.stub_spotify import StubSpotifyServer
+from functions.analytics.event_store import day_id
+from functions.recommendations.co_listening import (
+    TRACKS,
+    CoListeningBuilder,
+    CoListeningIndex,
+    build_co_listening_graph,
+    interleave,
+)
+from functions.spotify.client import SpotifyClient
+from tests.firestore_fake import FakeFirestore
+from tests.recommenders import make_recommender
+
+HEADERS = {"Authorization": "Bearer stub"}
+MINUTE_MS = 60 * 1000
+NOW_MS = 1_760_000_000_000
+
+
+def test_builder_counts_pairs_within_window_and_session_gap():
+    builder = CoListeningBuilder(window=2, gap_ms=30 * MINUTE_MS)
+    # a b c, then a new session an hour later: a b
+    builder.add_sequence(["a", "b", "c", "a", "b"], [0, 1, 2, 60 * MINUTE_MS, 60 * MINUTE_MS + 1])
+    builder.add_sequence(["b", "a", None], [5, 0, 9])
+
+    graph = {item: dict(zip(ids, scores)) for item, ids, scores in builder.neighbours(min_count=1)}
+    # (a, b) three times, (a, c) and (b, c) once; nothing across the session gap
+    assert builder.pairs == 6
+    assert list(graph["a"]) == ["b", "c"]
+    assert graph["a"]["b"] == round(3 / np.sqrt(3 * 3), 4)
+    assert set(graph["c"]) == {"a", "b"}
+
+    assert [item for item, _, _ in builder.neighbours(min_count=2)] == ["a", "b"]
+    assert [len(ids) for _, ids, _ in builder.neighbours(top_n=1, min_count=1)] == [1, 1, 1]
+
+
+def test_chunked_counts_match_a_single_fold():
+    rng = np.random.default_rng(3)
+    sessions = [
+        ([f"t{i}" for i in rng.integers(0, 200, 60)], sorted(rng.integers(0, 10**7, 60).tolist()))
+        for _ in range(50)
+    ]
+    single, chunked = CoListeningBuilder(), CoListeningBuilder(chunk_pairs=100)
+    for item_ids, played_ms in sessions:
+        single.add_sequence(item_ids, played_ms)
+        chunked.add_sequence(item_ids, played_ms)
+
+    assert chunked.pairs == single.pairs
+    assert list(chunked.neighbours()) == list(single.neighbours())
+
+
+def test_interleave_alternates_groups_and_skips_excluded():
+    assert interleave([["x", "y"], ["y", "z", "w"]], 3) == ["x", "y", "z"]
+    assert interleave([["seed", "x"], ["x"]], 5, exclude=["seed"]) == ["x"]
+
+
+def store_user_plays(db, user_id, plays):
+    """Write (track id, artist id, minutes ago) plays into day shards"""
+    for track_id, artist_id, minutes_ago in plays:
+        ms = NOW_MS - minutes_ago * MINUTE_MS
+        doc = db.docs.setdefault(f"users/{user_id}/plays/{day_id(ms)}", {'plays': {}})
+        doc['plays'][f"{ms}:{track_id}"] = [track_id, ms, 180000, artist_id]
+    db.docs[f"users/{user_id}"] = {'display_name': user_id}
+
+
+def test_graph_build_writes_neighbours_and_serves_cached_lookups():
+    db = FakeFirestore()
+    for user in range(3):
+        store_user_plays(db, f"user{user}", [
+            ("t1", "artist-a", 12), ("t2", "artist-b", 9), ("t3", "artist-b", 6), ("t4", "artist-c", 3),
+        ])
+    store_user_plays(db, "lapsed", [("t1", "artist-a", 200 * 24 * 60), ("t9", "artist-z", 200 * 24 * 60 - 1)])
+
+    stats = build_co_listening_graph(db, now_ms=NOW_MS)
+    assert (stats['users'], stats['plays'], stats['tracks'], stats['artists']) == (3, 12, 4, 3)
+    assert db.docs["co_listening_tracks/t1"]['neighbours'] == ["t2", "t3", "t4"]
+    assert db.docs["co_listening_artists/artist-b"]['neighbours'] == ["artist-a", "artist-c"]
+    assert "co_listening_tracks/t9" not in db.docs
+
+    index = CoListeningIndex(db)
+    assert index.neighbours(TRACKS, ["t1", "t4"], per_item=2) == ["t2", "t3"]
+    assert index.neighbours(TRACKS, ["t1", "unknown"]) == ["t2", "t3", "t4"]
+    assert index.stats() == {'hits': 1, 'misses': 3, 'reads': 2, 'entries': 3}
+    assert CoListeningIndex().neighbours(TRACKS, ["t1"]) == []
+
+
+def test_graph_rebuild_deletes_items_that_lost_their_neighbours():
+    db = FakeFirestore()
+    for user in range(2):
+        store_user_plays(db, f"user{user}", [("t1", "artist-a", 9), ("t2", "artist-b", 6)])
+    store_user_plays(db, "user2", [("t3", "artist-c", 9), ("t4", "artist-d", 6)])
+    store_user_plays(db, "user3", [("t3", "artist-c", 9), ("t4", "artist-d", 6)])
+    build_co_listening_graph(db, now_ms=NOW_MS)
+    assert "co_listening_tracks/t3" in db.docs
+
+    # user3's plays go, so (t3, t4) falls under MIN_CO_COUNT
+    db.docs = {path: data for path, data in db.docs.items() if not path.startswith("users/user3")}
+    stats = build_co_listening_graph(db, now_ms=NOW_MS)
+
+    assert (stats['tracks'], stats['stale_tracks'], stats['stale_artists']) == (2, 2, 2)
+    assert sorted(path for path in db.docs if path.startswith("co_listening_tracks/")) == [
+        "co_listening_tracks/t1", "co_listening_tracks/t2",
+    ]
+    assert "co_listening_artists/artist-c" not in db.docs
+
+def test_recommender_uses_graph_instead_of_related_artists():
+    db = FakeFirestore()
+    db.docs["co_listening_artists/top0"] = {'neighbours': ["n1", "n2", "n3", "n4"]}
+    db.docs["co_listening_artists/top1"] = {'neighbours': ["n5", "n1"]}
+
+    with StubSpotifyServer() as server:
+        client = SpotifyClient(api_base_url=f"{server.base_url}/v1")
+        recommender = make_recommender(HEADERS, client, co_listening=CoListeningIndex(db))
+        server.reset_counters()
+        tracks = recommender.get_similar_artist_tracks([{'id': "top0"}, {'id': "top1"}])
+        artist_calls = server.requests
+
+        db.docs["co_listening_tracks/toptrack0"] = {'neighbours': ["heard1", "heard2"]}
+        server.reset_counters()
+        similar = recommender.get_similar_artist_tracks([{'id': "top0"}], [{'id': "toptrack0"}])
+        client.close()
+
+    # Three neighbours per seed, merged: n1, n5, n2, n3; no related-artists lookups
+    assert artist_calls == 4
+    assert {track.id.split("-")[0] for track in tracks} == {"n1", "n2", "n3", "n5"}
+    # One batched /tracks call for the co-listened neighbours
+    assert server.requests == 1
+    assert [track.id for track in similar] == ["heard1", "heard2"]
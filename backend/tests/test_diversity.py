@@ -0,0 +1,149 @@
+# test_diversity.py
+import sys
+import threading
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.stub_spotify import StubSpotifyServer
+from functions.recommendations.ranking import (
+    POPULARITY_QUOTAS,
+    diversify,
+    rank_recommendations,
+    select_ranked,
+)
+from functions.recommendations.track_record import TrackRecord
+from functions.spotify.artist_index import ArtistGenreIndex
+from functions.spotify.client import SpotifyClient
+from main import collect_strategy_tracks
+from tests.recommenders import make_recommender
+
+HEADERS = {"Authorization": "Bearer stub"}
+
+
+def record(track_id, artist, popularity=50):
+    return TrackRecord(track_id, track_id, artists=(artist,), artist_ids=(artist,), popularity=popularity)
+
+
+def test_genre_index_batches_unknown_artists_and_caches_them():
+    with StubSpotifyServer() as server:
+        client = SpotifyClient(api_base_url=f"{server.base_url}/v1")
+        index = ArtistGenreIndex(client=client)
+        index.seed([{'id': "known", 'genres': ["jazz"]}])
+
+        server.reset_counters()
+        ids = ["known"] + [f"artist{i}" for i in range(120)]
+        genres = index.genres(ids + ids, HEADERS)
+        first_calls = server.requests
+        index.genres(ids, HEADERS)
+        client.close()
+
+    assert genres["known"] == ("jazz",)
+    assert len(genres) == 121 and all(genres[f"artist{i}"] for i in range(120))
+    # 120 unknown ids -> 3 calls of at most 50; the second lookup is all hits
+    assert first_calls == 3
+    assert server.requests == 3
+
+
+class RecordingArtistsClient:
+    """Answers /artists lookups and records which token each one used"""
+
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def get_json(self, path, headers=None, params=None):
+        ids = params['ids'].split(",")
+        with self.lock:
+            self.calls.append((headers["Authorization"], ids))
+        return {'artists': [{'id': artist_id, 'genres': ["rock"]} for artist_id in ids]}
+
+
+def lookup_concurrently(index, requests):
+    threads = [
+        threading.Thread(target=index.genres, args=(artist_ids, {"Authorization": token}))
+        for token, artist_ids in requests
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_genre_lookups_never_borrow_another_users_token():
+    client = RecordingArtistsClient()
+    index = ArtistGenreIndex(client=client)
+    lookup_concurrently(index, [("Bearer a", ["a1", "a2"]), ("Bearer b", ["b1", "b2"])])
+
+    assert sorted((token, sorted(ids)) for token, ids in client.calls) == [
+        ("Bearer a", ["a1", "a2"]), ("Bearer b", ["b1", "b2"]),
+    ]
+
+
+def test_genre_lookups_use_the_app_token_when_there_is_one():
+    client = RecordingArtistsClient()
+    index = ArtistGenreIndex(client=client, app_headers=lambda: {"Authorization": "Bearer app"})
+    lookup_concurrently(index, [("Bearer a", ["x1", "shared"]), ("Bearer b", ["x2", "shared"])])
+
+    assert {token for token, _ in client.calls} == {"Bearer app"}
+    assert sorted(artist_id for _, ids in client.calls for artist_id in ids) == ["shared", "x1", "x2"]
+
+
+def test_diversify_caps_artists_and_genres():
+    tracks = [record(f"a{i}", "same-artist", 90) for i in range(5)]
+    tracks += [record(f"r{i}", f"rock{i}", 80) for i in range(8)]
+    tracks += [record(f"j{i}", f"jazz{i}", 40) for i in range(4)]
+    artist_genres = {f"rock{i}": ("rock",) for i in range(8)}
+    artist_genres.update({f"jazz{i}": ("jazz",) for i in range(4)})
+    artist_genres["same-artist"] = ("pop",)
+
+    picked = diversify(tracks, artist_genres, target_size=10, max_per_artist=2, max_per_genre=4)
+    ids = [t.id for t in picked]
+
+    assert ids[0] == "a0"
+    assert len(ids) == 10
+    assert sum(i.startswith("a") for i in ids[:8]) == 2
+    assert sum(i.startswith("r") for i in ids[:8]) == 4
+    # Jazz gets in ahead of better-ranked rock once rock is capped
+    assert {"j0", "j1"} <= set(ids[:8])
+
+
+def test_diversify_keeps_popularity_quotas():
+    tracks = [record(f"hi{i}", f"artist{i}", 90) for i in range(20)]
+    tracks += [record(f"lo{i}", "one-low-artist", 10) for i in range(3)]
+    artist_genres = {f"artist{i}": (f"genre{i}",) for i in range(20)}
+
+    without = diversify(tracks, artist_genres, target_size=10)
+    picked = diversify(tracks, artist_genres, target_size=10, max_per_artist=1, quotas=POPULARITY_QUOTAS)
+
+    assert not [t for t in without if t.id.startswith("lo")]
+    # The low stratum's two slots hold even past the per-artist cap
+    assert len(picked) == 10
+    assert sum(t.id.startswith("lo") for t in picked) == 2
+
+
+def test_failed_genre_lookup_falls_back_to_ranked_selection():
+    tracks = [record(f"t{i}", f"artist{i}", i) for i in range(100)]
+
+    def lookup(artist_ids):
+        raise RuntimeError("upstream down")
+
+    final = rank_recommendations(tracks, seed=1, genre_lookup=lookup)
+    assert set(final) == set(select_ranked(tracks))
+
+
+def test_diversity_pass_costs_at_most_one_extra_call():
+    with StubSpotifyServer() as server:
+        client = SpotifyClient(api_base_url=f"{server.base_url}/v1")
+        index = ArtistGenreIndex(client=client)
+        recommender = make_recommender(HEADERS, client, genre_index=index)
+        candidates = collect_strategy_tracks(recommender)
+
+        server.reset_counters()
+        final = rank_recommendations(
+            candidates, seed=1, genre_lookup=lambda ids: index.genres(ids, HEADERS)
+        )
+        client.close()
+
+    assert len(final) == 20
+    assert server.requests <= 1
@@ -0,0 +1,69 @@
+# test_event_store.py
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.stub_spotify import fake_track
+from functions.analytics.event_store import (
+    decode_play,
+    encode_play,
+    group_by_day,
+    read_events,
+    store_plays,
+)
+from tests.firestore_fake import FakeFirestore
+
+DAY_MS = 24 * 60 * 60 * 1000
+JAN_1 = 1767225600000  # 2026-01-01T00:00:00Z
+
+
+def play(track_id, ms):
+    seconds, millis = divmod(ms - JAN_1, 1000)
+    day, rem = divmod(seconds, 86400)
+    hours, rem = divmod(rem, 3600)
+    minutes, secs = divmod(rem, 60)
+    return {
+        'played_at': f"2026-01-{1 + day:02d}T{hours:02d}:{minutes:02d}:{secs:02d}.{millis:03d}Z",
+        'track': fake_track(track_id, artist_id=f"artist-{track_id}"),
+    }
+
+
+def test_encode_decode_round_trip():
+    item = play("t1", JAN_1 + 3723004)
+    key, event = encode_play(item)
+
+    assert key == f"{JAN_1 + 3723004}:t1"
+    assert event == ["t1", JAN_1 + 3723004, item['track']['duration_ms'], "artist-t1"]
+
+    decoded = decode_play(event)
+    assert decoded['played_at'] == item['played_at']
+    assert decoded['track']['duration_ms'] == item['track']['duration_ms']
+
+
+def test_plays_are_sharded_by_utc_day():
+    items = [play("a", JAN_1 + 1000), play("b", JAN_1 + DAY_MS - 1), play("c", JAN_1 + DAY_MS)]
+    days = group_by_day(items)
+    assert sorted(days) == ["2026-01-01", "2026-01-02"]
+    assert len(days["2026-01-01"]) == 2
+
+
+def test_store_is_idempotent_and_keeps_metadata_once():
+    db = FakeFirestore()
+    items = [play("a", JAN_1 + 1000), play("a", JAN_1 + 5000), play("b", JAN_1 + DAY_MS + 1)]
+
+    batch = db.batch()
+    assert store_plays(batch, db, "u1", items) == 2
+    batch.commit()
+    # Re-ingesting an overlapping window does not duplicate plays
+    batch = db.batch()
+    store_plays(batch, db, "u1", items[1:])
+    batch.commit()
+
+    assert len(db.docs["users/u1/plays/2026-01-01"]['plays']) == 2
+    assert len(db.docs["users/u1/plays/2026-01-02"]['plays']) == 1
+    assert db.docs["tracks/a"]['artist_ids'] == ["artist-a"]
+
+    events = read_events(db, "u1", JAN_1, JAN_1 + 2 * DAY_MS)
+    assert [e[1] for e in events] == [JAN_1 + 1000, JAN_1 + 5000, JAN_1 + DAY_MS + 1]
+    assert read_events(db, "u1", JAN_1 + 2000, JAN_1 + DAY_MS)[0][1] == JAN_1 + 5000
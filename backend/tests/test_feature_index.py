@@ -0,0 +1,138 @@
+# test_feature_index.py
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.stub_spotify import StubSpotifyServer
+from functions.recommendations.feature_index import (
+    FEATURE_DIMENSIONS,
+    AudioFeatureIndex,
+    FeatureIndexHandle,
+    feature_vector,
+    pack_parts,
+    rebuild_feature_index,
+    unpack_parts,
+)
+from functions.spotify.cache import CatalogCache
+from functions.spotify.client import SpotifyClient
+from tests.firestore_fake import FakeFirestore
+from tests.recommenders import make_recommender
+
+HEADERS = {"Authorization": "Bearer stub"}
+
+
+def test_nearest_on_a_million_tracks_matches_full_sort():
+    rng = np.random.default_rng(7)
+    matrix = rng.random((1_000_000, FEATURE_DIMENSIONS), dtype=np.float32)
+    index = AudioFeatureIndex([f"t{i}" for i in range(len(matrix))], matrix)
+
+    started = time.perf_counter()
+    found = index.nearest(["t42"], 10)
+    elapsed = time.perf_counter() - started
+
+    distances = ((matrix - matrix[42]) ** 2).sum(axis=1)
+    distances[42] = np.inf
+    expected = [f"t{row}" for row in np.argsort(distances, kind="stable")[:10]]
+    assert found == expected
+    assert elapsed < 1.0
+
+
+def test_nearest_alternates_seeds_and_skips_unknown_ones():
+    matrix = np.array([[0.0], [0.1], [0.2], [1.0], [0.9], [0.8]], dtype=np.float32)
+    index = AudioFeatureIndex(["a", "b", "c", "x", "y", "z"], matrix)
+    assert index.nearest(["a", "x", "missing"], 4) == ["b", "y", "c", "z"]
+    assert index.nearest(["missing"], 4) == []
+    assert index.rows_for(["z", "missing", "a"]).tolist() == [5, -1, 0]
+
+
+class SlowFirestore(FakeFirestore):
+    """Holds every collection lookup until ``release`` is set"""
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def collection(self, name):
+        self.release.wait(2)
+        return super().collection(name)
+
+
+def test_handle_loads_in_the_background_and_keeps_serving_the_old_index():
+    db = SlowFirestore()
+    db.docs["feature_index/current"] = {'version': "v1", 'parts': 1}
+    db.docs["feature_index/v1-part-0"] = pack_parts(["a", "b"], np.zeros((2, FEATURE_DIMENSIONS)))[0]
+    now = [0.0]
+    handle = FeatureIndexHandle(db, ttl=60, clock=lambda: now[0])
+
+    started = time.perf_counter()
+    assert handle.get() is None
+    assert time.perf_counter() - started < 0.5
+    db.release.set()
+    first = handle.wait()
+    assert len(first) == 2
+
+    db.release.clear()
+    db.docs["feature_index/v2-part-0"] = pack_parts(["a", "b", "c"], np.zeros((3, FEATURE_DIMENSIONS)))[0]
+    db.docs["feature_index/current"] = {'version': "v2", 'parts': 1}
+    now[0] = 61
+    # Expired: the reload starts, the old index is served until it lands
+    assert handle.get() is first
+    db.release.set()
+    assert len(handle.wait()) == 3
+
+
+def test_parts_round_trip_within_quantization_error():
+    rng = np.random.default_rng(1)
+    matrix = rng.random((2500, FEATURE_DIMENSIONS), dtype=np.float32)
+    ids = [f"t{i}" for i in range(len(matrix))]
+    parts = pack_parts(ids, matrix, part_size=1000)
+    assert len(parts) == 3
+
+    track_ids, restored = unpack_parts(parts)
+    assert track_ids == ids
+    assert np.abs(restored - matrix).max() <= 0.5 / 255 + 1e-6
+    assert feature_vector({'tempo': 500, 'loudness': -80})[7:].tolist() == [1.0, 0.0]
+
+
+def test_rebuild_and_serve_similar_tracks_without_related_artists():
+    db = FakeFirestore()
+    for i in range(150):
+        db.docs[f"tracks/played{i}"] = {'name': f"Track {i}"}
+    for i in range(2):
+        db.docs[f"tracks/toptrack{i}"] = {'name': f"Top {i}"}
+    db.docs["genre_index/rock"] = {'genre': "rock", 'tracks': {"posted0": [2020, 50]}, 'artists': {}}
+
+    with StubSpotifyServer() as server:
+        client = SpotifyClient(api_base_url=f"{server.base_url}/v1", cache=CatalogCache())
+        first = rebuild_feature_index("app-token", db_client=db, client=client, part_size=100)
+        assert first['tracks'] == 153
+        assert first['feature_calls'] == 2
+        assert first['parts'] == 2
+
+        # Known vectors are reused; only new tracks are fetched
+        db.docs["tracks/played-new"] = {'name': "New"}
+        stats = rebuild_feature_index("app-token", db_client=db, client=client, part_size=1000)
+        assert (stats['tracks'], stats['fetched'], stats['parts']) == (154, 1, 1)
+        assert db.docs["feature_index/current"] == {'version': stats['version'], 'parts': 1, 'tracks': 154}
+        # The previous build stays readable for loads already in flight
+        assert f"feature_index/{first['version']}-part-1" in db.docs
+        rebuild_feature_index("app-token", db_client=db, client=client, part_size=1000)
+        assert not [path for path in db.docs if path.startswith(f"feature_index/{first['version']}")]
+
+        handle = FeatureIndexHandle(db)
+        assert len(handle.wait()) == 154
+        recommender = make_recommender(HEADERS, client, feature_index=handle)
+        seeds = recommender.get_top_tracks(limit=2)
+        server.reset_counters()
+        tracks = recommender.get_similar_artist_tracks([{'id': "top0"}], seeds)
+        client.close()
+
+    # One batched /tracks call hydrates the neighbours; no related-artists lookups
+    assert server.requests == 1
+    assert len(tracks) == 18
+    assert not {track.id for track in tracks} & {"toptrack0", "toptrack1"}
@@ -0,0 +1,258 @@
+# test_genre_index.py
+import sys
+import threading
+from datetime import datetime
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.stub_spotify import StubSpotifyServer, fake_artist, fake_track
+from functions.recommendations.genre_index import (
+    GenreIndex,
+    genre_doc_id,
+    harvest_tracks,
+    rebuild_genre_index,
+    track_details,
+)
+from functions.spotify.artist_index import ArtistGenreIndex
+from functions.spotify.cache import CatalogCache
+from functions.spotify.client import SpotifyClient
+from main import collect_strategy_tracks, extract_genres
+from tests.firestore_fake import FakeFirestore
+from tests.recommenders import make_recommender
+
+HEADERS = {"Authorization": "Bearer stub"}
+
+
+class RecordingClient(SpotifyClient):
+    """SpotifyClient that remembers every search query it sends"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.searches = []
+
+    def get_json(self, path, headers=None, params=None, **kwargs):
+        if path == "/search":
+            self.searches.append((params['type'], params['q']))
+        return super().get_json(path, headers=headers, params=params, **kwargs)
+
+
+def seed_genres():
+    return extract_genres([fake_artist(f"top{i}") for i in range(3)])[:3]
+
+
+def test_index_hits_skip_genre_searches():
+    year = datetime.now().year
+    db = FakeFirestore()
+    for genre in seed_genres():
+        db.docs[f"genre_index/{genre_doc_id(genre)}"] = {
+            'genre': genre,
+            'tracks': {
+                f"{genre}-old": [2001, 90],
+                f"{genre}-new": [year, 50],
+                f"{genre}-hit": [year - 1, 80],
+            },
+            'artists': {f"{genre}-star": 95, f"{genre}-rising": 40},
+        }
+
+    with StubSpotifyServer() as server:
+        client = RecordingClient(api_base_url=f"{server.base_url}/v1", cache=CatalogCache())
+        recommender = make_recommender(HEADERS, client, genre_catalog=GenreIndex(db))
+        genre = seed_genres()[0]
+        assert [t.id for t in recommender.get_genre_based_tracks(
+            [fake_artist(f"top{i}") for i in range(3)], tracks_per_genre=2
+        )][:2] == [f"{genre}-old", f"{genre}-hit"]
+        assert [t.id for t in recommender.get_new_releases_in_genres([genre])] == [f"{genre}-new"]
+        assert {t.id.split("-top")[0] for t in recommender.get_rising_artist_tracks([genre])} == {
+            f"{genre}-rising"
+        }
+
+        tracks = collect_strategy_tracks(recommender)
+        client.close()
+
+    assert client.searches == []
+    assert tracks
+
+
+def test_stored_details_need_no_hydration():
+    db = FakeFirestore()
+    genre = seed_genres()[0]
+    db.docs[f"genre_index/{genre_doc_id(genre)}"] = {
+        'genre': genre,
+        'tracks': {**harvest_tracks([fake_track("t1"), fake_track("t2")]), "legacy": [2001, 1]},
+        'artists': {},
+    }
+    for track_id, record in track_details([fake_track("t1"), fake_track("t2")]).items():
+        db.docs[f"tracks/{track_id}"] = {**record.details(), 'popularity': record.popularity}
+    # Listening ingest stores play metadata only; that is not enough to serve
+    db.docs["tracks/legacy"] = {'name': "Legacy", 'artists': ["Someone"]}
+
+    with StubSpotifyServer() as server:
+        client = SpotifyClient(api_base_url=f"{server.base_url}/v1")
+        recommender = make_recommender(HEADERS, client, genre_catalog=GenreIndex(db))
+        tracks = recommender._genre_tracks([genre], 2)
+        upstream_calls = server.requests
+        # Ids without stored display fields are hydrated
+        legacy = recommender._genre_tracks([genre], 3)
+        client.close()
+
+    assert upstream_calls == 0
+    expected = sorted(["t1", "t2"], key=lambda track_id: -fake_track(track_id)['popularity'])
+    assert [track.id for track in tracks] == expected
+    assert tracks[0].to_dict()['name'] == f"Track {expected[0]}"
+    assert tracks[0].artist_ids == (fake_track(expected[0])['artists'][0]['id'],)
+    assert tracks[0].popularity == fake_track(expected[0])['popularity']
+    assert server.requests == 1
+    assert [track.id for track in legacy] == expected + ["legacy"]
+
+
+def test_misses_search_live_and_harvest():
+    db = FakeFirestore()
+    with StubSpotifyServer() as server:
+        first = RecordingClient(api_base_url=f"{server.base_url}/v1", cache=CatalogCache())
+        first_index = GenreIndex(db)
+        expected = collect_strategy_tracks(
+            make_recommender(HEADERS, first, genre_catalog=first_index)
+        )
+        first.close()
+        first_index.wait()
+
+        # A fresh instance reads the harvested postings back from Firestore
+        second = RecordingClient(api_base_url=f"{server.base_url}/v1", cache=CatalogCache())
+        index = GenreIndex(db)
+        tracks = collect_strategy_tracks(make_recommender(HEADERS, second, genre_catalog=index))
+        second.close()
+
+    assert len(first.searches) == 9
+    assert sorted(db.docs[f"genre_index/{genre_doc_id(g)}"]['genre'] for g in seed_genres()) == sorted(
+        seed_genres()
+    )
+    # Genre tracks now come from the index. This year's releases and rising
+    # artists still miss: the stub's tracks are all older and its artist
+    # searches find nobody in the rising popularity band
+    assert [query for kind, query in second.searches if kind == "track" and "year:" not in query] == []
+    assert index.stats()['hits'] == 3
+    harvested = {
+        track_id for g in seed_genres() for track_id in db.docs[f"genre_index/{genre_doc_id(g)}"]['tracks']
+    }
+    assert {t.id for t in expected if t.id.startswith("genre:")} <= harvested
+    assert {t.id for t in tracks if t.id.startswith("genre:")} <= harvested
+    # Postings stay compact; display fields are stored once per track
+    assert all(
+        len(posting) == 2
+        for g in seed_genres() for posting in db.docs[f"genre_index/{genre_doc_id(g)}"]['tracks'].values()
+    )
+    assert all(db.docs[f"tracks/{track_id}"]['release_date'] for track_id in harvested)
+
+
+class BlockingFirestore(FakeFirestore):
+    """Holds every batch commit until ``release`` is set"""
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def batch(self):
+        batch = super().batch()
+        commit = batch.commit
+
+        def blocked_commit():
+            self.release.wait(5)
+            commit()
+        batch.commit = blocked_commit
+        return batch
+
+
+def test_harvest_writes_in_the_background():
+    db = BlockingFirestore()
+    index = GenreIndex(db)
+    index.harvest("genre-0", tracks=[fake_track("t1")])
+    # The caller is back before anything reached Firestore
+    assert index.stats()['pending_harvests'] == 1
+    assert "tracks/t1" not in db.docs
+    # This instance already serves what it searched
+    assert index.records(["t1"])["t1"].name == "Track t1"
+
+    db.release.set()
+    index.wait()
+    assert index.stats()['pending_harvests'] == 0
+    assert db.docs[f"genre_index/{genre_doc_id('genre-0')}"]['tracks'] == harvest_tracks([fake_track("t1")])
+    assert db.docs["tracks/t1"]['name'] == "Track t1"
+
+
+class InterleavingFirestore(FakeFirestore):
+    """Lets another writer land between a harvest's read and its conditional write"""
+
+    def __init__(self, interleave):
+        super().__init__()
+        self.interleave = interleave
+
+    def write_option(self, **kwargs):
+        option = super().write_option(**kwargs)
+        if self.interleave:
+            self.interleave.pop()()
+        return option
+
+
+def test_harvest_trims_and_keeps_concurrent_postings():
+    genre = "genre-0"
+    path = f"genre_index/{genre_doc_id(genre)}"
+    tracks = [dict(fake_track(f"t{i}"), popularity=i) for i in range(6)]
+
+    def concurrent_harvest():
+        # Another instance's harvest of t4, t5
+        db.docs[path]['tracks'].update(harvest_tracks(tracks[4:6]))
+        db.touch(path)
+
+    db = InterleavingFirestore([concurrent_harvest])
+    # Written before postings were compacted, with details inline
+    db.docs[path] = {
+        'genre': genre,
+        'tracks': {track_id: [2020, i, {'name': track_id}] for i, track_id in enumerate(["t0", "t1"])},
+        'artists': {},
+    }
+    index = GenreIndex(db, max_tracks=3)
+
+    index.harvest(genre, tracks=tracks[2:4])
+    index.wait()
+
+    # t4, t5 won the race; the retried harvest merged t2, t3 on top and trimmed
+    assert db.docs[path]['tracks'] == harvest_tracks(tracks[3:6])
+    assert index.tracks(genre, 5) == ["t5", "t4", "t3"]
+    assert index.stats()['harvests'] == 1
+
+
+def test_rebuild_cross_files_and_trims():
+    db = FakeFirestore()
+    genres = ["genre-0", "genre-1", "genre-2"]
+    for genre in genres:
+        db.docs[f"genre_index/{genre_doc_id(genre)}"] = {
+            'genre': genre, 'tracks': {"kept": [2020, 99]}, 'artists': {},
+        }
+
+    with StubSpotifyServer() as server:
+        client = SpotifyClient(api_base_url=f"{server.base_url}/v1", cache=CatalogCache())
+        artist_index = ArtistGenreIndex(client=client)
+        stats = rebuild_genre_index(
+            "app-token", db_client=db, client=client, artist_index=artist_index,
+            max_tracks=40, max_artists=10,
+        )
+        client.close()
+
+    assert stats['genres'] == 3
+    assert stats['searches'] == 9
+    assert stats['search_failures'] == 0
+    assert stats['cross_filed'] > 0
+    # Primary artists' genres came from one batched /artists call
+    assert artist_index.stats()['upstream_calls'] == 1
+    for genre in genres:
+        doc = db.docs[f"genre_index/{genre_doc_id(genre)}"]
+        assert len(doc['tracks']) == 40
+        assert len(doc['artists']) == 10
+        # Existing postings survive the rebuild when popular enough
+        assert "kept" in doc['tracks']
+        assert all(len(posting) == 2 for posting in doc['tracks'].values())
+    assert all(
+        db.docs[f"tracks/{track_id}"]['name'] for genre in genres
+        for track_id in db.docs[f"genre_index/{genre_doc_id(genre)}"]['tracks'] if track_id != "kept"
+    )
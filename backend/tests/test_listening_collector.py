@@ -0,0 +1,161 @@
+# test_listening_collector.py
+import sys
+import threading
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.stub_spotify import StubSpotifyServer
+from functions.analytics.collection_operations import (
+    collect_listening_data,
+    ingest_recent_plays,
+    select_new_plays,
+)
+from functions.analytics.history_operations import get_listening_stats, get_listening_summary
+from functions.spotify.client import SpotifyClient
+from tests.firestore_fake import FakeFirestore
+
+
+def test_collector_sweeps_users_concurrently():
+    db = FakeFirestore()
+    for i in range(20):
+        db.docs[f"users/user{i}"] = {'access_token': f"token{i}"}
+    db.docs["users/no-token"] = {'display_name': 'Logged out'}
+
+    latency = 0.05
+    with StubSpotifyServer(latency=latency) as server:
+        client = SpotifyClient(api_base_url=f"{server.base_url}/v1")
+        stats = collect_listening_data(max_workers=10, db_client=db, client=client)
+        client.close()
+
+    assert stats['users'] == 21
+    assert stats['collected'] == 20
+    assert stats['skipped_no_token'] == 1
+    assert stats['failures'] == 0
+    assert stats['tracks'] == 20 * 50
+    assert stats['upstream_latency_ms']['p50'] >= latency * 1000
+    # 20 users at 50ms each would take a second serially
+    assert stats['elapsed_seconds'] < 20 * latency / 2
+    assert db.docs["users/user3"]['listening_cursor'] == server.plays[-1][0]
+    stored = [p for path, doc in db.docs.items() if path.startswith("users/user3/plays/")
+              for p in doc['plays']]
+    assert len(stored) == 50
+    # One batch per user carries its plays, rollup and cursor
+    assert db.commits == 20
+
+
+def test_collector_counts_upstream_failures():
+    db = FakeFirestore()
+    db.docs["users/u1"] = {'access_token': "token"}
+
+    with StubSpotifyServer() as server:
+        # No scheduler attached, so the 429 is not retried
+        server.rate_limit_next = 1
+        client = SpotifyClient(api_base_url=f"{server.base_url}/v1")
+        stats = collect_listening_data(db_client=db, client=client)
+        client.close()
+
+    assert stats['failures'] == 1
+    assert 'listening_cursor' not in db.docs["users/u1"]
+
+
+def test_second_run_only_ingests_new_plays():
+    db = FakeFirestore()
+    db.docs["users/u1"] = {'access_token': "token"}
+
+    with StubSpotifyServer() as server:
+        client = SpotifyClient(api_base_url=f"{server.base_url}/v1")
+        first = collect_listening_data(db_client=db, client=client)
+        server.add_plays(7)
+        second = collect_listening_data(db_client=db, client=client)
+        third = collect_listening_data(db_client=db, client=client)
+        client.close()
+
+    assert (first['tracks'], second['tracks'], third['tracks']) == (50, 7, 0)
+    shards = [doc for path, doc in db.docs.items() if path.startswith("users/u1/plays/")]
+    stored = [event[0] for shard in shards for event in shard['plays'].values()]
+    assert len(stored) == len(set(stored)) == 57
+    assert db.docs["tracks/play56"]['name'] == "Track play56"
+
+
+def test_history_is_one_delta_fetch_plus_a_rollup_read():
+    db = FakeFirestore()
+    db.docs["users/u1"] = {'access_token': "token"}
+
+    with StubSpotifyServer() as server:
+        client = SpotifyClient(api_base_url=f"{server.base_url}/v1")
+        collect_listening_data(db_client=db, client=client)
+        server.add_plays(3)
+        server.reset_counters()
+        metadata = ingest_recent_plays("u1", "token", db_client=db, client=client)
+        upstream_calls = server.requests
+        # A repeat load has nothing new and must not double count
+        ingest_recent_plays("u1", "token", db_client=db, client=client)
+        client.close()
+
+    assert upstream_calls == 1
+    assert metadata['new_plays'] == 3
+    assert db.docs["users/u1"]['listening_cursor'] == server.plays[-1][0]
+
+    rollup = db.docs["users/u1/analytics/listening_rollup"]
+    durations = sum(event[2] for path, doc in db.docs.items()
+                    if path.startswith("users/u1/plays/") for event in doc['plays'].values())
+    assert rollup['total_plays'] == 53
+    assert rollup['total_duration_ms'] == durations
+    assert sum(day['count'] for day in rollup['days'].values()) == 53
+
+    reads = db.reads
+    summary = get_listening_summary("u1", db_client=db)
+    stats = get_listening_stats("u1", db_client=db)
+    assert db.reads - reads == 2
+    assert len(summary['history']) == 7
+    # The first 50 plays span the last few hours: today's or yesterday's bucket
+    assert sum(day['count'] for day in summary['history'][-2:]) >= 50
+    assert stats == {'total_hours': round(durations / 3600000, 1), 'total_plays': 53}
+
+
+def test_racing_ingests_count_each_play_once():
+    db = FakeFirestore()
+    db.docs["users/u1"] = {'access_token': "token"}
+
+    # Both fetches are in flight before either commits
+    with StubSpotifyServer(latency=0.1) as server:
+        client = SpotifyClient(api_base_url=f"{server.base_url}/v1")
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                ingest_recent_plays("u1", "token", db_client=db, client=client)))
+            for _ in range(2)
+        ]
+        threads.append(threading.Thread(target=collect_listening_data, kwargs={'db_client': db, 'client': client}))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        client.close()
+
+    stored = [p for path, doc in db.docs.items() if path.startswith("users/u1/plays/") for p in doc['plays']]
+    assert len(stored) == 50
+    assert db.docs["users/u1/analytics/listening_rollup"]['total_plays'] == 50
+    assert sum(result['new_plays'] for result in results) <= 50
+
+
+def make_play(ms, track_id):
+    return {'played_at': f"2026-01-01T00:00:{ms // 1000:02d}.{ms % 1000:03d}Z", 'track': {'id': track_id}}
+
+
+def test_select_new_plays_dedupes_at_the_cursor():
+    base = 1767225600000  # 2026-01-01T00:00:00Z
+    items = [make_play(2000, "b"), make_play(1000, "a"), make_play(2000, "c"), make_play(1000, "a")]
+
+    new, cursor, keys = select_new_plays(items)
+    assert [p['track']['id'] for p in new] == ["a", "b", "c"]
+    assert cursor == base + 2000
+    assert sorted(keys) == [f"{base + 2000}:b", f"{base + 2000}:c"]
+
+    # Overlapping fetch: the same plays at the cursor plus one newer play
+    items = [make_play(3000, "d"), make_play(2000, "c"), make_play(2000, "b")]
+    new, cursor, keys = select_new_plays(items, cursor, keys)
+    assert [p['track']['id'] for p in new] == ["d"]
+    assert cursor == base + 3000
+    assert keys == [f"{base + 3000}:d"]
@@ -0,0 +1,85 @@
+# test_materialized_recommendations.py
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from flask import Flask, request
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+import main
+from functions.recommendations import recommendation_operations
+from functions.recommendations.recommendation_operations import store_recommendations
+from functions.recommendations.track_record import TrackRecord
+from tests.firestore_fake import FakeFirestore
+
+app = Flask(__name__)
+
+
+def setup(monkeypatch):
+    db = FakeFirestore()
+    generated = []
+
+    def generate(user_id, access_token, seed=None):
+        tracks = [TrackRecord(f"fresh{len(generated)}", "Fresh")]
+        generated.append(user_id)
+        store_recommendations(user_id, tracks, db_client=db)
+        return tracks
+
+    monkeypatch.setattr(recommendation_operations, "get_firestore", lambda: db)
+    monkeypatch.setattr(main, "get_access_token", lambda user_id: "token")
+    monkeypatch.setattr(main, "generate_recommendations", generate)
+    return db, generated
+
+
+def call(query):
+    with app.test_request_context(f"/?{query}"):
+        response = main.get_recommendations(request)
+    return response.status_code, response.get_json()
+
+
+def test_generates_synchronously_only_when_nothing_is_stored(monkeypatch):
+    db, generated = setup(monkeypatch)
+
+    status, body = call("user_id=u1")
+    assert status == 200
+    assert (body['cached'], body['age_seconds']) == (False, 0)
+    assert [t['id'] for t in body['tracks']] == ["fresh0"]
+
+    status, body = call("user_id=u1")
+    assert body['cached'] is True and body['stale'] is False
+    assert [t['id'] for t in body['tracks']] == ["fresh0"]
+    assert generated == ["u1"]
+
+
+def test_stale_list_is_served_while_regenerating(monkeypatch):
+    db, generated = setup(monkeypatch)
+    an_hour_ago = datetime.now(timezone.utc) - timedelta(hours=1)
+    db.docs["users/u1/recommendations/current"] = {
+        'tracks': [TrackRecord("old", "Old").to_dict()],
+        'generated_at': an_hour_ago.replace(tzinfo=None),
+        'expires_at': an_hour_ago,
+    }
+
+    status, body = call("user_id=u1")
+    assert status == 200
+    assert [t['id'] for t in body['tracks']] == ["old"]
+    assert body['cached'] is True and body['stale'] is True
+    assert 3590 <= body['age_seconds'] <= 3610
+
+    deadline = time.monotonic() + 2
+    while main._refreshing_users and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert generated == ["u1"]
+    status, body = call("user_id=u1")
+    assert [t['id'] for t in body['tracks']] == ["fresh0"]
+    assert body['stale'] is False
+
+
+def test_refresh_flag_bypasses_the_stored_list(monkeypatch):
+    db, generated = setup(monkeypatch)
+    call("user_id=u1")
+    status, body = call("user_id=u1&refresh=true")
+    assert body['cached'] is False
+    assert generated == ["u1", "u1"]
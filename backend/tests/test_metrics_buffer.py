@@ -0,0 +1,75 @@
+# test_metrics_buffer.py
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from functions.recommendations.metrics import MetricsBuffer
+from tests.firestore_fake import FakeFirestore
+
+
+def stored_metrics(db):
+    return sorted(
+        (path.split("/")[1], data['n']) for path, data in db.docs.items()
+        if path.startswith("metrics/")
+    )
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_size_threshold_flushes_in_the_background():
+    db = FakeFirestore()
+    buffer = MetricsBuffer(db, flush_interval=60, max_batch=3)
+    buffer.add("user1", {'n': 1})
+    buffer.add("user2", {'n': 2})
+    time.sleep(0.05)
+    assert stored_metrics(db) == []
+
+    buffer.add("user1", {'n': 3})
+    assert wait_for(lambda: buffer.stats()['flushed'] == 3)
+    assert stored_metrics(db) == [("user1", 1), ("user1", 3), ("user2", 2)]
+    assert db.commits == 1
+    buffer.close()
+
+
+def test_interval_flush_and_close_write_everything():
+    db = FakeFirestore()
+    buffer = MetricsBuffer(db, flush_interval=0.05, max_batch=100)
+    buffer.add("user1", {'n': 1})
+    assert wait_for(lambda: buffer.stats()['flushed'] == 1)
+
+    buffer.add("user1", {'n': 2})
+    buffer.close()
+    buffer.add("user1", {'n': 3})
+    assert stored_metrics(db) == [("user1", 1), ("user1", 2)]
+    assert buffer.stats() == {'pending': 0, 'added': 2, 'flushed': 2, 'dropped': 1, 'failed_flushes': 0}
+
+
+class FailingBatch:
+    def set(self, reference, data):
+        pass
+
+    def commit(self):
+        raise RuntimeError("unavailable")
+
+
+def test_failed_flush_keeps_the_newest_entries_up_to_the_cap():
+    db = FakeFirestore()
+    buffer = MetricsBuffer(db, flush_interval=60, max_batch=100, max_pending=3)
+    real_batch, db.batch = db.batch, FailingBatch
+    for n in range(5):
+        buffer.add("user1", {'n': n})
+    assert buffer.flush() == 0
+    assert buffer.stats()['failed_flushes'] == 1
+
+    db.batch = real_batch
+    assert buffer.flush() == 3
+    assert stored_metrics(db) == [("user1", 2), ("user1", 3), ("user1", 4)]
+    assert buffer.stats()['dropped'] == 2
+    buffer.close()
@@ -0,0 +1,121 @@
+# test_precompute.py
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytz
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.stub_spotify import StubSpotifyServer
+from functions.recommendations.precompute import (
+    precompute_recommendations,
+    shard_for,
+    shared_catalog_loader,
+)
+from functions.spotify.artist_index import ArtistGenreIndex
+from functions.spotify.cache import CatalogCache
+from functions.spotify.client import SpotifyClient
+from main import collect_strategy_tracks
+from tests.firestore_fake import FakeFirestore
+from tests.recommenders import make_recommender
+
+APP_HEADERS = {"Authorization": "Bearer app"}
+
+
+def test_shards_partition_users_stably():
+    users = [f"user{i}" for i in range(1000)]
+    shards = [shard_for(user, 4) for user in users]
+    assert shards == [shard_for(user, 4) for user in users]
+    assert all(150 < shards.count(shard) < 350 for shard in range(4))
+
+
+def run_shard(server, shard, shards, db):
+    client = SpotifyClient(api_base_url=f"{server.base_url}/v1")
+    catalog = shared_catalog_loader(client, app_headers=lambda: APP_HEADERS)
+    generated = {}
+
+    def generate(user_id, access_token, catalog):
+        recommender = make_recommender(
+            {"Authorization": f"Bearer {access_token}"}, client,
+            genre_index=ArtistGenreIndex(client=client), catalog=catalog,
+        )
+        generated[user_id] = collect_strategy_tracks(recommender)
+
+    stats = precompute_recommendations(
+        generate, shard=shard, shards=shards, max_workers=4, db_client=db,
+        token_fn=lambda user_id: f"token-{user_id}", catalog=catalog,
+    )
+    client.close()
+    return stats, generated
+
+
+def test_precompute_covers_one_shard_and_shares_catalog_calls():
+    now = datetime.now(pytz.UTC)
+    db = FakeFirestore()
+    for i in range(11):
+        db.docs[f"users/user{i}"] = {'refresh_token': f"refresh{i}", 'last_login': now - timedelta(days=i)}
+    # Logged in long ago but still listening
+    db.docs["users/user11"] = {
+        'last_login': now - timedelta(days=400), 'listening_cursor': int(now.timestamp() * 1000),
+    }
+    db.docs["users/lapsed"] = {'refresh_token': "refresh", 'last_login': now - timedelta(days=90)}
+
+    with StubSpotifyServer() as server:
+        covered = set()
+        for shard in range(3):
+            server.reset_counters()
+            stats, generated = run_shard(server, shard, 3, db)
+            assert set(generated) == {u for u in generated if shard_for(u, 3) == shard}
+            assert stats['generated'] == stats['users'] == len(generated)
+            assert stats['users_scanned'] == 13
+            covered |= set(generated)
+            if stats['users'] > 1:
+                # Every stub user has the same taste, so each extra user's
+                # catalog lookups are all shared
+                per_user = stats['catalog_fetches']
+                assert stats['upstream_calls_saved'] == per_user * (stats['users'] - 1)
+                assert server.requests < per_user * stats['users']
+
+    assert covered == {f"user{i}" for i in range(12)}
+
+
+def test_shared_loader_retries_failures_and_counts_cache_hits():
+    with StubSpotifyServer() as server:
+        client = SpotifyClient(api_base_url=f"{server.base_url}/v1", cache=CatalogCache())
+        catalog = shared_catalog_loader(client, app_headers=lambda: None)
+        headers = {"Authorization": "Bearer stub"}
+        key = ("/artists/a1/related-artists", ())
+        # Warm the catalog cache outside the loader
+        client.get_json("/artists/a2/top-tracks", headers=headers, params={"market": "US"})
+
+        server.rate_limit_next = 1
+        assert catalog.load(key, headers).result() is None
+        assert catalog.load(key, headers).result() is not None
+        assert catalog.load(("/artists/a2/top-tracks", (("market", "US"),)), headers).result()
+        client.close()
+
+    stats = catalog.stats()
+    assert (stats['batches'], stats['cache_hits']) == (3, 1)
+
+
+def test_shared_loader_fetches_under_the_app_token_or_each_users_own():
+    seen = []
+
+    class RecordingClient:
+        def get_json_cached(self, path, headers=None, params=None):
+            seen.append(headers["Authorization"])
+            return {'path': path}, False
+
+    key = ("/artists/a1/related-artists", ())
+    shared = shared_catalog_loader(RecordingClient(), app_headers=lambda: APP_HEADERS)
+    for user in ("a", "b"):
+        shared.load(key, {"Authorization": f"Bearer {user}"}).result()
+    assert seen == ["Bearer app"]
+
+    seen.clear()
+    # Without an app token a user's lookup never runs under someone else's token
+    per_user = shared_catalog_loader(RecordingClient(), app_headers=lambda: None)
+    for user in ("a", "b", "a"):
+        per_user.load(key, {"Authorization": f"Bearer {user}"}).result()
+    assert seen == ["Bearer a", "Bearer b"]
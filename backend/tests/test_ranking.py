@@ -0,0 +1,52 @@
+# test_ranking.py
+import random
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from functions.recommendations.ranking import rank_recommendations, select_ranked
+from functions.recommendations.track_record import TrackRecord
+
+
+def candidates(count, rng):
+    return [
+        TrackRecord(f"t{i}", f"Track {i}", popularity=rng.randint(0, 100),
+                    release_date=f"{rng.randint(2000, 2026)}-01-01")
+        for i in range(count)
+    ]
+
+
+def sorted_selection(tracks, target_size=20):
+    """The sort-then-scan selection the heap pass replaces, before its shuffle"""
+    ordered = sorted(tracks, key=lambda t: (t.popularity, t.release_date), reverse=True)
+    balanced = (
+        [t for t in ordered if t.popularity >= 70][:4]
+        + [t for t in ordered if 40 <= t.popularity < 70][:4]
+        + [t for t in ordered if t.popularity < 40][:2]
+    )
+    balanced += [t for t in ordered if t not in balanced][:target_size - len(balanced)]
+    return balanced[:target_size]
+
+
+def test_heap_selection_matches_sorted_selection():
+    rng = random.Random(3)
+    for count in (0, 5, 15, 200, 2000):
+        tracks = candidates(count, rng)
+        assert [t.id for t in select_ranked(tracks)] == [t.id for t in sorted_selection(tracks)]
+
+
+def test_quotas_hold_even_when_one_stratum_dominates():
+    tracks = [TrackRecord(f"hi{i}", "", popularity=90) for i in range(50)]
+    tracks += [TrackRecord("mid", "", popularity=50), TrackRecord("low", "", popularity=10)]
+
+    selection = select_ranked(tracks, target_size=10)
+    assert len(selection) == 10
+    assert {"mid", "low"} <= {t.id for t in selection}
+
+
+def test_seeded_shuffle_is_reproducible():
+    tracks = candidates(500, random.Random(5))
+    first = rank_recommendations(tracks, seed=42)
+    assert rank_recommendations(tracks, seed=42) == first
+    assert set(first) == set(select_ranked(tracks))
@@ -0,0 +1,128 @@
+# test_recommendation_fanout.py
+import asyncio
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.stub_spotify import StubSpotifyServer
+from functions.recommendations.co_listening import CoListeningIndex
+from functions.recommendations.genre_index import GenreIndex
+from functions.spotify.client import SpotifyClient
+from functions.spotify.async_client import AsyncSpotifyClient, run_async
+from main import (
+    collect_strategy_tracks,
+    collect_strategy_tracks_async,
+    extract_genres,
+    filter_unique_tracks,
+)
+from tests.firestore_fake import FakeFirestore
+from tests.recommenders import make_async_recommender, make_recommender
+
+
+def serial_strategy_tracks(recommender):
+    """The pre-fan-out merge order, used as the reference result"""
+    top_artists = recommender.get_top_artists(limit=3)
+    genres = extract_genres(top_artists)
+    seen = set()
+    merged = []
+    merged.extend(filter_unique_tracks(recommender.get_genre_based_tracks(top_artists), seen))
+    merged.extend(filter_unique_tracks(recommender.get_similar_artist_tracks(top_artists), seen))
+    merged.extend(filter_unique_tracks(recommender.get_new_releases_in_genres(genres), seen))
+    merged.extend(filter_unique_tracks(recommender.get_rising_artist_tracks(genres), seen))
+    return merged
+
+
+def test_concurrent_merge_matches_serial_order():
+    with StubSpotifyServer(latency=0.01) as server:
+        client = SpotifyClient(api_base_url=f"{server.base_url}/v1")
+        recommender = make_recommender({"Authorization": "Bearer stub"}, client)
+
+        expected = [track.to_dict() for track in serial_strategy_tracks(recommender)]
+        for _ in range(3):
+            assert [track.to_dict() for track in collect_strategy_tracks(recommender)] == expected
+        client.close()
+
+
+def test_fan_out_overlaps_round_trips():
+    latency = 0.05
+    with StubSpotifyServer(latency=latency) as server:
+        client = SpotifyClient(api_base_url=f"{server.base_url}/v1")
+        recommender = make_recommender({"Authorization": "Bearer stub"}, client)
+
+        server.reset_counters()
+        start = time.perf_counter()
+        collect_strategy_tracks(recommender)
+        elapsed = time.perf_counter() - start
+        client.close()
+
+    # Serially this would take requests * latency; the critical path is only
+    # seeds -> related-artists -> top-tracks
+    assert server.requests > 10
+    assert elapsed < server.requests * latency / 2
+
+
+def test_async_recommender_matches_threaded_path():
+    headers = {"Authorization": "Bearer stub"}
+    with StubSpotifyServer() as server:
+        base_url = f"{server.base_url}/v1"
+        client = SpotifyClient(api_base_url=base_url)
+        expected = [
+            track.to_dict() for track in collect_strategy_tracks(
+                make_recommender(headers, client)
+            )
+        ]
+        client.close()
+
+        async def run():
+            async_client = AsyncSpotifyClient(api_base_url=base_url)
+            try:
+                tracks = await collect_strategy_tracks_async(
+                    make_async_recommender(headers, async_client, max_concurrency=2)
+                )
+                return [track.to_dict() for track in tracks]
+            finally:
+                await async_client.close()
+
+        assert asyncio.run(run()) == expected
+        # The Flask bridge runs the same coroutine on its shared loop
+        assert run_async(run()) == expected
+
+
+class ThreadRecordingFirestore(FakeFirestore):
+    """Records the thread every index read runs on"""
+
+    def __init__(self):
+        super().__init__()
+        self.read_threads = []
+
+    def get_all(self, references):
+        self.read_threads.append(threading.current_thread().name)
+        return super().get_all(references)
+
+
+def test_async_index_reads_use_the_index_pool_only_when_cold():
+    db = ThreadRecordingFirestore()
+    genre_catalog, co_listening = GenreIndex(db), CoListeningIndex(db)
+    with StubSpotifyServer() as server:
+        async def run():
+            async_client = AsyncSpotifyClient(api_base_url=f"{server.base_url}/v1")
+            try:
+                return await collect_strategy_tracks_async(make_async_recommender(
+                    {"Authorization": "Bearer stub"}, async_client,
+                    genre_catalog=genre_catalog, co_listening=co_listening,
+                ))
+            finally:
+                await async_client.close()
+
+        assert run_async(run())
+        cold_reads = db.read_threads
+        db.read_threads = []
+        assert run_async(run())
+        genre_catalog.wait()
+
+    assert cold_reads and all(name.startswith("index-io") for name in cold_reads)
+    # Everything is in memory now and runs inline on the loop, without a thread hop
+    assert db.read_threads == []
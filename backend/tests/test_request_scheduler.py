@@ -0,0 +1,96 @@
+# test_request_scheduler.py
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.stub_spotify import StubSpotifyServer
+from functions.spotify.async_client import AsyncSpotifyClient
+from functions.spotify.client import SpotifyClient
+from functions.spotify.scheduler import BACKGROUND, INTERACTIVE, RequestScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_enforces_budget():
+    clock = FakeClock()
+    scheduler = RequestScheduler(rate=2, burst=4, clock=clock)
+
+    assert [scheduler.reserve() for _ in range(4)] == [0.0] * 4
+    assert scheduler.reserve() == 0.5
+
+    clock.now += 0.5
+    assert scheduler.reserve() == 0.0
+
+
+def test_background_calls_leave_headroom_for_interactive():
+    clock = FakeClock()
+    scheduler = RequestScheduler(rate=1, burst=4, background_reserve=0.5, clock=clock)
+
+    assert scheduler.reserve(BACKGROUND) == 0.0
+    assert scheduler.reserve(BACKGROUND) == 0.0
+    # Two tokens left, both reserved for interactive traffic
+    assert scheduler.reserve(BACKGROUND) > 0
+    assert scheduler.reserve(INTERACTIVE) == 0.0
+    assert scheduler.reserve(INTERACTIVE) == 0.0
+
+
+def test_retry_after_blocks_every_caller():
+    clock = FakeClock()
+    scheduler = RequestScheduler(rate=100, burst=100, clock=clock)
+
+    assert scheduler.should_retry(429, {"Retry-After": "3"}, attempt=0)
+    assert scheduler.reserve(INTERACTIVE) == 3.0
+    clock.now += 3
+    assert scheduler.reserve(INTERACTIVE) == 0.0
+
+    assert not scheduler.should_retry(429, {"Retry-After": "1"}, attempt=3)
+    assert not scheduler.should_retry(429, {"Retry-After": "120"}, attempt=0)
+    assert not scheduler.should_retry(200, {}, attempt=0)
+    assert scheduler.stats() == {'throttled': 0, 'rate_limited': 3, 'retried': 1, 'dropped': 2}
+
+
+def test_dropped_retry_does_not_block_other_callers():
+    clock = FakeClock()
+    scheduler = RequestScheduler(rate=100, burst=100, max_retry_after=30, clock=clock)
+
+    assert not scheduler.should_retry(429, {"Retry-After": "3600"}, attempt=0)
+    assert scheduler.reserve(INTERACTIVE) == 0.0
+    assert not scheduler.should_retry(429, {"Retry-After": "2"}, attempt=3)
+    assert scheduler.reserve(INTERACTIVE) == 0.0
+    assert scheduler.stats()['dropped'] == 2
+
+    # A taken retry blocks, never for longer than max_retry_after
+    assert scheduler.should_retry(429, {"Retry-After": "30"}, attempt=0)
+    assert scheduler.reserve(INTERACTIVE) == 30.0
+
+
+def test_clients_retry_rate_limited_calls():
+    with StubSpotifyServer() as server:
+        base_url = f"{server.base_url}/v1"
+        scheduler = RequestScheduler(rate=1000, burst=1000)
+
+        client = SpotifyClient(api_base_url=base_url, scheduler=scheduler)
+        server.rate_limit_next = 2
+        assert client.get_json("/me/top/artists", params={"limit": 2})['items']
+        client.close()
+
+        async def run():
+            async_client = AsyncSpotifyClient(api_base_url=base_url, scheduler=scheduler)
+            try:
+                return await async_client.get_json("/me/top/tracks", params={"limit": 2})
+            finally:
+                await async_client.close()
+
+        server.rate_limit_next = 1
+        assert asyncio.run(run())['items']
+
+    assert scheduler.retried == 3
+    assert scheduler.dropped == 0
@@ -0,0 +1,140 @@
+# test_shared_catalog_cache.py
+import asyncio
+import sys
+import threading
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.stub_spotify import StubSpotifyServer
+from functions.spotify.cache import CatalogCache
+from functions.spotify.client import SpotifyClient
+from functions.spotify.shared_cache import FirestoreCatalogCache, TieredCatalogCache
+from main import collect_strategy_tracks
+from tests.firestore_fake import FakeFirestore
+from tests.recommenders import make_recommender
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+PATH = "/artists/abc/top-tracks"
+PARAMS = {"market": "US"}
+OLD = {'tracks': [{'id': 'old'}]}
+NEW = {'tracks': [{'id': 'new'}]}
+
+
+def make_instance(db, clock):
+    return TieredCatalogCache(CatalogCache(clock=clock), FirestoreCatalogCache(db))
+
+
+def test_cold_instance_reads_entries_written_by_another():
+    db, clock = FakeFirestore(), FakeClock()
+    warm = make_instance(db, clock)
+    warm.store(PATH, PARAMS, OLD)
+    warm.wait()
+    assert len(db.docs) == 1
+
+    cold = make_instance(db, clock)
+    assert cold.lookup(PATH, PARAMS) == (True, OLD)
+    assert cold.stats()['shared_hits'] == 1
+    # Promoted into memory: the next lookup doesn't read Firestore
+    reads = db.reads
+    assert cold.lookup(PATH, PARAMS) == (True, OLD)
+    assert db.reads == reads
+
+
+def test_stale_entry_is_served_then_refreshed_once():
+    db, clock = FakeFirestore(), FakeClock()
+    make_instance(db, clock).store(PATH, PARAMS, OLD, background=False)
+    clock.now += 7 * 60 * 60  # past the 6h top-tracks TTL
+
+    calls = []
+
+    def refresh():
+        calls.append(1)
+        return 200, NEW
+
+    cold = make_instance(db, clock)
+    assert cold.lookup(PATH, PARAMS, refresh=refresh) == (True, OLD)
+    # Served from memory (stale or already refreshed) without another refresh
+    assert cold.lookup(PATH, PARAMS, refresh=refresh)[0]
+    cold.wait()
+
+    assert len(calls) == 1
+    assert cold.stats()['stale_served'] == 1
+    assert make_instance(db, clock).lookup(PATH, PARAMS) == (True, NEW)
+
+
+def test_entries_past_max_stale_are_misses():
+    db, clock = FakeFirestore(), FakeClock()
+    make_instance(db, clock).store(PATH, PARAMS, OLD, background=False)
+    clock.now += 8 * 24 * 60 * 60
+
+    cold = make_instance(db, clock)
+    assert cold.lookup(PATH, PARAMS, refresh=lambda: (200, NEW)) == (False, None)
+
+
+def test_negative_entries_are_shared():
+    db, clock = FakeFirestore(), FakeClock()
+    make_instance(db, clock).store_response(PATH, PARAMS, 404, None, background=False)
+    assert make_instance(db, clock).lookup(PATH, PARAMS) == (True, None)
+
+
+def test_async_lookup_reads_the_shared_tier_off_the_event_loop():
+    db, clock = FakeFirestore(), FakeClock()
+    warm = make_instance(db, clock)
+    warm.store(PATH, PARAMS, OLD)
+    warm.wait()
+
+    readers = []
+
+    class RecordingShared(FirestoreCatalogCache):
+        def get(self, key):
+            readers.append(threading.current_thread())
+            return super().get(key)
+
+    cold = TieredCatalogCache(CatalogCache(clock=clock), RecordingShared(db))
+
+    async def run():
+        first = await cold.lookup_async(PATH, PARAMS)
+        second = await cold.lookup_async(PATH, PARAMS)
+        return first, second, threading.current_thread()
+
+    first, second, loop_thread = asyncio.run(run())
+    assert first == second == (True, OLD)
+    # One Firestore read, on a worker thread; the memory hit stays inline
+    assert len(readers) == 1
+    assert readers[0] is not loop_thread
+
+
+def test_second_instance_skips_upstream_catalog_calls():
+    db = FakeFirestore()
+    with StubSpotifyServer() as server:
+        base_url = f"{server.base_url}/v1"
+        headers = {"Authorization": "Bearer stub"}
+
+        first_cache = TieredCatalogCache(CatalogCache(), FirestoreCatalogCache(db))
+        first = SpotifyClient(api_base_url=base_url, cache=first_cache)
+        expected = collect_strategy_tracks(
+            make_recommender(headers, first)
+        )
+        first_cache.wait()
+        first.close()
+
+        server.reset_counters()
+        second = SpotifyClient(
+            api_base_url=base_url,
+            cache=TieredCatalogCache(CatalogCache(), FirestoreCatalogCache(db)),
+        )
+        assert collect_strategy_tracks(
+            make_recommender(headers, second)
+        ) == expected
+        second.close()
+
+    assert server.requests == 2
@@ -0,0 +1,39 @@
+# test_spotify_client.py
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.stub_spotify import StubSpotifyServer
+from functions.spotify.client import SpotifyClient, get_spotify_client
+from tests.firestore_fake import OFFLINE_ENV
+
+
+def test_pooled_client_reuses_connections():
+    with StubSpotifyServer() as server:
+        client = SpotifyClient(api_base_url=f"{server.base_url}/v1")
+        for _ in range(10):
+            data = client.get_json("/me/top/artists", params={"limit": 3})
+            assert len(data["items"]) == 3
+        client.close()
+
+        assert server.requests == 10
+        assert server.connections == 1
+
+
+def test_get_json_returns_none_on_error_status():
+    with StubSpotifyServer() as server:
+        client = SpotifyClient(api_base_url=f"{server.base_url}/v1")
+        assert client.get_json("/does-not-exist") is None
+        client.close()
+
+
+def test_url_resolution_and_shared_instance(monkeypatch):
+    client = SpotifyClient(api_base_url="https://api.example.com/v1/")
+    assert client.url("/me") == "https://api.example.com/v1/me"
+    assert client.url("me/top/tracks") == "https://api.example.com/v1/me/top/tracks"
+    assert client.url("https://other.example.com/x") == "https://other.example.com/x"
+    # The shared client's catalog cache builds a Firestore client
+    for key, value in OFFLINE_ENV.items():
+        monkeypatch.setenv(key, value)
+    assert get_spotify_client() is get_spotify_client()
@@ -0,0 +1,217 @@
+# test_token_cache.py
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from functions.auth import token_manager
+from functions.auth.token_manager import TokenCache
+from tests.firestore_fake import FakeFirestore
+
+NOW = datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def make_user(db, expiry, token="old-token"):
+    db.docs["users/u1"] = {
+        'access_token': token,
+        'refresh_token': 'refresh-1',
+        'token_expiry': expiry,
+    }
+
+
+def test_valid_token_is_read_once_then_served_from_memory():
+    db = FakeFirestore()
+    make_user(db, NOW + timedelta(minutes=30))
+    cache = TokenCache(clock=lambda: NOW, db=db)
+
+    assert [cache.get("u1") for _ in range(5)] == ["old-token"] * 5
+    assert db.reads == 1
+    assert cache.hits == 4
+
+
+def test_naive_expiry_is_treated_as_utc():
+    db = FakeFirestore()
+    make_user(db, (NOW + timedelta(minutes=30)).replace(tzinfo=None))
+    assert TokenCache(clock=lambda: NOW, db=db).get("u1") == "old-token"
+
+
+def test_concurrent_callers_share_one_refresh(monkeypatch):
+    db = FakeFirestore()
+    # Inside the five minute safety margin, so the first caller must refresh
+    make_user(db, datetime.now(timezone.utc) + timedelta(minutes=2))
+    refreshes = []
+
+    def fake_refresh(refresh_token):
+        refreshes.append(refresh_token)
+        time.sleep(0.05)  # hold the refresh open while other callers arrive
+        return {'access_token': 'new-token', 'expires_in': 3600}
+
+    monkeypatch.setattr(token_manager, "request_token_refresh", fake_refresh)
+    cache = TokenCache(db=db)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("u1"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["new-token"] * 8
+    assert refreshes == ['refresh-1']
+    assert db.writes == 1
+    assert db.docs["users/u1"]['access_token'] == "new-token"
+
+
+def test_missing_user_and_failed_refresh_are_not_cached(monkeypatch):
+    db = FakeFirestore()
+    cache = TokenCache(clock=lambda: NOW, db=db)
+    assert cache.get("nobody") is None
+
+    make_user(db, NOW - timedelta(minutes=1))
+    monkeypatch.setattr(token_manager, "request_token_refresh", lambda refresh_token: None)
+    assert cache.get("u1") is None
+    assert cache.get("u1") is None
+    assert cache.loads == 3
+
+
+def test_batch_refresh_only_touches_soon_to_expire_users(monkeypatch):
+    db = FakeFirestore()
+    now = datetime.now(timezone.utc)
+    soon = {'token_expiry': now + timedelta(minutes=5), 'last_login': now}
+    for i in range(5):
+        db.docs[f"users/soon{i}"] = {**soon, 'refresh_token': f"r{i}"}
+    db.docs["users/later"] = {**soon, 'refresh_token': 'r-later', 'token_expiry': now + timedelta(hours=1)}
+    db.docs["users/no-refresh"] = soon
+    db.docs["users/broken"] = {**soon, 'refresh_token': 'bad'}
+
+    def fake_refresh(refresh_token, priority=None):
+        if refresh_token == 'bad':
+            return None
+        return {'access_token': f"new-{refresh_token}", 'expires_in': 3600}
+
+    monkeypatch.setattr(token_manager, "request_token_refresh", fake_refresh)
+    monkeypatch.setattr(token_manager, "MAX_BATCH_WRITES", 2)
+    stats = token_manager.refresh_expiring_tokens(window_minutes=15, db_client=db)
+
+    assert stats['candidates'] == 6
+    assert stats['refreshed'] == 5
+    assert stats['failed'] == 1
+    assert stats['skipped_no_refresh_token'] == 1
+    assert stats['batches'] == 3
+    assert db.commits == 3
+    assert db.docs["users/soon3"]['access_token'] == "new-r3"
+    assert 'access_token' not in db.docs["users/later"]
+    # Refreshed tokens are already warm in this instance's cache
+    assert token_manager.get_token_cache().get("soon3") == "new-r3"
+
+
+def test_batch_refresh_covers_expired_tokens_and_keeps_rotated_ones(monkeypatch):
+    db = FakeFirestore()
+    now = datetime.now(timezone.utc)
+    db.docs["users/expired"] = {
+        'refresh_token': 'r-expired', 'token_expiry': now - timedelta(days=2), 'last_login': now,
+    }
+    db.docs["users/rotating"] = {
+        'refresh_token': 'r-rotating', 'token_expiry': now + timedelta(minutes=5), 'last_login': now,
+    }
+    db.docs["users/soon"] = {
+        'refresh_token': 'r-soon', 'token_expiry': now + timedelta(minutes=5), 'last_login': now,
+    }
+
+    def fake_refresh(refresh_token, priority=None):
+        token_data = {'access_token': f"new-{refresh_token}", 'expires_in': 3600}
+        if refresh_token == 'r-rotating':
+            token_data['refresh_token'] = 'r-rotated'
+        return token_data
+
+    # The first batch commit fails; the retry lands
+    real_batch = db.batch
+    attempts = []
+
+    def flaky_batch():
+        batch = real_batch()
+        commit = batch.commit
+
+        def flaky_commit():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise RuntimeError("unavailable")
+            commit()
+        batch.commit = flaky_commit
+        return batch
+
+    monkeypatch.setattr(db, "batch", flaky_batch)
+    monkeypatch.setattr(token_manager, "request_token_refresh", fake_refresh)
+    monkeypatch.setattr(token_manager, "WRITE_RETRY_DELAY", 0)
+    stats = token_manager.refresh_expiring_tokens(window_minutes=15, db_client=db)
+
+    assert (stats['candidates'], stats['refreshed'], stats['rotated']) == (3, 3, 1)
+    assert (stats['batches'], stats['write_failures']) == (1, 0)
+    assert len(attempts) == 2
+    assert db.docs["users/expired"]['access_token'] == "new-r-expired"
+    # The rotated refresh token is written on its own, outside the batch
+    assert db.docs["users/rotating"]['refresh_token'] == "r-rotated"
+    assert db.docs["users/soon"]['access_token'] == "new-r-soon"
+
+
+def test_app_token_is_cached_and_failures_back_off(monkeypatch):
+    requests = []
+
+    def fake_request(priority=None):
+        requests.append(priority)
+        return {'access_token': "app-1", 'expires_in': 3600} if len(requests) > 1 else None
+
+    monkeypatch.setattr(token_manager, "_app_token", None)
+    monkeypatch.setattr(token_manager, "_request_app_token_data", fake_request)
+    assert token_manager.app_headers() is None
+    # The failure is remembered instead of retried on every lookup
+    assert token_manager.get_app_token() is None
+    assert len(requests) == 1
+
+    # Once the delay has passed
+    monkeypatch.setattr(token_manager, "_app_token", None)
+    assert token_manager.app_headers() == {"Authorization": "Bearer app-1"}
+    assert token_manager.get_app_token() == "app-1"
+    assert len(requests) == 2
+
+
+def test_batch_refresh_marks_revoked_tokens_and_skips_inactive_users(monkeypatch):
+    db = FakeFirestore()
+    now = datetime.now(timezone.utc)
+    expired = now - timedelta(days=1)
+    db.docs["users/revoked"] = {'refresh_token': 'r-revoked', 'token_expiry': expired, 'last_login': now}
+    # Still listening, though the last sign-in was long ago
+    db.docs["users/listening"] = {
+        'refresh_token': 'r-listening', 'token_expiry': expired,
+        'last_login': now - timedelta(days=400), 'listening_cursor': int(now.timestamp() * 1000),
+    }
+    db.docs["users/lapsed"] = {
+        'refresh_token': 'r-lapsed', 'token_expiry': expired, 'last_login': now - timedelta(days=90),
+    }
+    db.docs["users/abandoned"] = {
+        'refresh_token': 'r-abandoned', 'token_expiry': now - timedelta(days=200), 'last_login': now,
+    }
+    requested = []
+
+    def fake_refresh(refresh_token, priority=None):
+        requested.append(refresh_token)
+        if refresh_token == 'r-revoked':
+            raise token_manager.RefreshTokenRevoked('{"error": "invalid_grant"}')
+        return {'access_token': f"new-{refresh_token}", 'expires_in': 3600}
+
+    monkeypatch.setattr(token_manager, "request_token_refresh", fake_refresh)
+    stats = token_manager.refresh_expiring_tokens(window_minutes=15, db_client=db)
+
+    assert sorted(requested) == ['r-listening', 'r-revoked']
+    assert (stats['refreshed'], stats['revoked'], stats['skipped_inactive']) == (1, 1, 1)
+    assert db.docs["users/revoked"]['refresh_error'] == 'invalid_grant'
+    assert db.docs["users/listening"]['access_token'] == "new-r-listening"
+
+    # The revoked token is not tried again
+    requested.clear()
+    stats = token_manager.refresh_expiring_tokens(window_minutes=15, db_client=db)
+    assert requested == []
+    assert stats['skipped_revoked'] == 1
@@ -0,0 +1,46 @@
+# test_track_record.py
+import json
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.stub_spotify import fake_track
+from functions.recommendations.track_record import TrackRecord
+from main import filter_unique_tracks, process_track_results
+
+
+def test_parses_spotify_track_once_into_response_shape():
+    track = fake_track("t1", artist_id="a1")
+    record = TrackRecord.from_spotify(track)
+
+    assert record.artist_ids == ("a1",)
+    assert record.primary_artist == "Artist a1"
+    assert record.to_dict() == {
+        'id': "t1",
+        'name': "Track t1",
+        'artists': ["Artist a1"],
+        'album': track['album']['name'],
+        'image_url': "https://i.scdn.co/image/t1",
+        'preview_url': track['preview_url'],
+        'external_url': "https://open.spotify.com/track/t1",
+        'popularity': track['popularity'],
+        'release_date': track['album']['release_date'],
+    }
+    json.dumps(record.to_dict())
+
+
+def test_missing_optional_fields_do_not_break_parsing():
+    record = TrackRecord.from_spotify({'id': "t2", 'name': "Bare", 'album': {'images': []}})
+    assert (record.image_url, record.preview_url, record.external_url) == (None, None, None)
+    assert record.popularity == 0 and record.release_date == ''
+
+
+def test_records_are_slotted_and_keyed_by_id():
+    first, again = process_track_results([fake_track("t1"), fake_track("t1")])
+    assert not hasattr(first, '__dict__')
+    assert first == again and len({first, again}) == 1
+
+    seen = set()
+    assert filter_unique_tracks([first, again], seen) == [first]
+    assert seen == {"t1"}